@@ -0,0 +1,229 @@
+""" Benchmarks the Epub hot paths and search page parsing
+
+Synthetic books of each layout (chapters, parts, acts) are generated into
+a temporary directory, then every path a handler takes is timed: opening a
+book with and without its index, begin, read, next and previous across a
+chapter boundary, read_by_chapter_title, and the search page and catalog
+lookups behind utils.query.
+
+Results can be written as json and compared with an earlier run, failing
+when any benchmark got slower than the threshold allows:
+
+    python benchmarks/bench_epub.py --json baseline.json
+    python benchmarks/bench_epub.py --baseline baseline.json --threshold 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+import catalog
+import utils
+from epub_parser import Epub
+from synthetic_epub import make_epub, search_page
+
+# name -> keyword arguments of make_epub
+LAYOUTS = {
+    'chapters': { 'chapters': 40 },
+    'parts': { 'chapters': 15, 'parts': 3 },
+    'acts': { 'chapters': 0, 'acts': 5 }
+}
+
+
+def measure(run, setup=None, repeat=10):
+    """ Times a function, leaving setup out of the timing
+
+    :param run: function called with the setup's result
+    :param setup: function called before each run, None for no setup
+    :param repeat: number of timed runs
+    :return: dictionary of min and median milliseconds
+    """
+
+    times = []
+
+    for _ in range(repeat):
+        state = setup() if setup is not None else None
+
+        start = time.perf_counter()
+        run(state)
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'min_ms': min(times),
+        'median_ms': statistics.median(times),
+        'runs': repeat
+    }
+
+def open_epub(path):
+    return Epub(zipfile.ZipFile(path))
+
+def remove_index(path):
+    index_path = path + '.index.json'
+
+    if os.path.exists(index_path):
+        os.remove(index_path)
+
+def bench_layout(path, repeat):
+    """ Times the Epub hot paths on one book
+
+    :param path: string path of the epub
+    :param repeat: number of timed runs
+    :return: dictionary of benchmark name to timings
+    """
+
+    results = {}
+
+    def cold_setup():
+        remove_index(path)
+
+    results['init_no_index'] = measure(lambda _: open_epub(path).close(), cold_setup, repeat)
+
+    # every other benchmark opens a book whose index is already built
+    open_epub(path).close()
+
+    results['init'] = measure(lambda _: open_epub(path).close(), None, repeat)
+
+    fresh = lambda: open_epub(path)
+
+    toc = fresh().get_toc()
+    middle = toc[len(toc) // 2]
+    following = toc[len(toc) // 2 + 1]
+
+    last_section = fresh().section_count(middle['file']) - 1
+
+    results['begin'] = measure(lambda epub: epub.begin(), fresh, repeat)
+    results['read_section'] = measure(lambda epub: epub.read_section(middle['file']), fresh, repeat)
+
+    def cached():
+        epub = fresh()
+        epub.read_section(middle['file'])
+        return epub
+
+    results['read_section_cached'] = measure(lambda epub: epub.read_section(middle['file'], 1), cached, repeat)
+    results['next_chapter'] = measure(lambda epub: epub.next(middle['file'], last_section), fresh, repeat)
+    results['previous_chapter'] = measure(lambda epub: epub.previous(following['file'], 0), fresh, repeat)
+    results['read_by_chapter_title'] = measure(lambda epub: epub.read_by_chapter_title(middle['title']), fresh, repeat)
+
+    return results
+
+def bench_search(repeat):
+    """ Times search page parsing and catalog lookups
+
+    :param repeat: number of timed runs
+    :return: dictionary of benchmark name to timings
+    """
+
+    page = search_page(results=48)
+    books = utils.parse_search_page(page)
+
+    local_catalog = catalog.Catalog(books * 20)
+    query = books[0]['title']
+
+    return {
+        'parse_search_page': measure(lambda _: utils.parse_search_page(page), None, repeat),
+        'catalog_index': measure(lambda _: catalog.Catalog(books * 20), None, repeat),
+        'catalog_search': measure(lambda _: local_catalog.search(query), None, repeat)
+    }
+
+def run(chapter_kb, repeat):
+    """ Runs every benchmark
+
+    :param chapter_kb: integer of kilobytes per chapter
+    :param repeat: number of timed runs
+    :return: dictionary of benchmark name to timings
+    """
+
+    results = {}
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        for layout, options in LAYOUTS.items():
+            path = os.path.join(directory, layout + '.epub')
+
+            make_epub(path, chapter_kb=chapter_kb, **options)
+
+            for name, timings in bench_layout(path, repeat).items():
+                results['{}.{}'.format(layout, name)] = timings
+
+    for name, timings in bench_search(repeat).items():
+        results['search.' + name] = timings
+
+    return results
+
+def regressions(results, baseline, threshold, min_delta_ms=0.05):
+    """ Benchmarks slower than the baseline by more than the threshold
+
+    Fastest runs are compared, they are the least noisy. Differences under
+    min_delta_ms are timer noise on the quickest benchmarks and are ignored.
+
+    :param results: dictionary of benchmark name to timings
+    :param baseline: dictionary of benchmark name to timings
+    :param threshold: fraction of slowdown allowed
+    :param min_delta_ms: milliseconds of slowdown always allowed
+    :return: list of tuples of name, baseline ms and current ms
+    """
+
+    slower = []
+
+    for name, timings in results.items():
+
+        if name not in baseline:
+            continue
+
+        before = baseline[name]['min_ms']
+        after = timings['min_ms']
+
+        if after > before * (1 + threshold) and after - before > min_delta_ms:
+            slower.append((name, before, after))
+
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chapter-kb', type=int, default=30, help='kilobytes per chapter')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--json', help='file to write the results to')
+    parser.add_argument('--baseline', help='results of an earlier run to compare with')
+    parser.add_argument('--threshold', type=float, default=0.25, help='slowdown allowed against the baseline, 0.25 is 25%%')
+    parser.add_argument('--min-delta-ms', type=float, default=0.05, help='slowdown in milliseconds always allowed')
+    args = parser.parse_args()
+
+    results = run(args.chapter_kb, args.repeat)
+
+    print('{:<40} {:>10} {:>10}'.format('benchmark', 'min ms', 'median ms'))
+
+    for name, timings in results.items():
+        print('{:<40} {:>10.3f} {:>10.3f}'.format(name, timings['min_ms'], timings['median_ms']))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'chapter_kb': args.chapter_kb,
+                'repeat': args.repeat,
+                'results': results
+            }, json_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+
+        slower = regressions(results, baseline, args.threshold, args.min_delta_ms)
+
+        for name, before, after in slower:
+            print('regression: {} {:.3f}ms -> {:.3f}ms'.format(name, before, after), file=sys.stderr)
+
+        if slower:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+""" Benchmarks parallel chapter parsing against the serial path by book size
+
+Synthetic books without a nav document, so the toc is built from the
+chapter files, are indexed and read through with one worker, with a thread
+pool and with a process pool. Every run has to give the same toc and the
+same sections as the serial one:
+
+    python benchmarks/bench_parse.py
+    python benchmarks/bench_parse.py --workers 2 4 --sizes 20x30 80x60 --json parse.json
+
+Speedups need more than one cpu, lambda gives a second vcpu from 1769MB.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+from bench_epub import measure, remove_index
+from epub_parser import Epub
+from synthetic_epub import make_epub
+
+# chapters x kilobytes per chapter
+SIZES = ['10x20', '40x30', '120x60']
+
+
+def parse_size(size):
+    """ Chapters and kilobytes per chapter of a size argument
+
+    :param size: string such as 40x30
+    :return: tuple of integers
+    """
+
+    chapters, chapter_kb = size.split('x')
+
+    return int(chapters), int(chapter_kb)
+
+def build_toc(path, workers):
+    """ Opens a book without its index, building the toc
+
+    :param path: string path of the epub
+    :param workers: integer of chapters parsed at once
+    :return: list of toc entries
+    """
+
+    epub = Epub(zipfile.ZipFile(path), workers=workers)
+    toc = epub.get_toc()
+    epub.close()
+
+    return toc
+
+def read_sections(path, workers, processes):
+    """ Extracts every section of a book without its index
+
+    :param path: string path of the epub
+    :param workers: integer of chapters parsed at once
+    :param processes: boolean true for a process pool
+    :return: list of sections
+    """
+
+    epub = Epub(zipfile.ZipFile(path), workers=workers)
+    sections = epub.read_sections(processes=processes)
+    epub.close()
+
+    return sections
+
+def bench_size(path, workers, repeat):
+    """ Times the toc build and section extraction of one book
+
+    :param path: string path of the epub
+    :param workers: list of integers of workers to compare with one
+    :param repeat: number of timed runs
+    :return: dictionary of benchmark name to timings
+    """
+
+    expected_toc = build_toc(path, 1)
+    remove_index(path)
+    expected_sections = read_sections(path, 1, False)
+
+    runs = [ ('serial', 1, False) ]
+    runs += [ ('threads{}'.format(count), count, False) for count in workers ]
+    runs += [ ('processes{}'.format(count), count, True) for count in workers ]
+
+    results = {}
+
+    for name, count, processes in runs:
+
+        if build_toc(path, count) != expected_toc:
+            sys.exit('{}: toc differs from the serial one'.format(name))
+
+        remove_index(path)
+
+        if read_sections(path, count, processes) != expected_sections:
+            sys.exit('{}: sections differ from the serial ones'.format(name))
+
+        if not processes:
+            results['toc_build.' + name] = measure(lambda _: build_toc(path, count), lambda: remove_index(path), repeat)
+
+        results['read_sections.' + name] = measure(
+            lambda _: read_sections(path, count, processes),
+            lambda: remove_index(path),
+            repeat
+        )
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', nargs='+', default=SIZES, help='chapters x kilobytes per chapter')
+    parser.add_argument('--workers', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--json', help='file to write the results to')
+    args = parser.parse_args()
+
+    results = {}
+
+    print('cpus: {}'.format(os.cpu_count()))
+    print('{:<36} {:>10} {:>10} {:>9}'.format('benchmark', 'min ms', 'median ms', 'speedup'))
+
+    with tempfile.TemporaryDirectory() as directory:
+
+        for size in args.sizes:
+            chapters, chapter_kb = parse_size(size)
+            path = os.path.join(directory, size + '.epub')
+
+            make_epub(path, chapters=chapters, chapter_kb=chapter_kb, nav=False)
+
+            size_results = bench_size(path, args.workers, args.repeat)
+
+            for name, timings in size_results.items():
+                serial = size_results[name.split('.')[0] + '.serial']['min_ms']
+                timings['speedup'] = serial / timings['min_ms']
+
+                results['{}.{}'.format(size, name)] = timings
+
+                print('{:<36} {:>10.3f} {:>10.3f} {:>8.2f}x'.format(
+                    '{}.{}'.format(size, name),
+                    timings['min_ms'],
+                    timings['median_ms'],
+                    timings['speedup']
+                ))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'repeat': args.repeat,
+                'results': results
+            }, json_file, indent=2)
+
+if __name__ == '__main__':
+    main()
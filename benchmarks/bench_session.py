@@ -0,0 +1,89 @@
+""" Measures the session attributes sent with each request and response
+
+Compares the attributes handlers used to keep, the whole search results
+and chapter file paths, with their compact encoding for each point of a
+session:
+
+    python benchmarks/bench_session.py --results 12
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+import session
+from synthetic_epub import search_page
+from utils import parse_search_page
+
+
+def size(attributes):
+    """ Bytes of the attributes as sent in an envelope
+
+    :param attributes: dictionary
+    :return: integer of bytes
+    """
+
+    return len(json.dumps(attributes).encode('utf-8'))
+
+def sessions(results):
+    """ Attributes before the encoding and their decoded form, per state
+
+    :param results: list of search results
+    :return: list of tuples of name, old attributes and decoded attributes
+    """
+
+    book = results[0]
+    key = '0' * 40
+
+    return [
+        (
+            'search results',
+            { 'state': 'SEARCH_RESULTS', 'search_results': results },
+            { 'state': 'SEARCH_RESULTS', 'query': 'the war of the worlds' }
+        ),
+        (
+            'book chosen',
+            { 'state': 'SEARCH_RESULTS', 'search_results': results, 'book': book },
+            { 'state': 'SEARCH_RESULTS', 'query': 'the war of the worlds', 'book': book }
+        ),
+        (
+            'reading',
+            {
+                'state': 'STARTED',
+                'search_results': results,
+                'book': book,
+                'book_key': key,
+                'bookmark': { 'file': 'epub/text/chapter-2-14.xhtml', 'section': 3 }
+            },
+            {
+                'state': 'STARTED',
+                'query': 'the war of the worlds',
+                'book': book,
+                'book_key': key,
+                'bookmark': { 'index': 31, 'section': 3 }
+            }
+        )
+    ]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--results', type=int, default=12, help='search results of the session')
+    args = parser.parse_args()
+
+    results = parse_search_page(search_page(results=args.results))
+
+    print('{:<16} {:>10} {:>10} {:>10}'.format('session', 'old bytes', 'new bytes', 'saved'))
+
+    for name, old, decoded in sessions(results):
+        compact = session.encode(decoded)
+
+        if session.encode(session.decode(compact)) != compact:
+            sys.exit('{} does not round trip'.format(name))
+
+        print('{:<16} {:>10} {:>10} {:>9.0%}'.format(name, size(old), size(compact), 1 - size(compact) / size(old)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,145 @@
+""" Benchmarks chapter text extraction on large chapters
+
+Compares the streaming extractor in epub_parser with the previous
+implementation (tostring + regex + string concatenation), which is kept
+here as the reference.
+
+    python benchmarks/bench_text_extraction.py --sizes 500 1000 2000
+"""
+
+import argparse
+import io
+import os
+import random
+import re
+import sys
+import time
+import tracemalloc
+
+from lxml import etree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda'))
+
+from epub_parser import iter_chapter_text
+
+
+WORDS = 'the of and to a in that he was it his with as had for not but at by on she her which from him said'.split()
+
+def legacy_chapter_text(xml):
+    """ Previous implementation of the chapter text extraction
+
+    :param xml: bytes of an xhtml document
+    :return: string containing xml text
+    """
+
+    ns = {
+        'n': 'http://www.w3.org/1999/xhtml'
+    }
+
+    tree = etree.fromstring(xml, parser=etree.XMLParser())
+    body_element = tree.xpath('n:body', namespaces=ns)[0]
+
+    encoding = 'utf-8'
+    text = etree.tostring(body_element, encoding=encoding).decode(encoding, 'ignore')
+
+    buf = io.StringIO(text)
+    res = ''
+
+    for line in buf:
+        stripped_line = re.sub('<[^<]+?>', '', line).strip()
+        if stripped_line:
+            res += ' <break time="0.5s"/> ' + stripped_line
+
+    return res
+
+def streaming_chapter_text(xml):
+    """ Streaming implementation, joined once
+
+    :param xml: bytes of an xhtml document
+    :return: string containing xml text
+    """
+
+    return ''.join(iter_chapter_text(xml))
+
+def make_chapter(size_kb, seed=0):
+    """ Builds a standard ebooks style chapter of roughly the given size
+
+    :param size_kb: integer of target size in kilobytes
+    :param seed: random seed
+    :return: bytes of an xhtml document
+    """
+
+    rng = random.Random(seed)
+    paragraphs = []
+    size = 0
+
+    while size < size_kb * 1024:
+        sentences = []
+
+        for _ in range(rng.randint(2, 8)):
+            words = [ rng.choice(WORDS) for _ in range(rng.randint(5, 25)) ]
+            sentences.append(' '.join(words).capitalize() + '.')
+
+        paragraph = '\t\t\t<p>{} <i>{}</i> &amp; {}</p>'.format(' '.join(sentences), rng.choice(WORDS), rng.choice(WORDS))
+        paragraphs.append(paragraph)
+        size += len(paragraph) + 1
+
+    return (
+        '<?xml version="1.0" encoding="utf-8"?>\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+        '\t<head>\n\t\t<title>Chapter</title>\n\t</head>\n'
+        '\t<body>\n\t\t<section>\n{}\n\t\t</section>\n\t</body>\n</html>\n'
+    ).format('\n'.join(paragraphs)).encode('utf-8')
+
+def measure(function, xml, repeat):
+    """ Times a function and records its peak python allocation
+
+    :param function: extraction function
+    :param xml: bytes of an xhtml document
+    :param repeat: number of timed runs
+    :return: tuple of best seconds, peak bytes and result
+    """
+
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(xml)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    tracemalloc.start()
+    function(xml)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best, peak, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[500, 1000, 2000], help='chapter sizes in KB')
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>12} {:>8} {:>14} {:>14}'.format('size KB', 'legacy ms', 'stream ms', 'speedup', 'legacy peak', 'stream peak'))
+
+    for size_kb in args.sizes:
+        xml = make_chapter(size_kb)
+
+        legacy_time, legacy_peak, legacy_result = measure(legacy_chapter_text, xml, args.repeat)
+        stream_time, stream_peak, stream_result = measure(streaming_chapter_text, xml, args.repeat)
+
+        if legacy_result != stream_result:
+            sys.exit('extractors disagree on a {}KB chapter'.format(size_kb))
+
+        print('{:>8} {:>12.1f} {:>12.1f} {:>7.1f}x {:>14,} {:>14,}'.format(
+            len(xml) // 1024,
+            legacy_time * 1000,
+            stream_time * 1000,
+            legacy_time / stream_time,
+            legacy_peak,
+            stream_peak
+        ))
+
+if __name__ == '__main__':
+    main()
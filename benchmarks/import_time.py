@@ -0,0 +1,98 @@
+""" Reports what the skill spends importing on a cold start
+
+Runs a fresh interpreter with -X importtime for the lambda module and lists
+the slowest imports. The run fails when the import takes longer than the
+cold start budget, or when it loads a module that should only be imported
+on the handler paths that use it:
+
+    python benchmarks/import_time.py
+    python benchmarks/import_time.py --module utils --top 30
+
+The budget is for the whole lambda_function import, ask_sdk included, at
+the fastest of a few runs. Dependencies installed into the deployment are
+needed for the lambda_function report.
+"""
+
+import argparse
+import os
+import re
+import subprocess
+import sys
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lambda')
+
+COLD_START_BUDGET_MS = 300
+
+# loaded lazily by the handlers that need them
+LAZY_MODULES = ['boto3', 'botocore', 'lxml', 'asyncio', 'epub_parser', 'book_pipeline']
+
+_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def import_times(module):
+    """ Imports a module in a new interpreter
+
+    :param module: string module name
+    :return: list of tuples of self us, cumulative us, depth and name
+    """
+
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import ' + module],
+        cwd=LAMBDA_DIR,
+        stderr=subprocess.PIPE,
+        universal_newlines=True
+    )
+
+    if result.returncode != 0:
+        sys.exit('importing {} failed:\n{}'.format(module, result.stderr))
+
+    times = []
+
+    for line in result.stderr.splitlines():
+        match = _LINE.match(line)
+
+        if match:
+            times.append((int(match.group(1)), int(match.group(2)), len(match.group(3)) // 2, match.group(4)))
+
+    return times
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--module', default='lambda_function')
+    parser.add_argument('--top', type=int, default=20, help='slowest imports listed')
+    parser.add_argument('--repeat', type=int, default=3, help='runs, the fastest is reported')
+    parser.add_argument('--budget-ms', type=float, default=COLD_START_BUDGET_MS)
+    args = parser.parse_args()
+
+    runs = [ import_times(args.module) for _ in range(args.repeat) ]
+
+    def total(times):
+        return next(cumulative for _, cumulative, depth, name in times if name == args.module and depth == 0)
+
+    times = min(runs, key=total)
+    total_ms = total(times) / 1000
+
+    print('{:>10} {:>10}  {}'.format('self ms', 'total ms', 'module'))
+
+    for self_us, cumulative_us, depth, name in sorted(times, key=lambda time: -time[1])[:args.top]:
+        print('{:>10.1f} {:>10.1f}  {}{}'.format(self_us / 1000, cumulative_us / 1000, '  ' * depth, name))
+
+    print('import {}: {:.1f}ms, budget {:.0f}ms'.format(args.module, total_ms, args.budget_ms))
+
+    loaded = { name.split('.')[0] for _, _, _, name in times }
+    eager = [ name for name in LAZY_MODULES if name in loaded and name != args.module ]
+
+    failed = False
+
+    if eager:
+        print('imported eagerly: {}'.format(', '.join(eager)), file=sys.stderr)
+        failed = True
+
+    if total_ms > args.budget_ms:
+        print('over the cold start budget by {:.1f}ms'.format(total_ms - args.budget_ms), file=sys.stderr)
+        failed = True
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+""" Synthetic books and pages laid out like standardebooks.org's
+
+Books follow the Standard Ebooks epub layout: a container, an opf with a
+spine, a nav document and xhtml files named preface, chapter-<n> or
+chapter-<part>-<n>, act-<n> and epilogue under epub/text.
+
+    python benchmarks/synthetic_epub.py book.epub --chapters 40 --chapter-kb 60 --parts 3
+"""
+
+import argparse
+import random
+import zipfile
+from xml.sax.saxutils import escape
+
+WORDS = 'the of and to a in that he was it his with as had for not but at by on she her which from him said'.split()
+
+_CONTAINER = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+    '<rootfiles><rootfile full-path="epub/content.opf" media-type="application/oebps-package+xml"/></rootfiles>'
+    '</container>\n'
+)
+
+_CHAPTER = (
+    '<?xml version="1.0" encoding="utf-8"?>\n'
+    '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">\n'
+    '\t<head>\n\t\t<title>{title}</title>\n\t</head>\n'
+    '\t<body epub:type="bodymatter z3998:fiction">\n'
+    '\t\t<section id="{id}" epub:type="chapter">\n'
+    '\t\t\t<h2 epub:type="title">{title}</h2>\n'
+    '{paragraphs}\n'
+    '\t\t</section>\n'
+    '\t</body>\n'
+    '</html>\n'
+)
+
+
+def paragraph(rng):
+    """ One paragraph of a few sentences of common words
+
+    :param rng: random.Random
+    :return: string of xhtml
+    """
+
+    sentences = []
+
+    for _ in range(rng.randint(2, 8)):
+        words = [ rng.choice(WORDS) for _ in range(rng.randint(5, 25)) ]
+        sentences.append(' '.join(words).capitalize() + '.')
+
+    return '\t\t\t<p>{} <i>{}</i> &amp; {}.</p>'.format(' '.join(sentences), rng.choice(WORDS), rng.choice(WORDS))
+
+def chapter_xhtml(title, size_kb, rng):
+    """ A chapter of roughly the given size
+
+    :param title: string chapter title
+    :param size_kb: integer of target size in kilobytes
+    :param rng: random.Random
+    :return: string of xhtml
+    """
+
+    paragraphs = []
+    size = 0
+
+    while size < size_kb * 1024:
+        paragraphs.append(paragraph(rng))
+        size += len(paragraphs[-1]) + 1
+
+    return _CHAPTER.format(title=escape(title), id=title.lower().replace(' ', '-'), paragraphs='\n'.join(paragraphs))
+
+def book_files(chapters, parts=0, acts=0):
+    """ Text files of a book in reading order
+
+    :param chapters: integer of chapters, per part in books with parts
+    :param parts: integer of parts, 0 for a book of chapters
+    :param acts: integer of acts, a play when not 0
+    :return: list of tuples of file name and title
+    """
+
+    files = [ ('preface.xhtml', 'Preface') ]
+
+    if acts:
+        files += [ ('act-{}.xhtml'.format(act), 'Act {}'.format(act)) for act in range(1, acts + 1) ]
+    elif parts:
+        for part in range(1, parts + 1):
+            files += [ ('chapter-{}-{}.xhtml'.format(part, chapter), 'Chapter {}'.format(chapter)) for chapter in range(1, chapters + 1) ]
+    else:
+        files += [ ('chapter-{}.xhtml'.format(chapter), 'Chapter {}'.format(chapter)) for chapter in range(1, chapters + 1) ]
+
+    files.append(('epilogue.xhtml', 'Epilogue'))
+
+    return files
+
+def make_epub(path, chapters=20, chapter_kb=30, parts=0, acts=0, nav=True, seed=0):
+    """ Writes a synthetic epub
+
+    :param path: string path or file object
+    :param chapters: integer of chapters, per part in books with parts
+    :param chapter_kb: integer of kilobytes per chapter
+    :param parts: integer of parts, 0 for a book of chapters
+    :param acts: integer of acts, a play when not 0
+    :param nav: boolean false to leave out the opf and nav document
+    :param seed: random seed
+    :return: list of tuples of file name and title
+    """
+
+    rng = random.Random(seed)
+    files = book_files(chapters, parts=parts, acts=acts)
+
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as epub_zip:
+        epub_zip.writestr('mimetype', 'application/epub+zip', compress_type=zipfile.ZIP_STORED)
+
+        if nav:
+            manifest = ''.join('<item href="text/{0}" id="{0}" media-type="application/xhtml+xml"/>'.format(file) for file, _ in files)
+            spine = ''.join('<itemref idref="{}"/>'.format(file) for file, _ in files)
+            items = ''.join('<li><a href="text/{}">{}</a></li>'.format(file, escape(title)) for file, title in files)
+
+            epub_zip.writestr('META-INF/container.xml', _CONTAINER)
+            epub_zip.writestr('epub/content.opf', (
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<package xmlns="http://www.idpf.org/2007/opf" version="3.0">'
+                '<metadata xmlns:dc="http://purl.org/dc/elements/1.1/"><dc:title>Synthetic</dc:title></metadata>'
+                '<manifest>{}<item href="toc.xhtml" id="toc.xhtml" media-type="application/xhtml+xml" properties="nav"/></manifest>'
+                '<spine>{}</spine>'
+                '</package>\n'
+            ).format(manifest, spine))
+            epub_zip.writestr('epub/toc.xhtml', (
+                '<?xml version="1.0" encoding="utf-8"?>\n'
+                '<html xmlns="http://www.w3.org/1999/xhtml" xmlns:epub="http://www.idpf.org/2007/ops">'
+                '<head><title>Table of Contents</title></head>'
+                '<body><nav epub:type="toc"><h2>Contents</h2><ol>{}</ol></nav></body>'
+                '</html>\n'
+            ).format(items))
+
+        for file, title in files:
+            epub_zip.writestr('epub/text/' + file, chapter_xhtml(title, chapter_kb, rng))
+
+    return files
+
+def search_page(results=12, seed=0):
+    """ A standardebooks.org search results page
+
+    :param results: integer of books listed
+    :param seed: random seed
+    :return: string of html
+    """
+
+    rng = random.Random(seed)
+    items = []
+
+    for _ in range(results):
+        author = '{} {}'.format(rng.choice(WORDS), rng.choice(WORDS)).title()
+        title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5))).title()
+
+        author_link = '/ebooks/' + author.lower().replace(' ', '-')
+        title_link = author_link + '/' + title.lower().replace(' ', '-')
+
+        items.append(
+            '<li typeof="schema:Book"><div class="thumbnail-container"><a href="{0}" tabindex="-1"><img src="{0}/cover.jpg" alt=""/></a></div>'
+            '<p><a href="{0}" property="schema:url">{1}</a></p>'
+            '<p class="author"><a href="{2}">{3}</a></p></li>'.format(title_link, escape(title), author_link, escape(author))
+        )
+
+    return (
+        '<!DOCTYPE html>\n<html lang="en-US"><head><title>Ebooks - Standard Ebooks</title></head>'
+        '<body><header><nav><ul><li><a href="/ebooks">Ebooks</a></li></ul></nav></header>'
+        '<main class="ebooks"><h1>Browse Standard Ebooks</h1><ol class="ebooks-list">{}</ol></main>'
+        '<footer></footer></body></html>\n'
+    ).format(''.join(items))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', help='epub file to write')
+    parser.add_argument('--chapters', type=int, default=20, help='chapters, per part in books with parts')
+    parser.add_argument('--chapter-kb', type=int, default=30, help='kilobytes per chapter')
+    parser.add_argument('--parts', type=int, default=0)
+    parser.add_argument('--acts', type=int, default=0)
+    parser.add_argument('--no-nav', action='store_true', help='leave out the opf and nav document')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    files = make_epub(args.path, args.chapters, args.chapter_kb, args.parts, args.acts, not args.no_nav, args.seed)
+
+    print('wrote {} with {} text files'.format(args.path, len(files)))
+
+if __name__ == '__main__':
+    main()
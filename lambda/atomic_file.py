@@ -0,0 +1,49 @@
+""" Files replaced atomically, readers see the old file or the new one
+
+    with atomic_file.write(path, 'wb') as book_file:
+        book_file.write(data)
+
+The file is written under a temporary name unique to the process and
+thread, so concurrent writers never share one, then renamed over path. A
+write that fails removes its temporary file and leaves path as it was.
+"""
+
+import contextlib
+import json
+import os
+import threading
+
+
+@contextlib.contextmanager
+def write(path, mode='w'):
+    """ Opens a temporary file that replaces path once it is closed
+
+    :param path: string path, its directory has to exist
+    :param mode: string file mode, 'w' or 'wb'
+    :return: context manager of the open file
+    """
+
+    tmp_path = '{}.{}.{}.tmp'.format(path, os.getpid(), threading.get_ident())
+
+    try:
+        with open(tmp_path, mode) as tmp_file:
+            yield tmp_file
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+        raise
+
+def write_json(path, value):
+    """ Replaces path with a value as json
+
+    :param path: string path, its directory has to exist
+    :param value: json serializable value
+    """
+
+    with write(path) as json_file:
+        json.dump(value, json_file)
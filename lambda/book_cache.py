@@ -0,0 +1,194 @@
+import hashlib
+import logging
+import os
+import time
+import zipfile
+import zlib
+
+# books downloaded by this container, one zip per book plus its index
+BOOK_CACHE_DIR = os.environ.get('BOOK_CACHE_DIR', '/tmp/books')
+
+# lambda gives 512MB of /tmp, leave room for everything else
+BOOK_CACHE_MAX_BYTES = int(os.environ.get('BOOK_CACHE_MAX_BYTES', 384 * 1024 * 1024))
+
+# seconds a partial download may go unwritten before it counts as abandoned
+BOOK_PART_MAX_IDLE = float(os.environ.get('BOOK_PART_MAX_IDLE', 60))
+
+BOOK_SUFFIX = '.epub'
+BOOK_FILE_SUFFIX = '.prb'
+
+
+def book_key(titleLink):
+    """ Cache key of a standardebooks.org book
+
+    :param titleLink: string such as /ebooks/jane-austen/pride-and-prejudice
+    :return: string key, safe to use as a file name
+    """
+
+    link = titleLink.strip().rstrip('/')
+
+    return hashlib.sha1(link.encode('utf-8')).hexdigest()
+
+def book_path(key):
+    """ Path of the cached zip for a key
+
+    :param key: string from book_key
+    :return: string path
+    """
+
+    return os.path.join(BOOK_CACHE_DIR, key + BOOK_SUFFIX)
+
+def book_file_path(key):
+    """ Path of the binary book file converted from a cached zip
+
+    :param key: string from book_key
+    :return: string path
+    """
+
+    return os.path.join(BOOK_CACHE_DIR, key + BOOK_FILE_SUFFIX)
+
+def is_cached(key):
+    """ Determines whether a book is already in /tmp
+
+    :param key: string from book_key
+    :return: boolean true when the zip exists
+    """
+
+    return os.path.exists(book_path(key))
+
+def touch(key):
+    """ Marks a book as recently used
+
+    Only the access time is changed, the modification time identifies the
+    zip for the book index and the open epub cache.
+
+    :param key: string from book_key
+    """
+
+    path = book_path(key)
+
+    try:
+        stat = os.stat(path)
+        os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+    except OSError:
+        pass
+
+
+class InvalidBookError(Exception):
+    """ Raised when a downloaded file isn't a readable epub zip """
+
+
+def verify(path):
+    """ Checks a download is a zip whose files all read back intact
+
+    A truncated download loses the central directory at the end of the
+    file, and bytes resumed onto another version of the book fail their
+    crc, so this catches both before any handler tries to open the book.
+
+    :param path: string path of the downloaded zip
+    """
+
+    try:
+        with zipfile.ZipFile(path) as epub_zip:
+            if len(epub_zip.infolist()) == 0:
+                raise InvalidBookError('{} has no files'.format(path))
+
+            bad_file = epub_zip.testzip()
+
+            if bad_file is not None:
+                raise InvalidBookError('{} has a corrupt {}'.format(path, bad_file))
+    except (zipfile.BadZipFile, OSError, EOFError, zlib.error) as e:
+        raise InvalidBookError('{} is not a readable zip: {}'.format(path, e)) from e
+
+def publish(key, tmp_path):
+    """ Verifies a finished download, moves it into the cache and trims it
+
+    The rename is atomic, readers see either no book or the whole book. An
+    invalid download is removed so the next try starts over.
+
+    :param key: string from book_key
+    :param tmp_path: string path of the downloaded zip, on the same disk
+    :return: string path of the cached zip
+    """
+
+    path = book_path(key)
+
+    try:
+        verify(tmp_path)
+    except InvalidBookError:
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, path)
+    touch(key)
+
+    evict(keep=key)
+
+    return path
+
+def download_path(key):
+    """ Temporary path a book is downloaded to before publishing
+
+    :param key: string from book_key
+    :return: string path
+    """
+
+    os.makedirs(BOOK_CACHE_DIR, exist_ok=True)
+
+    return book_path(key) + '.part'
+
+def evict(keep=None):
+    """ Removes least recently used books until the cache fits its budget
+
+    Books still being downloaded, whose partial file was written in the
+    last BOOK_PART_MAX_IDLE seconds, are never removed.
+
+    :param keep: key that is never removed, usually the book just opened
+    """
+
+    if not os.path.isdir(BOOK_CACHE_DIR):
+        return
+
+    books = {}
+    downloading = set()
+    now = time.time()
+
+    # group each zip with its sidecar files
+    for name in os.listdir(BOOK_CACHE_DIR):
+        path = os.path.join(BOOK_CACHE_DIR, name)
+        key = name.split('.')[0]
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+
+        book = books.setdefault(key, {'paths': [], 'bytes': 0, 'used': 0})
+        book['paths'].append(path)
+        book['bytes'] += stat.st_size
+
+        if name == key + BOOK_SUFFIX:
+            book['used'] = stat.st_atime_ns
+
+        if name.endswith('.part') and now - stat.st_mtime < BOOK_PART_MAX_IDLE:
+            downloading.add(key)
+
+    total = sum(book['bytes'] for book in books.values())
+
+    for key, book in sorted(books.items(), key=lambda item: item[1]['used']):
+
+        if total <= BOOK_CACHE_MAX_BYTES:
+            return
+
+        if key == keep or key in downloading:
+            continue
+
+        for path in book['paths']:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+        total -= book['bytes']
+
+        logging.info('book cache: evicted %s', key)
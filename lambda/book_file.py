@@ -0,0 +1,374 @@
+""" Compact binary book format served from mmap
+
+A processed book in one file, readable without lxml or zipfile:
+
+    header      magic, version, flags, counts and region offsets
+    toc         per chapter: first section, section count, file, title
+    offsets     section_count + 1 byte offsets into the text, uint64
+    text        every section's text, utf-8, in reading order
+
+All integers are little endian.
+"""
+
+import mmap
+import struct
+import sys
+
+import atomic_file
+from matcher import TitleMatcher, CHAPTER_STOPWORDS
+
+MAGIC = b'PRBOOK\0\0'
+VERSION = 1
+
+FLAG_HAS_PARTS = 1
+
+# magic, version, flags, chapters, sections, toc / offsets / text offsets, text length
+_HEADER = struct.Struct('<8sIIIIQQQQ')
+
+# first section, section count, file length, title length
+_TOC_RECORD = struct.Struct('<IIHH')
+
+_CHAPTER_PATH = 'epub/text/'
+
+
+def convert(epub, path):
+    """ Writes an epub as a book file
+
+    :param epub: Epub to convert
+    :param path: string path of the book file, replaced atomically
+    :return: string path
+    """
+
+    toc = epub.get_toc()
+
+    records = []
+    offsets = [0]
+    texts = []
+
+    for chapter in toc:
+        section_count = epub.section_count(chapter['file'])
+
+        records.append((len(offsets) - 1, section_count, chapter['file'].encode('utf-8'), chapter['title'].encode('utf-8')))
+
+        for section in range(section_count):
+            text = epub.read_section(chapter['file'], section)['text'].encode('utf-8')
+
+            texts.append(text)
+            offsets.append(offsets[-1] + len(text))
+
+    toc_data = b''.join(_TOC_RECORD.pack(first, count, len(file), len(title)) + file + title for first, count, file, title in records)
+    offsets_data = struct.pack('<{}Q'.format(len(offsets)), *offsets)
+
+    # offsets are read in place, keep them 8 byte aligned
+    toc_offset = _HEADER.size
+    offsets_offset = toc_offset + len(toc_data)
+    padding = -offsets_offset % 8
+    offsets_offset += padding
+    text_offset = offsets_offset + len(offsets_data)
+
+    flags = FLAG_HAS_PARTS if epub.has_parts() else 0
+
+    header = _HEADER.pack(MAGIC, VERSION, flags, len(records), len(offsets) - 1, toc_offset, offsets_offset, text_offset, offsets[-1])
+
+    with atomic_file.write(path, 'wb') as book_file:
+        book_file.write(header)
+        book_file.write(toc_data)
+        book_file.write(b'\0' * padding)
+        book_file.write(offsets_data)
+
+        for text in texts:
+            book_file.write(text)
+
+    return path
+
+
+class BookFile:
+    """ Reads a book file with the same interface as Epub
+
+    Section text is decoded straight from the mapped file, nothing but the
+    toc is held in memory.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: string path of a book file
+        """
+
+        self.__file = open(path, 'rb')
+        self.__map = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__view = memoryview(self.__map)
+
+        magic, version, flags, chapter_count, section_count, toc_offset, offsets_offset, text_offset, text_length = _HEADER.unpack_from(self.__map, 0)
+
+        if magic != MAGIC or version != VERSION:
+            self.__view.release()
+            self.__map.close()
+            self.__file.close()
+            raise ValueError('{} is not a version {} book file'.format(path, VERSION))
+
+        self.__has_parts = bool(flags & FLAG_HAS_PARTS)
+        self.__text_offset = text_offset
+
+        if sys.byteorder == 'little':
+            self.__offsets = self.__view[offsets_offset:offsets_offset + (section_count + 1) * 8].cast('Q')
+        else:
+            self.__offsets = struct.unpack_from('<{}Q'.format(section_count + 1), self.__map, offsets_offset)
+
+        self.__toc = []
+        self.__file_index = {}
+
+        position = toc_offset
+
+        for index in range(chapter_count):
+            first, count, file_length, title_length = _TOC_RECORD.unpack_from(self.__map, position)
+            position += _TOC_RECORD.size
+
+            file = str(self.__view[position:position + file_length], 'utf-8')
+            position += file_length
+
+            title = str(self.__view[position:position + title_length], 'utf-8')
+            position += title_length
+
+            self.__toc.append({
+                'file': file,
+                'title': title,
+                'first': first,
+                'sections': count
+            })
+
+            self.__file_index[file] = index
+
+        # built on the first title lookup
+        self.__title_matcher = None
+
+    ### private functions
+
+    def __text(self, section):
+        """ Decodes one section's text from the map
+
+        :param section: integer of section across the whole book
+        :return: string of section text
+        """
+
+        start = self.__text_offset + self.__offsets[section]
+        end = self.__text_offset + self.__offsets[section + 1]
+
+        return str(self.__view[start:end], 'utf-8')
+
+    def __read_file(self, file, section=0):
+        """ Reads a section of a chapter
+
+        :param file: string of file name
+        :param section: section of file
+        :return: chapter information from file
+        """
+
+        index = self.__file_index.get(file)
+
+        if index is None:
+            raise KeyError(file)
+
+        chapter = self.__toc[index]
+
+        if section < 0 or section >= chapter['sections']:
+            raise IndexError('section {} out of range for {}'.format(section, file))
+
+        res = {
+            'file': file,
+            'section': section,
+            'text': self.__text(chapter['first'] + section)
+        }
+
+        if section == 0:
+            res['title'] = chapter['title']
+
+        return res
+
+    def __build_file_name(self, chapter, part=None):
+        """ Creates a chapter file name
+
+        :param chapter: string
+        :parm part: string
+        :return: File name with chapter and parts
+        """
+
+        if self.__has_parts:
+
+            if part == None:
+                part = 1
+
+            return _CHAPTER_PATH + 'chapter-{}-{}.xhtml'.format(part, chapter)
+
+        return _CHAPTER_PATH + 'chapter-{}.xhtml'.format(chapter)
+
+    ### public functions
+
+    def begin(self):
+        """ Start reading chapter from the beginning of the book
+
+        :return: chapter information from beginning of book
+        """
+
+        return self.__read_file(self.__toc[0]['file'])
+
+    def read(self, chapter, part=None, section=0):
+        """ Reads desired chapter, part, and section
+
+        :param chapter: integer of chapter
+        :part part: integer of part
+        :param section: integer of section
+        :return: chapter information
+        """
+
+        return self.__read_file(self.__build_file_name(chapter, part=part), section=section)
+
+    def read_section(self, file, section=0):
+        """ Reads a section of a chapter file
+
+        :param file: string of file name
+        :param section: integer of section
+        :return: chapter information
+        """
+
+        return self.__read_file(file, section=section)
+
+    def read_by_chapter_title(self, title):
+        """ Finds closest title and reads it
+
+        :param title: desired title of book
+        :return: chapter information
+        """
+
+        if self.__title_matcher is None:
+            self.__title_matcher = TitleMatcher(self.get_chapter_titles(), CHAPTER_STOPWORDS)
+
+        match = self.__title_matcher.match(title)
+
+        if match is not None:
+            return self.__read_file(self.__toc[match.index]['file'])
+
+        return
+
+    def next(self, file, section=0):
+        """ Finds next section / chapter of book
+
+        :param file: current file that was read
+        :param section: current section that was read
+        :return: chapter information
+        """
+
+        index = self.__file_index.get(file)
+
+        if index is None:
+            return
+
+        if section + 1 < self.__toc[index]['sections']:
+            return self.__read_file(file, section + 1)
+
+        if index >= len(self.__toc) - 1:
+            return
+
+        return self.__read_file(self.__toc[index + 1]['file'])
+
+    def previous(self, file, section=0):
+        """ Finds previous section / chapter of book
+
+        :param file: current file that was read
+        :param section: current section that was read
+        :return: chapter information
+        """
+
+        if section > 0:
+            return self.__read_file(file, section - 1)
+
+        index = self.__file_index.get(file)
+
+        if index is None or index <= 0:
+            return
+
+        return self.__read_file(self.__toc[index - 1]['file'])
+
+    def section_count(self, file):
+        """ Number of sections a chapter is read in
+
+        :param file: string of file name
+        :return: integer of sections in the chapter
+        """
+
+        return self.__toc[self.__file_index[file]]['sections']
+
+    def prefetch(self, file, section=0):
+        """ Nothing to prepare, sections are read from the map """
+
+    def has_parts(self):
+        """ Determines whether the book is in parts or just chapters
+
+        :return: boolean true if the book is in parts
+        """
+
+        return self.__has_parts
+
+    def get_toc(self):
+        """ Files and titles of all chapters in reading order
+
+        :return: array of dictionaries with file and title
+        """
+
+        return [ { 'file': chapter['file'], 'title': chapter['title'] } for chapter in self.__toc ]
+
+    def get_file_index(self, file):
+        """ Position of a chapter file in the toc
+
+        :param file: string of file name
+        :return: integer index, -1 when the file isn't a chapter
+        """
+
+        return self.__file_index.get(file, -1)
+
+    def get_file(self, index):
+        """ Chapter file at a position in the toc
+
+        :param index: integer index from get_file_index
+        :return: string of file name or None when out of range
+        """
+
+        if 0 <= index < len(self.__toc):
+            return self.__toc[index]['file']
+
+        return None
+
+    def get_chapter_titles(self):
+        """ List of all chapter titles in book
+
+        :return: array of all chapter titles
+        """
+
+        return [ chapter['title'] for chapter in self.__toc ]
+
+    def memory_usage(self):
+        """ Approximate memory held outside the map
+
+        :return: integer of bytes
+        """
+
+        return sum(sys.getsizeof(chapter['title']) + sys.getsizeof(chapter['file']) for chapter in self.__toc)
+
+    def close(self):
+        """ Unmaps and closes the book file """
+
+        if isinstance(self.__offsets, memoryview):
+            self.__offsets.release()
+
+        self.__view.release()
+        self.__map.close()
+        self.__file.close()
+
+
+if __name__ == '__main__':
+    import zipfile
+    from epub_parser import Epub
+
+    if len(sys.argv) != 3:
+        sys.exit('usage: python book_file.py book.epub book.prb')
+
+    convert(Epub(zipfile.ZipFile(sys.argv[1])), sys.argv[2])
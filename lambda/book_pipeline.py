@@ -0,0 +1,256 @@
+import asyncio
+import functools
+import io
+import logging
+import zipfile
+
+import book_cache
+import single_flight
+import tracing
+import utils
+from book_cache import InvalidBookError
+from epub_parser import Epub
+from http_client import HttpClient, HttpError
+
+# connections for range requests, separate from the download's
+_http = HttpClient()
+
+
+class RangeFile(io.RawIOBase):
+    """ Read only, seekable file over http range requests
+
+    Blocks are fetched as they are read, so a zip can be opened and a few
+    members read without downloading the rest of it.
+    """
+
+    BLOCK_SIZE = 64 * 1024
+
+    def __init__(self, client, url, max_bytes=2 * 1024 * 1024):
+        """
+        :param client: HttpClient
+        :param url: string url of the file
+        :param max_bytes: integer of bytes fetched before giving up
+        """
+
+        super().__init__()
+
+        self.__client = client
+        self.__url = url
+        self.__max_bytes = max_bytes
+
+        self.__blocks = {}
+        self.__fetched = 0
+        self.__position = 0
+
+        # the end of the file holds the zip central directory, fetching it
+        # first also gives the file size
+        self.__size = None
+        self.__fetch_tail()
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.__position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.__position = offset
+        elif whence == io.SEEK_CUR:
+            self.__position += offset
+        else:
+            self.__position = self.__size + offset
+
+        return self.__position
+
+    def readinto(self, buffer):
+        start = self.__position
+        end = min(start + len(buffer), self.__size)
+
+        if start >= end:
+            return 0
+
+        first_block = start // self.BLOCK_SIZE
+        last_block = (end - 1) // self.BLOCK_SIZE
+
+        missing = [ block for block in range(first_block, last_block + 1) if block not in self.__blocks ]
+
+        if missing:
+            self.__fetch(missing[0], missing[-1])
+
+        data = b''.join(self.__blocks[block] for block in range(first_block, last_block + 1))
+        offset = start - first_block * self.BLOCK_SIZE
+
+        length = end - start
+        buffer[:length] = data[offset:offset + length]
+
+        self.__position = end
+
+        return length
+
+    def __fetch_tail(self):
+        """ Fetches the last block and learns the file size """
+
+        headers = {
+            'Accept-Encoding': 'identity',
+            'Range': 'bytes=-{}'.format(self.BLOCK_SIZE)
+        }
+
+        with self.__client.stream(self.__url, headers=headers, ok=(206,)) as response:
+            content_range = response.getheader('Content-Range', '')
+            data = response.read()
+
+        self.__size = int(content_range.split('/')[1])
+
+        start = self.__size - len(data)
+
+        # keep whole blocks only, the first partial one is fetched again if needed
+        first_block = -(-start // self.BLOCK_SIZE)
+
+        for block in range(first_block, (self.__size - 1) // self.BLOCK_SIZE + 1):
+            block_start = block * self.BLOCK_SIZE - start
+            self.__blocks[block] = data[block_start:block_start + self.BLOCK_SIZE]
+
+        self.__fetched += len(data)
+
+    def __fetch(self, first_block, last_block):
+        """ Fetches a run of blocks in one range request
+
+        :param first_block: integer of first block
+        :param last_block: integer of last block, inclusive
+        """
+
+        start = first_block * self.BLOCK_SIZE
+        end = min((last_block + 1) * self.BLOCK_SIZE, self.__size) - 1
+
+        self.__fetched += end - start + 1
+
+        if self.__fetched > self.__max_bytes:
+            raise IOError('fetched more than {} bytes of {}'.format(self.__max_bytes, self.__url))
+
+        headers = {
+            'Accept-Encoding': 'identity',
+            'Range': 'bytes={}-{}'.format(start, end)
+        }
+
+        with self.__client.stream(self.__url, headers=headers, ok=(206,)) as response:
+            data = response.read()
+
+        for block in range(first_block, last_block + 1):
+            block_start = (block - first_block) * self.BLOCK_SIZE
+            self.__blocks[block] = data[block_start:block_start + self.BLOCK_SIZE]
+
+
+def guess_epub_url(titleLink):
+    """ Download link standardebooks.org uses for a book page
+
+    Lets the download start before the book page has been read.
+
+    :param titleLink: string such as /ebooks/jane-austen/pride-and-prejudice
+    :return: string url of the epub
+    """
+
+    parts = titleLink.strip('/').split('/')[1:]
+
+    return '{}{}/downloads/{}.epub'.format(utils.BASE_URL, titleLink.rstrip('/'), '_'.join(parts))
+
+def read_remote_toc(epub_url):
+    """ Reads an epub's toc with range requests, before it is downloaded
+
+    :param epub_url: string url of the epub
+    :return: toc as returned by Epub.get_toc
+    """
+
+    with tracing.span('remote_toc'), RangeFile(_http, epub_url) as remote_file:
+        with zipfile.ZipFile(remote_file) as remote_zip:
+            return Epub(remote_zip).get_toc()
+
+async def _download_with_toc(key, epub_url):
+    """ Downloads a book while its toc is read from the same url
+
+    :param key: string from book_cache.book_key
+    :param epub_url: string url of the epub
+    :return: toc, or None when it couldn't be read remotely
+    """
+
+    loop = asyncio.get_running_loop()
+
+    download = loop.run_in_executor(None, tracing.wrap(utils.download_book), key, epub_url)
+    remote_toc = loop.run_in_executor(None, tracing.wrap(read_remote_toc), epub_url)
+
+    stats, toc = await asyncio.gather(download, remote_toc, return_exceptions=True)
+
+    if isinstance(stats, BaseException):
+        raise stats
+
+    # the toc is only a head start, the epub can build it after download
+    if isinstance(toc, BaseException):
+        logging.info('remote toc of %s unavailable: %s', epub_url, toc)
+        return None
+
+    return toc
+
+def _log_page_error(titleLink, page):
+    """ Logs the error of a book page request nobody waited on
+
+    :param titleLink: string
+    :param page: finished future of the book page
+    """
+
+    if page.cancelled():
+        return
+
+    error = page.exception()
+
+    if error is not None:
+        logging.info('book page of %s failed: %s', titleLink, error)
+
+async def open_book_async(titleLink):
+    """ Downloads and opens a book, overlapping the network steps
+
+    The download starts from the usual standardebooks.org link while the
+    book page is fetched, and the toc is read with range requests while the
+    download runs. The book page is only needed when the guessed link fails.
+
+    :param titleLink: string
+    :return: epub object
+    """
+
+    key = book_cache.book_key(titleLink)
+
+    if book_cache.is_cached(key):
+        return utils.open_zipped_epub(key)
+
+    loop = asyncio.get_running_loop()
+
+    page = loop.run_in_executor(None, tracing.wrap(utils.get_epub_url), titleLink)
+
+    try:
+        toc = await _download_with_toc(key, guess_epub_url(titleLink))
+    except (HttpError, InvalidBookError) as e:
+        logging.info('guessed epub link of %s failed: %s', titleLink, e)
+
+        toc = await _download_with_toc(key, await page)
+    else:
+        # nothing waits on the page, but its errors shouldn't go unnoticed
+        page.add_done_callback(functools.partial(_log_page_error, titleLink))
+
+    return utils.open_zipped_epub(key, toc=toc)
+
+def open_book(titleLink):
+    """ Sync entry point for handlers, one event loop per invocation
+
+    :param titleLink: string
+    :return: epub object
+    """
+
+    key = book_cache.book_key(titleLink)
+
+    if book_cache.is_cached(key):
+        return utils.open_zipped_epub(key)
+
+    # the same flight as utils.open_book, a book is downloaded once
+    return single_flight.do(key + '.download', lambda: asyncio.run(open_book_async(titleLink)))
@@ -0,0 +1,332 @@
+""" Bookmarks kept between sessions, one per user
+
+Each user has a record of the book they are reading and where they are in
+it:
+
+    {'titleLink': '/ebooks/...', 'bookmark': {'index': 12, 'section': 3}, 'updated': 1700000000}
+
+Handlers put records as often as they like. Writes are held back and
+flushed once per invocation by calling flush when the response is built.
+The bookmark a session comes back with was put when its last response was
+built, so it is passed to saved, and a request that leaves the bookmark
+where it was writes nothing. A user's requests land on any container, so
+begin is called with every request and records are read from the backend
+again rather than trusted from an earlier invocation.
+
+The backend is chosen with BOOKMARK_STORE:
+
+    memory      records live as long as the container, for local runs
+    file        json files in BOOKMARK_DIR
+    dynamodb    items in the BOOKMARK_TABLE table, BOOKMARK_ENDPOINT_URL
+                points at a local stand-in such as DynamoDB Local
+
+Only dynamodb keeps bookmarks for listeners who come back another day. On
+lambda /tmp belongs to one container and goes with it, so the memory and
+file backends are for local runs and tests.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import atomic_file
+
+BOOKMARK_TABLE = os.environ.get('BOOKMARK_TABLE', os.environ.get('DYNAMODB_PERSISTENCE_TABLE_NAME', ''))
+BOOKMARK_REGION = os.environ.get('BOOKMARK_REGION', os.environ.get('DYNAMODB_PERSISTENCE_REGION'))
+BOOKMARK_ENDPOINT_URL = os.environ.get('BOOKMARK_ENDPOINT_URL')
+
+BOOKMARK_DIR = os.environ.get('BOOKMARK_DIR', '/tmp/bookmarks')
+
+# alexa hosted skills come with a table, use it when there is one
+BOOKMARK_STORE = os.environ.get('BOOKMARK_STORE', 'dynamodb' if BOOKMARK_TABLE else 'file')
+
+
+class MemoryBackend:
+    """ Records in a dictionary """
+
+    def __init__(self):
+        self.__records = {}
+
+    def get(self, user_id):
+        record = self.__records.get(user_id)
+
+        return dict(record) if record is not None else None
+
+    def put_many(self, records):
+        """ Writes records
+
+        :param records: dictionary of user id to record
+        """
+
+        for user_id, record in records.items():
+            self.__records[user_id] = dict(record)
+
+
+class FileBackend:
+    """ One json file per user """
+
+    def __init__(self, directory):
+        """
+        :param directory: string path, created on first write
+        """
+
+        self.__directory = directory
+
+    def get(self, user_id):
+        try:
+            with open(self.__path(user_id), 'r') as record_file:
+                return json.load(record_file)
+        except (OSError, ValueError):
+            return None
+
+    def put_many(self, records):
+        os.makedirs(self.__directory, exist_ok=True)
+
+        for user_id, record in records.items():
+            atomic_file.write_json(self.__path(user_id), record)
+
+    def __path(self, user_id):
+        name = hashlib.sha1(user_id.encode('utf-8')).hexdigest()
+
+        return os.path.join(self.__directory, name + '.json')
+
+
+class DynamoDBBackend:
+    """ One item per user, keyed by id, with the record as a json string """
+
+    # batch_write_item takes at most 25 items
+    __BATCH_SIZE = 25
+
+    def __init__(self, table, client=None, region=BOOKMARK_REGION, endpoint_url=BOOKMARK_ENDPOINT_URL):
+        """
+        :param table: string table name, its key is the string attribute id
+        :param client: dynamodb client, made with boto3 when None
+        :param region: string aws region
+        :param endpoint_url: string url of a local stand-in
+        """
+
+        self.__table = table
+        self.__client = client
+        self.__region = region
+        self.__endpoint_url = endpoint_url
+
+    def get(self, user_id):
+        response = self.__get_client().get_item(
+            TableName=self.__table,
+            Key={ 'id': { 'S': user_id } },
+            ConsistentRead=True
+        )
+
+        item = response.get('Item')
+
+        if item is None:
+            return None
+
+        return json.loads(item['record']['S'])
+
+    def put_many(self, records):
+        items = [
+            { 'PutRequest': { 'Item': { 'id': { 'S': user_id }, 'record': { 'S': json.dumps(record) } } } }
+            for user_id, record in records.items()
+        ]
+
+        for start in range(0, len(items), self.__BATCH_SIZE):
+            requests = { self.__table: items[start:start + self.__BATCH_SIZE] }
+
+            attempt = 0
+
+            # throttled writes come back unprocessed
+            while requests:
+                if attempt > 0:
+                    time.sleep(0.05 * 2 ** attempt)
+
+                response = self.__get_client().batch_write_item(RequestItems=requests)
+                requests = response.get('UnprocessedItems')
+                attempt += 1
+
+    def __get_client(self):
+        if self.__client is None:
+            import boto3
+
+            self.__client = boto3.client('dynamodb', region_name=self.__region, endpoint_url=self.__endpoint_url)
+
+        return self.__client
+
+
+class BookmarkStore:
+    """ Write behind store of user records
+
+    Reads go to the backend once per user and invocation, later reads and
+    writes of the invocation are answered from memory until flushed.
+    """
+
+    def __init__(self, backend):
+        """
+        :param backend: object with get(user_id) and put_many(records)
+        """
+
+        self.__backend = backend
+        self.__lock = threading.Lock()
+
+        # user id -> record as last read or written in this invocation
+        self.__known = {}
+
+        # user id -> record not written yet
+        self.__pending = {}
+
+        self.writes = 0
+
+    def begin(self):
+        """ Starts an invocation, forgetting the records read in earlier ones
+
+        Another container may have written them since.
+        """
+
+        with self.__lock:
+            self.__known = {}
+
+    def saved(self, user_id, titleLink, bookmark):
+        """ Notes a record the backend has, such as the session's bookmark
+
+        A record still waiting for a flush that failed is written anyway.
+
+        :param user_id: string alexa user id
+        :param titleLink: string title link of the book
+        :param bookmark: dictionary from session.bookmark
+        """
+
+        with self.__lock:
+            if user_id not in self.__pending:
+                self.__known[user_id] = { 'titleLink': titleLink, 'bookmark': dict(bookmark) }
+
+    def get(self, user_id):
+        """ Record of a user
+
+        :param user_id: string alexa user id
+        :return: dictionary record or None
+        """
+
+        with self.__lock:
+            if user_id in self.__pending:
+                return dict(self.__pending[user_id])
+
+            if user_id in self.__known:
+                record = self.__known[user_id]
+                return dict(record) if record is not None else None
+
+        record = self.__backend.get(user_id)
+
+        with self.__lock:
+            self.__known.setdefault(user_id, record)
+
+        return dict(record) if record is not None else None
+
+    def put(self, user_id, titleLink, bookmark):
+        """ Holds back a user's current book and bookmark until the flush
+
+        :param user_id: string alexa user id
+        :param titleLink: string title link of the book
+        :param bookmark: dictionary from session.bookmark
+        """
+
+        record = { 'titleLink': titleLink, 'bookmark': dict(bookmark) }
+
+        with self.__lock:
+            known = self.__known.get(user_id)
+
+            if known is not None and self.__same(known, record):
+                self.__pending.pop(user_id, None)
+                return
+
+            record['updated'] = int(time.time())
+            self.__pending[user_id] = record
+
+    def flush(self):
+        """ Writes every changed record in one go
+
+        :return: integer of records written
+        """
+
+        with self.__lock:
+            pending = self.__pending
+            self.__pending = {}
+
+        if not pending:
+            return 0
+
+        try:
+            self.__backend.put_many(pending)
+        except Exception:
+            # kept for the next flush rather than lost
+            with self.__lock:
+                for user_id, record in pending.items():
+                    self.__pending.setdefault(user_id, record)
+            raise
+
+        with self.__lock:
+            self.__known.update(pending)
+            self.writes += len(pending)
+
+        return len(pending)
+
+    def __same(self, known, record):
+        return known.get('titleLink') == record['titleLink'] and known.get('bookmark') == record['bookmark']
+
+
+def make_backend(name=BOOKMARK_STORE):
+    """ Backend for a BOOKMARK_STORE name
+
+    :param name: string memory, file or dynamodb
+    :return: backend object
+    """
+
+    if name == 'memory':
+        return MemoryBackend()
+
+    if name == 'file':
+        return FileBackend(BOOKMARK_DIR)
+
+    if name == 'dynamodb':
+        return DynamoDBBackend(BOOKMARK_TABLE)
+
+    raise ValueError('unknown bookmark store {}'.format(name))
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """ Store shared by warm invocations, made on first use
+
+    :return: BookmarkStore
+    """
+
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            if BOOKMARK_STORE != 'dynamodb':
+                logging.warning('bookmarks: the %s store only lasts as long as this container, set BOOKMARK_TABLE to keep them', BOOKMARK_STORE)
+
+            _store = BookmarkStore(make_backend())
+
+        return _store
+
+def begin():
+    """ Starts an invocation of the shared store """
+
+    if _store is not None:
+        _store.begin()
+
+def flush():
+    """ Flushes the shared store, logging rather than failing the response """
+
+    if _store is None:
+        return
+
+    try:
+        _store.flush()
+    except Exception as e:
+        logging.error('bookmarks: flush failed: %s', e)
@@ -0,0 +1,301 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import atomic_file
+
+
+class LRUCache:
+    """ Thread safe least recently used cache with a size budget
+
+    Module level instances live as long as the lambda container, so they
+    are shared by every warm invocation. Entries may also expire after a
+    time to live.
+    """
+
+    def __init__(self, max_bytes=None, max_entries=None, sizeof=sys.getsizeof, on_evict=None):
+        """
+        :param max_bytes: integer of total size allowed, None for no limit
+        :param max_entries: integer of entries allowed, None for no limit
+        :param sizeof: function returning the size of a value in bytes
+        :param on_evict: function called with key and value when evicted
+        """
+
+        self.__max_bytes = max_bytes
+        self.__max_entries = max_entries
+        self.__sizeof = sizeof
+        self.__on_evict = on_evict
+
+        self.__entries = OrderedDict()
+        self.__lock = threading.RLock()
+
+        # key -> monotonic time the entry expires at
+        self.__expires = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """ Looks up a value and marks it as recently used
+
+        :param key: hashable key
+        :param default: returned when the key is missing
+        :return: cached value or default
+        """
+
+        with self.__lock:
+            if key not in self.__entries:
+                self.misses += 1
+                return default
+
+            if key in self.__expires and self.__expires[key] <= time.monotonic():
+                self.pop(key)
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self.__entries.move_to_end(key)
+            self.hits += 1
+
+            return self.__entries[key]
+
+    def put(self, key, value, ttl=None):
+        """ Adds a value, evicting the least recently used past the budget
+
+        :param key: hashable key
+        :param value: value to cache
+        :param ttl: seconds the value stays valid, None to keep it
+        """
+
+        with self.__lock:
+            self.__entries[key] = value
+            self.__entries.move_to_end(key)
+
+            if ttl is None:
+                self.__expires.pop(key, None)
+            else:
+                self.__expires[key] = time.monotonic() + ttl
+
+            self.__evict(keep=key)
+
+    def pop(self, key, default=None):
+        """ Removes a value without counting it as an eviction
+
+        :param key: hashable key
+        :param default: returned when the key is missing
+        :return: removed value or default
+        """
+
+        with self.__lock:
+            self.__expires.pop(key, None)
+
+            return self.__entries.pop(key, default)
+
+    def keys(self):
+        """ Keys from least to most recently used
+
+        :return: list of keys
+        """
+
+        with self.__lock:
+            return list(self.__entries.keys())
+
+    def size(self):
+        """ Current size of all values
+
+        Values such as open books grow while cached, so the size is
+        measured when asked rather than when added.
+
+        :return: integer of bytes
+        """
+
+        with self.__lock:
+            return sum(self.__sizeof(value) for value in self.__entries.values())
+
+    def trim(self):
+        """ Evicts entries until the cache is back within its budget """
+
+        with self.__lock:
+            self.__evict()
+
+    def stats(self):
+        """ Counters for sizing the cache
+
+        :return: dictionary of cache counters
+        """
+
+        with self.__lock:
+            return {
+                'entries': len(self.__entries),
+                'bytes': self.size(),
+                'max_bytes': self.__max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def __contains__(self, key):
+        return key in self.__entries
+
+    def __evict(self, keep=None):
+        """ Drops least recently used entries until within budget
+
+        :param keep: key that is never evicted, the one just added
+        """
+
+        while len(self.__entries) > 0:
+
+            over_entries = self.__max_entries is not None and len(self.__entries) > self.__max_entries
+            over_bytes = self.__max_bytes is not None and self.size() > self.__max_bytes
+
+            if not over_entries and not over_bytes:
+                return
+
+            key = next(iter(self.__entries))
+
+            if key == keep:
+                return
+
+            value = self.pop(key)
+            self.evictions += 1
+
+            if self.__on_evict is not None:
+                self.__on_evict(key, value)
+
+
+class DiskCache:
+    """ Json values with a time to live, one file per key
+
+    Files in /tmp outlive a single container's memory only as long as the
+    container, but survive a cold module reload within it. Each file's
+    modification time is set to when it expires, so trimming the cache
+    never reads the files.
+    """
+
+    def __init__(self, directory, max_entries=None):
+        """
+        :param directory: string path, created on first write
+        :param max_entries: integer of files kept, None for no limit
+        """
+
+        self.__directory = directory
+        self.__max_entries = max_entries
+
+        self.expirations = 0
+        self.evictions = 0
+
+    def get(self, key):
+        """ Reads a value that hasn't expired, removing it once it has
+
+        :param key: string key
+        :return: tuple of value and seconds left, or None
+        """
+
+        path = self.__path(key)
+
+        try:
+            with open(path, 'r') as cache_file:
+                entry = json.load(cache_file)
+        except (OSError, ValueError):
+            return None
+
+        ttl = entry['expires'] - time.time()
+
+        if ttl <= 0:
+            self.__remove(path)
+            self.expirations += 1
+            return None
+
+        return entry['value'], ttl
+
+    def put(self, key, value, ttl):
+        """ Writes a value, removing the files past the limit
+
+        :param key: string key
+        :param value: json serializable value
+        :param ttl: seconds the value stays valid
+        """
+
+        path = self.__path(key)
+
+        expires = time.time() + ttl
+
+        entry = {
+            'expires': expires,
+            'value': value
+        }
+
+        try:
+            os.makedirs(self.__directory, exist_ok=True)
+
+            with atomic_file.write(path) as cache_file:
+                json.dump(entry, cache_file)
+
+                # written out first, closing the file would set the time again
+                cache_file.flush()
+                os.utime(cache_file.fileno(), (expires, expires))
+        except OSError:
+            return
+
+        self.trim()
+
+    def trim(self):
+        """ Removes expired files, then the ones expiring first past the limit """
+
+        if self.__max_entries is None:
+            return
+
+        try:
+            names = [ name for name in os.listdir(self.__directory) if name.endswith('.json') ]
+        except OSError:
+            return
+
+        if len(names) <= self.__max_entries:
+            return
+
+        expiring = []
+
+        for name in names:
+            path = os.path.join(self.__directory, name)
+
+            try:
+                expiring.append((os.stat(path).st_mtime, path))
+            except OSError:
+                pass
+
+        expiring.sort()
+
+        now = time.time()
+        excess = len(expiring) - self.__max_entries
+
+        for position, (expires, path) in enumerate(expiring):
+
+            if expires <= now:
+                self.expirations += 1
+            elif position < excess:
+                self.evictions += 1
+            else:
+                return
+
+            self.__remove(path)
+
+    def __remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def __path(self, key):
+        name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+        return os.path.join(self.__directory, name + '.json')
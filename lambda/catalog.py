@@ -0,0 +1,388 @@
+""" Local catalog of standardebooks.org, searched without scraping
+
+The catalog is built from the Standard Ebooks OPDS feed into a json file
+of books. It is packaged with the deployment:
+
+    python catalog.py --out catalog.json
+
+or, when a feed fixture is at hand:
+
+    python catalog.py --feed all.xml --out catalog.json
+
+A copy refreshed from the network is kept in /tmp and replaces the
+packaged one once it is newer. Refreshes only run on a background thread,
+searches never wait on them.
+"""
+
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import urllib.parse
+
+import atomic_file
+from http_client import HttpClient
+from matcher import STOPWORDS, normalize
+
+CATALOG_FEED_URL = os.environ.get(
+    'CATALOG_FEED_URL',
+    os.environ.get('STANDARD_EBOOKS_URL', 'https://standardebooks.org') + '/feeds/opds/all'
+)
+
+# catalog shipped with the lambda
+CATALOG_PATH = os.environ.get('CATALOG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'catalog.json'))
+
+# refreshed copy, empty to never refresh
+CATALOG_CACHE_PATH = os.environ.get('CATALOG_CACHE_PATH', '/tmp/catalog.json')
+
+# seconds before the catalog is refreshed in the background
+CATALOG_MAX_AGE = int(os.environ.get('CATALOG_MAX_AGE', 24 * 60 * 60))
+
+# seconds without refreshes after one failed, searches scrape meanwhile
+CATALOG_REFRESH_COOLDOWN = int(os.environ.get('CATALOG_REFRESH_COOLDOWN', 10 * 60))
+
+CATALOG_SEARCH_LIMIT = int(os.environ.get('CATALOG_SEARCH_LIMIT', 10))
+
+CATALOG_VERSION = 1
+
+# words people say around a title and author
+CATALOG_STOPWORDS = STOPWORDS | frozenset(['and', 'of', 'by'])
+
+_ATOM = '{http://www.w3.org/2005/Atom}'
+
+_http = HttpClient()
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_refresh_thread = None
+_refresh_failed_at = None
+
+
+class Catalog:
+    """ Books with an inverted index over title and author words """
+
+    # a word of the title counts for more than a word of the author
+    __TITLE_WEIGHT = 2
+    __AUTHOR_WEIGHT = 1
+
+    def __init__(self, books, updated=None, source=None):
+        """
+        :param books: list of search result dictionaries
+        :param updated: unix time the books were read from the feed
+        :param source: string url or path of the feed
+        """
+
+        self.books = books
+        self.updated = updated or time.time()
+        self.source = source
+
+        self.__title_lengths = []
+        self.__title_index = collections.defaultdict(set)
+        self.__author_index = collections.defaultdict(set)
+
+        for position, book in enumerate(books):
+            title_tokens = normalize(book['title'], CATALOG_STOPWORDS)
+
+            self.__title_lengths.append(len(title_tokens))
+
+            for token in title_tokens:
+                self.__title_index[token].add(position)
+
+            for token in normalize(book['author'], CATALOG_STOPWORDS):
+                self.__author_index[token].add(position)
+
+    def search(self, keywords, limit=CATALOG_SEARCH_LIMIT):
+        """ Books matching the most words of a search, best first
+
+        At least half of the words have to match. Ties go to books matching
+        more words in the title, then to shorter titles.
+
+        :param keywords: string
+        :param limit: integer of results returned
+        :return: list of search result dictionaries
+        """
+
+        tokens = list(dict.fromkeys(normalize(keywords, CATALOG_STOPWORDS)))
+
+        if not tokens:
+            return []
+
+        matched = collections.Counter()
+        scores = collections.Counter()
+
+        for token in tokens:
+            title_hits = self.__title_index.get(token, set())
+            author_hits = self.__author_index.get(token, set())
+
+            for position in title_hits | author_hits:
+                matched[position] += 1
+                scores[position] += self.__TITLE_WEIGHT if position in title_hits else self.__AUTHOR_WEIGHT
+
+        if not matched:
+            return []
+
+        best = max(matched.values())
+
+        if best * 2 < len(tokens):
+            return []
+
+        positions = [ position for position, count in matched.items() if count == best ]
+        positions.sort(key=lambda position: (-scores[position], self.__title_lengths[position], position))
+
+        return [ dict(self.books[position]) for position in positions[:limit] ]
+
+    def age(self):
+        """ Seconds since the books were read from the feed
+
+        :return: float of seconds
+        """
+
+        return time.time() - self.updated
+
+    def to_json(self):
+        """ Serializable form, read back by from_json
+
+        :return: dictionary
+        """
+
+        return {
+            'version': CATALOG_VERSION,
+            'updated': self.updated,
+            'source': self.source,
+            'books': self.books
+        }
+
+    @classmethod
+    def from_json(cls, value):
+        """ Catalog from its serialized form
+
+        :param value: dictionary from to_json
+        :return: Catalog or None for another version
+        """
+
+        if value.get('version') != CATALOG_VERSION:
+            return None
+
+        return cls(value['books'], updated=value['updated'], source=value['source'])
+
+    def __len__(self):
+        return len(self.books)
+
+
+def _link_path(url):
+    """ Path of a standardebooks.org url, as the search page links it
+
+    :param url: string absolute url
+    :return: string path such as /ebooks/jane-austen
+    """
+
+    return urllib.parse.urlsplit(url).path.rstrip('/')
+
+def parse_feed(data):
+    """ Books of an OPDS or atom feed of standardebooks.org
+
+    :param data: bytes of the feed xml
+    :return: list of search result dictionaries
+    """
+
+    from lxml import etree
+
+    root = etree.fromstring(data)
+
+    books = []
+
+    for entry in root.iter(_ATOM + 'entry'):
+        title = entry.findtext(_ATOM + 'title')
+        book_id = entry.findtext(_ATOM + 'id')
+        author = entry.find(_ATOM + 'author')
+
+        if not title or not book_id or author is None:
+            continue
+
+        title_link = _link_path(book_id)
+
+        # navigation entries of the feed aren't books
+        if not title_link.startswith('/ebooks/'):
+            continue
+
+        books.append({
+            'title': title.strip(),
+            'titleLink': title_link,
+            'author': (author.findtext(_ATOM + 'name') or '').strip(),
+            'authorLink': _link_path(author.findtext(_ATOM + 'uri') or '')
+        })
+
+    return books
+
+def read_feed(feed):
+    """ Builds a catalog from a feed url or file
+
+    :param feed: string url or path of the feed
+    :return: Catalog
+    """
+
+    if feed.startswith(('http://', 'https://')):
+        data = _http.get(feed).body
+    else:
+        with open(feed, 'rb') as feed_file:
+            data = feed_file.read()
+
+    return Catalog(parse_feed(data), source=feed)
+
+def load(path):
+    """ Reads a saved catalog
+
+    :param path: string path
+    :return: Catalog or None when it is missing or unreadable
+    """
+
+    try:
+        with open(path, 'r') as catalog_file:
+            return Catalog.from_json(json.load(catalog_file))
+    except (OSError, ValueError, KeyError) as e:
+        logging.debug('catalog %s not loaded: %s', path, e)
+        return None
+
+def save(catalog, path):
+    """ Writes a catalog atomically
+
+    :param catalog: Catalog
+    :param path: string path
+    """
+
+    directory = os.path.dirname(path)
+
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+
+    atomic_file.write_json(path, catalog.to_json())
+
+def _load_newest():
+    """ Newest of the refreshed and packaged catalogs
+
+    :return: Catalog or None when there's neither
+    """
+
+    catalogs = [ load(path) for path in (CATALOG_CACHE_PATH, CATALOG_PATH) if path ]
+    catalogs = [ catalog for catalog in catalogs if catalog is not None ]
+
+    if not catalogs:
+        return None
+
+    return max(catalogs, key=lambda catalog: catalog.updated)
+
+def refresh(feed=CATALOG_FEED_URL):
+    """ Reads the feed again and swaps the new catalog in
+
+    :param feed: string url or path of the feed
+    :return: Catalog
+    """
+
+    global _catalog
+
+    start = time.perf_counter()
+
+    catalog = read_feed(feed)
+
+    if CATALOG_CACHE_PATH:
+        save(catalog, CATALOG_CACHE_PATH)
+
+    with _catalog_lock:
+        _catalog = catalog
+
+    logging.info('catalog: refreshed %s books in %.2fs', len(catalog), time.perf_counter() - start)
+
+    return catalog
+
+def _refresh_quietly():
+    global _refresh_failed_at
+
+    try:
+        refresh()
+    except Exception as e:
+        logging.warning('catalog: refresh failed, next try in %ss: %s', CATALOG_REFRESH_COOLDOWN, e)
+
+        with _catalog_lock:
+            _refresh_failed_at = time.monotonic()
+    else:
+        with _catalog_lock:
+            _refresh_failed_at = None
+
+def refresh_in_background():
+    """ Starts a refresh unless one is already running or one failed recently
+
+    :return: boolean true when a refresh was started
+    """
+
+    global _refresh_thread
+
+    with _catalog_lock:
+        if not CATALOG_CACHE_PATH or (_refresh_thread is not None and _refresh_thread.is_alive()):
+            return False
+
+        if _refresh_failed_at is not None and time.monotonic() - _refresh_failed_at < CATALOG_REFRESH_COOLDOWN:
+            return False
+
+        _refresh_thread = threading.Thread(target=_refresh_quietly, name='catalog-refresh', daemon=True)
+        _refresh_thread.start()
+
+    return True
+
+def get_catalog():
+    """ Catalog for searches, loaded once per container
+
+    A stale or missing catalog starts a background refresh, the catalog
+    at hand is used meanwhile. After a failed refresh the next one waits
+    for the cooldown.
+
+    :return: Catalog or None when there's none yet
+    """
+
+    global _catalog
+
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = _load_newest()
+
+        catalog = _catalog
+
+    if catalog is None or catalog.age() > CATALOG_MAX_AGE:
+        refresh_in_background()
+
+    return catalog
+
+def search(keywords):
+    """ Searches the local catalog
+
+    :param keywords: string
+    :return: list of search results, or None without a catalog
+    """
+
+    catalog = get_catalog()
+
+    if catalog is None:
+        return None
+
+    return catalog.search(keywords)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Builds the local catalog from the Standard Ebooks OPDS feed.')
+    parser.add_argument('--feed', default=CATALOG_FEED_URL, help='feed url or file')
+    parser.add_argument('--out', default=CATALOG_PATH, help='catalog file to write')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+
+    catalog = read_feed(args.feed)
+    save(catalog, args.out)
+
+    print('{} books from {} in {:.2f}s'.format(len(catalog), args.feed, time.perf_counter() - start))
+
+    return 0 if len(catalog) else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,9 +1,228 @@
 import zipfile
 from lxml import etree
 import re
-import io
+import os
+import posixpath
+import json
+import sys
 import math
-import difflib
+import collections
+import functools
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from xml.sax.saxutils import escape
+from cache import LRUCache
+import atomic_file
+import tracing
+from matcher import TitleMatcher, CHAPTER_STOPWORDS
+
+
+_XHTML_BODY = '{http://www.w3.org/1999/xhtml}body'
+_XHTML_NS = { 'n': 'http://www.w3.org/1999/xhtml' }
+_PARAGRAPH_BREAK = ' <break time="0.5s"/> '
+
+_DIGITS = re.compile(r'(\d+)')
+
+# text files read aloud, in reading order
+_READABLE_KINDS = ('preface', 'chapter', 'act', 'epilogue')
+
+# part title pages sit between chapters but aren't read
+_MEMBER_KINDS = _READABLE_KINDS + ('part',)
+
+Member = collections.namedtuple('Member', ['name', 'kind', 'sort_key', 'part', 'chapter'])
+
+# chapters parsed at once while a book is indexed, lxml parses without the
+# gil so threads use every vcpu lambda gives
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', 0)) or min(4, os.cpu_count() or 1)
+
+def parallel_map(function, items, workers=PARSE_WORKERS, processes=False):
+    """ Maps a function over items in order, on a pool when there are workers to spare
+
+    Process pools need /dev/shm, which lambda doesn't have, so they are for
+    the offline tools. Their function and items have to pickle.
+
+    :param function: function of one item
+    :param items: iterable of items
+    :param workers: integer of threads or processes, 1 maps serially
+    :param processes: boolean true for a process pool
+    :return: list of results, in the order of the items
+    """
+    
+    items = list(items)
+    
+    if workers <= 1 or len(items) <= 1:
+        return [ function(item) for item in items ]
+    
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    
+    with pool(max_workers=min(workers, len(items))) as executor:
+        return list(executor.map(function, items))
+
+def natural_key(text):
+    """ Sort key putting chapter-2 before chapter-10
+
+    :param text: string
+    :return: tuple of strings and integers
+    """
+    
+    return tuple(int(piece) if piece.isdigit() else piece for piece in _DIGITS.split(text))
+
+def classify_member(name, text_path='epub/text/'):
+    """ Kind and numbers of a file in the zip
+
+    :param name: string of file name
+    :param text_path: directory holding the text files
+    :return: Member or None for files that aren't text files
+    """
+    
+    if not name.startswith(text_path):
+        return None
+    
+    base_name = posixpath.basename(name)
+    
+    for rank, kind in enumerate(_MEMBER_KINDS):
+        if base_name.startswith(kind):
+            break
+    else:
+        return None
+    
+    numbers = [ int(number) for number in _DIGITS.findall(base_name) ]
+    
+    part = None
+    chapter = None
+    
+    # chapter-<part>-<chapter> in books with parts
+    if kind == 'chapter' and len(numbers) >= 2:
+        part, chapter = numbers[0], numbers[1]
+    elif kind == 'part' and numbers:
+        part = numbers[0]
+    elif numbers:
+        chapter = numbers[0]
+    
+    return Member(name, kind, (rank, natural_key(name)), part, chapter)
+
+def index_members(names, text_path='epub/text/'):
+    """ Classifies the files of a zip in one pass
+
+    :param names: list of file names from the zip
+    :param text_path: directory holding the text files
+    :return: dictionary of file name to Member, text files only
+    """
+    
+    members = {}
+    
+    for name in names:
+        member = classify_member(name, text_path)
+        
+        if member is not None:
+            members[name] = member
+    
+    return members
+
+def iter_chapter_text(xml):
+    """ Parses xml to obtain text, one source line at a time
+
+    The body is parsed once and its text nodes are walked in document
+    order, so nothing is serialized back to markup. Each non-empty line is
+    yielded with its ssml break, escaped for ssml.
+
+    :param xml: bytes of an xhtml document
+    :return: generator of strings
+    """
+    
+    tree = etree.fromstring(xml, parser=etree.XMLParser())
+    body_element = tree.find(_XHTML_BODY)
+    
+    if body_element is None:
+        return
+    
+    line = []
+    
+    for fragment in body_element.itertext():
+        
+        if '\n' not in fragment:
+            line.append(fragment)
+            continue
+        
+        lines = fragment.split('\n')
+        line.append(lines[0])
+        
+        for next_line in lines[1:]:
+            stripped_line = ''.join(line).strip()
+            
+            if stripped_line:
+                yield _PARAGRAPH_BREAK + escape(stripped_line)
+            
+            line = [next_line]
+    
+    stripped_line = ''.join(line).strip()
+    
+    if stripped_line:
+        yield _PARAGRAPH_BREAK + escape(stripped_line)
+
+def chapter_title(xml):
+    """ Title in the head of a chapter, as written
+
+    :param xml: bytes of an xhtml document
+    :return: string title
+    """
+    
+    tree = etree.fromstring(xml, parser=etree.XMLParser())
+    
+    return tree.xpath('n:head/n:title/text()', namespaces=_XHTML_NS)[0]
+
+def extract_chapter(xml, chunk_size):
+    """ Text of a chapter and its section offsets
+
+    :param xml: bytes of an xhtml document
+    :param chunk_size: integer of maximum section length
+    :return: tuple of chapter text and offsets
+    """
+    
+    text = ''.join(iter_chapter_text(xml))
+    
+    return text, chunk_offsets(text, chunk_size)
+
+def chunk_offsets(text, chunk_size, delimiter='. '):
+    """ Breaks text into sections at sentence ends for alexas limit
+
+    Sections hold as many whole sentences as fit in chunk_size. A sentence
+    longer than chunk_size is split by letter count. Consecutive offsets
+    are the start and end of a section, so the sections cover the text
+    with no gaps.
+
+    :param text: string of chapter text
+    :param chunk_size: integer of maximum section length
+    :param delimiter: string ending a sentence
+    :return: list of offsets, one more than the number of sections
+    """
+    
+    offsets = [0]
+    
+    length = len(text)
+    start = 0
+    end = 0
+    
+    while end < length:
+        
+        found = text.find(delimiter, end)
+        sentence_end = length if found < 0 else found + len(delimiter)
+        
+        if sentence_end - start <= chunk_size:
+            end = sentence_end
+        elif end > start:
+            # the sentence starts the next section
+            start = end
+            offsets.append(start)
+        else:
+            # when delimeter doesn't split correctly, defaults to splitting into chunks based on letter count
+            start = end = start + chunk_size
+            offsets.append(start)
+    
+    if start < length:
+        offsets.append(length)
+    
+    return offsets
+
 
 class Epub:
 
@@ -12,135 +231,405 @@ class Epub:
     # alexa max character output is 8000
     __CHUNK_SIZE = 7500
     __CHAPTER_PATH = 'epub/text/'
+    __CONTAINER_PATH = 'META-INF/container.xml'
+    
+    # bump when the layout of the book index changes
+    __INDEX_VERSION = 3
+    __INDEX_SUFFIX = '.index.json'
+    
+    # chapters kept extracted, next / previous usually stay close by
+    __CHAPTER_CACHE_SIZE = 4
 
     # initialization
-    def __init__(self, zipped_epub: zipfile.ZipFile):
+    def __init__(self, zipped_epub: zipfile.ZipFile, index_path=None, toc=None, workers=None):
+        """
+        :param zipped_epub: zip of the epub
+        :param index_path: path of the book index, next to the zip by default
+        :param toc: toc from get_toc read elsewhere, used when there's no index yet
+        :param workers: integer of chapters parsed at once, PARSE_WORKERS by default
+        """
+        
         self.__zipped_epub = zipped_epub
-        self.__toc = self.__get_toc()
-        self.__has_parts = self.__has_parts()
+        self.__workers = PARSE_WORKERS if workers is None else workers
+        self.__index_path = index_path or self.__default_index_path()
+        
+        # classified zip members, only built with the index
+        self.__members = None
+        
+        index = self.__load_index()
+        
+        if index is None:
+            with tracing.span('toc_build'):
+                index = self.__build_index(toc)
+                self.__save_index(index)
+            
+            self.__members = None
+        
+        self.__source = index['source']
+        self.__has_parts = index['has_parts']
+        self.__toc = index['toc']
+        
+        # file -> toc position, for next / previous without scanning the toc
+        self.__file_positions = { chapter['file']: position for position, chapter in enumerate(self.__toc) }
+        
+        self.__chapter_cache = LRUCache(max_entries=self.__CHAPTER_CACHE_SIZE, sizeof=self.__chapter_size)
+        
+        # built on the first title lookup
+        self.__title_matcher = None
     
     ### private functions
     
-    def __get_toc(self):
-        """ Returns epub toc
-            
-        :return: epub toc
+    def __default_index_path(self):
+        """ Sidecar path of the book index, next to the zip on disk
+
+        :return: string of index path or None for in memory zips
         """
+        
+        file_name = self.__zipped_epub.filename
+        
+        if not file_name:
+            return None
+        
+        return file_name + self.__INDEX_SUFFIX
 
-        # acceptable patterns in expected epub file
-        chapter_patterns = [
-            self.__CHAPTER_PATH + "preface*",
-            self.__CHAPTER_PATH + "chapter*",
-            self.__CHAPTER_PATH + "act*",
-            self.__CHAPTER_PATH + "epilogue*"
-        ]
+    def __get_source_stamp(self):
+        """ Identifies the zip the index was built from
 
+        :return: dictionary with size and modification time of the zip
+        """
+        
+        file_name = self.__zipped_epub.filename
         
-        toc_files = []    
+        if not file_name or not os.path.exists(file_name):
+            return None
         
-        # iterate through patterns to find matching files in epub
-        # preface -> chapters -> epilogue
-        for chapter_pattern in chapter_patterns:
+        stat = os.stat(file_name)
+        
+        return {
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns
+        }
 
-            pattern = re.compile(chapter_pattern)
+    def __load_index(self):
+        """ Loads the sidecar book index when it matches the zip
 
-            group = []
+        :return: index dictionary or None when missing or stale
+        """
+        
+        if self.__index_path is None or not os.path.exists(self.__index_path):
+            return None
+        
+        try:
+            with open(self.__index_path, 'r') as index_file:
+                index = json.load(index_file)
+        except (OSError, ValueError):
+            return None
+        
+        if index.get('version') != self.__INDEX_VERSION:
+            return None
+        
+        if index.get('source') != self.__get_source_stamp():
+            return None
+        
+        return index
 
-            # append to a list 
-            for file_name in self.__zipped_epub.namelist():
-                if pattern.match(file_name):
-                    group.append(file_name)
+    def __save_index(self, index):
+        """ Writes the book index next to the zip
 
-            # sort list and append to parent list
-            # ensures order
-            def atoi(text):
-                return int(text) if text.isdigit() else text
+        :param index: index dictionary
+        """
+        
+        if self.__index_path is None:
+            return
+        
+        # a concurrent reader never sees half an index, read ahead threads
+        # may save at the same time
+        try:
+            atomic_file.write_json(self.__index_path, index)
+        except OSError:
+            pass
+
+    def __update_index(self):
+        """ Saves the index again after section offsets were learned """
+        
+        index = {
+            'version': self.__INDEX_VERSION,
+            'source': self.__source,
+            'has_parts': self.__has_parts,
+            'toc': self.__toc
+        }
+        
+        self.__save_index(index)
+
+    def __build_index(self, toc=None):
+        """ Builds the book index: toc, titles, parts and section offsets
+
+        :param toc: toc already read from this book, if any
+        :return: index dictionary
+        """
+        
+        self.__has_parts = self.__check_parts()
+        
+        if toc:
+            toc = [ { 'file': chapter['file'], 'title': chapter['title'] } for chapter in toc ]
+        else:
+            # the package documents give the toc from one small file, scanning
+            # chapter bodies is only needed for epubs without them
+            toc = self.__get_package_toc()
+        
+        if not toc:
+            toc = self.__get_toc()
+        
+        # section offsets are filled in as chapters are read
+        for chapter in toc:
+            chapter['offsets'] = None
+        
+        index = {
+            'version': self.__INDEX_VERSION,
+            'source': self.__get_source_stamp(),
+            'has_parts': self.__has_parts,
+            'toc': toc
+        }
+        
+        return index
+    
+    def __get_package_toc(self):
+        """ Returns epub toc from the opf spine and the nav / ncx document
+
+        :return: epub toc or empty list when the package can't be read
+        """
+        
+        try:
+            opf_path = self.__get_opf_path()
             
-            def natural_keys(text):
-                '''
-                alist.sort(key=natural_keys) sorts in human order
-                http://nedbatchelder.com/blog/200712/human_sorting.html
-                (See Toothy's implementation in the comments)
-                '''
-                return [ atoi(c) for c in re.split(r'(\d+)', text) ]
+            if opf_path is None:
+                return []
             
-            group.sort(key=natural_keys)
-              
+            opf = etree.fromstring(self.__zipped_epub.read(opf_path), parser=etree.XMLParser())
+        except (KeyError, etree.XMLSyntaxError):
+            return []
+        
+        ns = {
+            'opf': 'http://www.idpf.org/2007/opf'
+        }
+        
+        opf_dir = posixpath.dirname(opf_path)
+        
+        manifest = {}
+        nav_path = None
+        
+        for item in opf.xpath('opf:manifest/opf:item', namespaces=ns):
+            path = self.__resolve_href(opf_dir, item.get('href', ''))
+            manifest[item.get('id')] = path
             
-            # now find attributing file names
-            for file_name in group:
+            if 'nav' in (item.get('properties') or '').split():
+                nav_path = path
+        
+        # epub 2 books point at an ncx from the spine instead
+        ncx_path = manifest.get(opf.xpath('string(opf:spine/@toc)', namespaces=ns))
+        
+        titles = self.__get_nav_titles(nav_path, ncx_path)
+        
+        toc = []
+        
+        for idref in opf.xpath('opf:spine/opf:itemref/@idref', namespaces=ns):
+            file = manifest.get(idref)
+            
+            if file is None or not self.__is_chapter_file(file):
+                continue
+            
+            title = titles.get(file)
+            
+            if title is None:
+                title = self.__get_chapter_title(file, self.__zipped_epub.read(file))
+            else:
+                title = self.__format_title(file, title)
+            
+            toc.append({
+                'file': file,
+                'title': title
+            })
+        
+        return toc
+
+    def __get_opf_path(self):
+        """ Finds the package document through the epub container
+
+        :return: string of opf file name or None
+        """
+        
+        ns = {
+            'c': 'urn:oasis:names:tc:opendocument:xmlns:container'
+        }
+        
+        container = etree.fromstring(self.__zipped_epub.read(self.__CONTAINER_PATH), parser=etree.XMLParser())
+        paths = container.xpath('c:rootfiles/c:rootfile/@full-path', namespaces=ns)
+        
+        if len(paths) == 0:
+            return None
+        
+        return paths[0]
+
+    def __get_nav_titles(self, nav_path, ncx_path):
+        """ Reads chapter titles from the nav document, or the ncx
+
+        :param nav_path: string of epub 3 nav file name
+        :param ncx_path: string of epub 2 ncx file name
+        :return: dictionary of file name to title
+        """
+        
+        titles = {}
+        
+        try:
+            if nav_path is not None:
                 
-                xml = self.__zipped_epub.read(file_name)
+                ns = {
+                    'n': 'http://www.w3.org/1999/xhtml',
+                    'epub': 'http://www.idpf.org/2007/ops'
+                }
                 
-                title = self.__get_chapter_title(file_name, xml)
-
-                chapter = {
-                    'file': file_name,
-                    'title': title
+                nav = etree.fromstring(self.__zipped_epub.read(nav_path), parser=etree.XMLParser())
+                nav_dir = posixpath.dirname(nav_path)
+                
+                for link in nav.xpath('//n:nav[@epub:type="toc"]//n:a', namespaces=ns):
+                    file = self.__resolve_href(nav_dir, link.get('href', ''))
+                    titles.setdefault(file, ' '.join(''.join(link.itertext()).split()))
+                    
+            elif ncx_path is not None:
+                
+                ns = {
+                    'ncx': 'http://www.daisy.org/z3986/2005/ncx/'
                 }
                 
-                toc_files.append(chapter)
-
-        return toc_files
+                ncx = etree.fromstring(self.__zipped_epub.read(ncx_path), parser=etree.XMLParser())
+                ncx_dir = posixpath.dirname(ncx_path)
+                
+                for point in ncx.xpath('//ncx:navPoint', namespaces=ns):
+                    file = self.__resolve_href(ncx_dir, point.xpath('string(ncx:content/@src)', namespaces=ns))
+                    label = point.xpath('string(ncx:navLabel/ncx:text)', namespaces=ns)
+                    titles.setdefault(file, ' '.join(label.split()))
+                    
+        except (KeyError, etree.XMLSyntaxError):
+            return {}
+        
+        return titles
 
-    # parses chapter text
-    def __get_chapter_text(self, xml):
-        """ Parses xml to obtain text
+    def __resolve_href(self, base_dir, href):
+        """ Resolves a package href to a file name in the zip
 
-        :param xml: string representation of an xml
-        :return: string containing xml text
+        :param base_dir: directory of the referring document
+        :param href: relative href, possibly with a fragment
+        :return: string of file name
         """
         
-        ns = {
-            'n': 'http://www.w3.org/1999/xhtml'
-        }
-
+        href = href.split('#')[0]
+        
+        return posixpath.normpath(posixpath.join(base_dir, href))
 
-        tree = etree.fromstring(xml, parser=etree.XMLParser())
-        body_element = tree.xpath('n:body', namespaces=ns)[0]
+    def __get_members(self):
+        """ Text files of the zip, classified on first use
 
-        encoding = 'utf-8'
-        text = etree.tostring(body_element, encoding=encoding).decode(encoding, 'ignore')
+        Only needed while the book index is built.
 
-        buf = io.StringIO(text)
-        res = ''
+        :return: dictionary of file name to Member
+        """
+        
+        if self.__members is None:
+            self.__members = index_members(self.__zipped_epub.namelist(), self.__CHAPTER_PATH)
+        
+        return self.__members
 
+    def __is_chapter_file(self, file):
+        """ Determines whether a file is one of the readable chapter files
 
-        for line in buf:
-            stripped_line = re.sub('<[^<]+?>', '', line).strip()
-            if stripped_line:
-                res += ' <break time="0.5s"/> ' + stripped_line
+        :param file: string of file name
+        :return: boolean true for preface, chapter, act and epilogue files
+        """
+        
+        member = self.__get_members().get(file)
+        
+        return member is not None and member.kind in _READABLE_KINDS
 
-        if len(res) != 0:
-            
-            sections = []
-            
+    def __get_toc(self):
+        """ Returns epub toc
             
-            # break into chunks for alexas limit
-            section = ''
-            delimeter = '. '
-            for sentence in res.split(delimeter):
-                
-                # when delimeter doesn't split correctly, defaults to splitting into chunks based on letter count
-                if len(sentence) > self.__CHUNK_SIZE:
-                    chunks, chunk_size = len(res), self.__CHUNK_SIZE
-                    res = [ res[i:i+chunk_size] for i in range(0, chunks, chunk_size) ]
-                    
-                    return res
-                
-                if len(sentence) + len(section) <= self.__CHUNK_SIZE:
-                    section += sentence + delimeter
-                else:
-                    sections.append(section)
-                    section = ''
+        :return: epub toc
+        """
+
+        # preface -> chapters -> acts -> epilogue, each in natural order
+        members = [ member for member in self.__get_members().values() if member.kind in _READABLE_KINDS ]
+        members.sort(key=lambda member: member.sort_key)
+        
+        xmls = [ self.__zipped_epub.read(member.name) for member in members ]
+        
+        titles = parallel_map(chapter_title, xmls, self.__workers)
+        
+        toc_files = []
+        
+        for member, title in zip(members, titles):
+
+            chapter = {
+                'file': member.name,
+                'title': self.__format_title(member.name, title)
+            }
             
-            if section not in sections:
-                sections.append(section)
+            toc_files.append(chapter)
+
+        return toc_files
+
+    # parses chapter text
+    def __get_chapter_text(self, xml):
+        """ Parses xml to obtain text
+
+        :param xml: string representation of an xml
+        :return: string containing xml text
+        """
+        
+        return ''.join(iter_chapter_text(xml))
+
+    def __get_chapter(self, file):
+        """ Text and section offsets of a chapter, extracted once
 
-            return sections
+        :param file: string of file name
+        :return: tuple of chapter text, offsets and file bytes
+        """
+        
+        chapter = self.__chapter_cache.get(file)
+        
+        if chapter is not None:
+            return chapter
+        
+        with tracing.span('text_extraction'):
+            xml = self.__zipped_epub.read(file)
+            text = self.__get_chapter_text(xml)
+        
+        index = self.__get_file_index(file)
+        
+        if index >= 0 and self.__toc[index]['offsets'] is not None:
+            offsets = self.__toc[index]['offsets']
         else:
-            return []
+            with tracing.span('chunking'):
+                offsets = chunk_offsets(text, self.__CHUNK_SIZE)
             
+            if index >= 0:
+                self.__toc[index]['offsets'] = offsets
+                self.__update_index()
+        
+        chapter = (text, offsets, xml)
+        self.__chapter_cache.put(file, chapter)
+        
+        return chapter
+
+    def __chapter_size(self, chapter):
+        """ Approximate memory held by an extracted chapter
+
+        :param chapter: tuple of chapter text, offsets and file bytes
+        :return: integer of bytes
+        """
+        
+        text, offsets, xml = chapter
+        
+        return sys.getsizeof(text) + sys.getsizeof(offsets) + sys.getsizeof(xml)
     
     def __get_chapter_title(self, file: str, xml: str):
         """ Parses xml to obtain title for the chapter
@@ -149,41 +638,33 @@ class Epub:
         :return: chapter title
         """
 
-        ns = {
-            'n': 'http://www.w3.org/1999/xhtml'
-        }
-        
-        tree = etree.fromstring(xml, parser=etree.XMLParser())
-        title = tree.xpath('n:head/n:title/text()', namespaces=ns)[0]
+        return self.__format_title(file, chapter_title(xml))
+
+    def __format_title(self, file: str, title: str):
+        """ Prefixes chapter titles with their part in books with parts
+
+        :param file: string of file name
+        :param title: chapter title
+        :return: chapter title
+        """
         
         if self.__has_parts and 'chapter' in title.lower() and 'part' not in title.lower():
             
-            integers = [ int(s) for s in file.split('-') if s.isdigit()]
+            member = classify_member(file, self.__CHAPTER_PATH)
             
-            if len(integers) > 0:
-                part = integers[0]
-                        
-                title = 'Part {} {}'.format(str(part), title)
+            if member is not None and member.part is not None:
+                title = 'Part {} {}'.format(member.part, title)
             
         return title
 
 
-    def __has_parts(self):
+    def __check_parts(self):
         """ Determines whether epub is in parts or just chapters
     
         :return: boolean true if epub is in parts
         """
         
-        pattern = re.compile('epub\/text\/chapter-.*-.*\.xhtml')
-
-        for chapter in self.__toc:
-            
-            file = chapter['file']
-
-            if pattern.match(file):
-                return True
-
-        return False
+        return any(member.kind == 'chapter' and member.part is not None for member in self.__get_members().values())
 
     def __build_file_name(self, chapter, part=None):
         """ Creates a chapter file name 
@@ -212,18 +693,24 @@ class Epub:
         :return: chapter information from file
         """
 
-        xml = self.__zipped_epub.read(file)
-            
-        text = self.__get_chapter_text(xml)
+        text, offsets, xml = self.__get_chapter(file)
+        
+        if section < 0 or section >= len(offsets) - 1:
+            raise IndexError('section {} out of range for {}'.format(section, file))
 
         res = {
             'file': file,
             'section': section,
-            'text': text[section]
+            'text': text[offsets[section]:offsets[section + 1]]
         }
 
         if section == 0:
-            res['title'] = self.__get_chapter_title(file, xml)
+            index = self.__get_file_index(file)
+            
+            if index >= 0:
+                res['title'] = self.__toc[index]['title']
+            else:
+                res['title'] = self.__get_chapter_title(file, xml)
         
         return res
 
@@ -234,14 +721,7 @@ class Epub:
         :return: integer of file index in self.__toc
         """
         
-        index = 0
-        
-        files = [ chapter['file'] for chapter in self.__toc ]
-        
-        if file not in files:
-            return -1
-        else:
-            return files.index(file)
+        return self.__file_positions.get(file, -1)
 
     ### public functions
 
@@ -255,20 +735,7 @@ class Epub:
         
         file = first_chapter['file']
 
-        xml = self.__zipped_epub.read(file)
-        title = self.__get_chapter_title(file, xml)
-        text = self.__get_chapter_text(xml)
-
-        section = 0
-
-        res = {
-            'file': file,
-            'section': section,
-            'title': title,
-            'text': text[section]
-        }
-        
-        return res
+        return self.__read_file(file, section=0)
         
     def read(self, chapter, part=None, section=0):
         """ Reads desired chapter, part, and section
@@ -280,12 +747,20 @@ class Epub:
         """
 
         file = self.__build_file_name(chapter, part=part)
-        
-        files = [ chapter['file'] for chapter in self.__toc ]
 
         return self.__read_file(file, section=section)
         
         
+    def read_section(self, file, section=0):
+        """ Reads a section of a chapter file
+
+        :param file: string of file name
+        :param section: integer of section
+        :return: chapter information
+        """
+        
+        return self.__read_file(file, section=section)
+
     def read_by_chapter_title(self, title):
         """ Finds closest title and reads it
 
@@ -293,18 +768,13 @@ class Epub:
         :return: chapter information
         """
         
-        titles = self.get_chapter_titles()
+        if self.__title_matcher is None:
+            self.__title_matcher = TitleMatcher(self.get_chapter_titles(), CHAPTER_STOPWORDS)
         
-        matches = difflib.get_close_matches(title, titles)
+        match = self.__title_matcher.match(title)
         
-        if len(matches) > 0:
-            match = matches[0]
-            
-            for chapter in self.__toc:
-                if chapter['title'] == match:
-                    file = chapter['file']
-                    
-                    return self.__read_file(file, section=0)
+        if match is not None:
+            return self.__read_file(self.__toc[match.index]['file'], section=0)
         
         return
 
@@ -316,21 +786,25 @@ class Epub:
         :return: chapter information
         """
         
-        try:
-            next_section = self.__read_file(file, section + 1)
-
-            return next_section
-        except: 
-            
-            index = self.__get_file_index(file)
+        index = self.__get_file_index(file)
+        
+        # the index knows when a chapter runs out, so the last section
+        # moves on without parsing the current chapter again
+        if index < 0 or section + 1 < self.section_count(file):
+            try:
+                next_section = self.__read_file(file, section + 1)
+
+                return next_section
+            except: 
+                pass
             
-            if index < 0 or index >= len(self.__toc) - 1:
-                return
+        if index < 0 or index >= len(self.__toc) - 1:
+            return
 
-            next_chapter_file = self.__toc[index + 1]['file']
-            next_chapter = self.__read_file(next_chapter_file)
+        next_chapter_file = self.__toc[index + 1]['file']
+        next_chapter = self.__read_file(next_chapter_file)
 
-            return next_chapter
+        return next_chapter
 
 
     def previous(self, file, section = 0):
@@ -357,6 +831,131 @@ class Epub:
 
             return previous_section
             
+    def read_sections(self, processes=False):
+        """ Reads every section of the book, extracting chapters in parallel
+
+        The sections are the ones next() steps through from begin(), and all
+        section offsets are saved in the index on the way.
+
+        :param processes: boolean true to extract in worker processes, for the offline tools
+        :return: list of chapter information in reading order
+        """
+        
+        with tracing.span('text_extraction'):
+            xmls = [ self.__zipped_epub.read(chapter['file']) for chapter in self.__toc ]
+            
+            extract = functools.partial(extract_chapter, chunk_size=self.__CHUNK_SIZE)
+            chapters = parallel_map(extract, xmls, self.__workers, processes)
+        
+        sections = []
+        
+        for chapter, (text, offsets) in zip(self.__toc, chapters):
+            chapter['offsets'] = offsets
+            
+            for section in range(len(offsets) - 1):
+                res = {
+                    'file': chapter['file'],
+                    'section': section,
+                    'text': text[offsets[section]:offsets[section + 1]]
+                }
+                
+                if section == 0:
+                    res['title'] = chapter['title']
+                
+                sections.append(res)
+        
+        self.__update_index()
+        
+        return sections
+
+    def section_count(self, file):
+        """ Number of sections a chapter is read in
+
+        :param file: string of file name
+        :return: integer of sections in the chapter
+        """
+        
+        index = self.__get_file_index(file)
+        
+        if index >= 0 and self.__toc[index]['offsets'] is not None:
+            offsets = self.__toc[index]['offsets']
+        else:
+            _, offsets, _ = self.__get_chapter(file)
+        
+        return len(offsets) - 1
+
+    def prefetch(self, file, section=0):
+        """ Extracts what next() will need after this section
+
+        That is this chapter, or the following one when this is the last
+        section, so the next page turn is a slice of cached text.
+
+        :param file: current file that was read
+        :param section: current section that was read
+        """
+        
+        index = self.__get_file_index(file)
+        
+        if index < 0:
+            return
+        
+        if section + 1 < self.section_count(file):
+            self.__get_chapter(file)
+        elif index < len(self.__toc) - 1:
+            self.__get_chapter(self.__toc[index + 1]['file'])
+
+    def memory_usage(self):
+        """ Approximate memory held by the toc and extracted chapters
+
+        :return: integer of bytes
+        """
+        
+        toc_size = sum(sys.getsizeof(chapter['title']) + sys.getsizeof(chapter['file']) for chapter in self.__toc)
+        
+        return toc_size + self.__chapter_cache.size()
+
+    def close(self):
+        """ Closes the underlying zip file """
+        
+        self.__zipped_epub.close()
+
+    def has_parts(self):
+        """ Determines whether epub is in parts or just chapters
+
+        :return: boolean true if epub is in parts
+        """
+        
+        return self.__has_parts
+
+    def get_toc(self):
+        """ Files and titles of all chapters in reading order
+
+        :return: array of dictionaries with file and title
+        """
+        
+        return [ { 'file': chapter['file'], 'title': chapter['title'] } for chapter in self.__toc ]
+
+    def get_file_index(self, file):
+        """ Position of a chapter file in the toc
+
+        :param file: string of file name
+        :return: integer index, -1 when the file isn't a chapter
+        """
+        
+        return self.__get_file_index(file)
+
+    def get_file(self, index):
+        """ Chapter file at a position in the toc
+
+        :param index: integer index from get_file_index
+        :return: string of file name or None when out of range
+        """
+        
+        if 0 <= index < len(self.__toc):
+            return self.__toc[index]['file']
+        
+        return None
+
     def get_chapter_titles(self):
         """ List of all chapter titles in book
 
@@ -0,0 +1,471 @@
+import contextlib
+import gzip
+import http.client
+import logging
+import os
+import socket
+import threading
+import time
+import urllib.parse
+
+import atomic_file
+
+# seconds to wait on connect and on each read
+HTTP_TIMEOUT = float(os.environ.get('HTTP_TIMEOUT', 10))
+
+# attempts after the first one, waiting backoff * 2 ** attempt in between
+HTTP_RETRIES = int(os.environ.get('HTTP_RETRIES', 2))
+HTTP_BACKOFF = float(os.environ.get('HTTP_BACKOFF', 0.25))
+
+# seconds a connection may sit idle in the pool, servers drop them after
+# their keep-alive timeout and a warm container idles longer than that
+HTTP_MAX_IDLE_SECONDS = float(os.environ.get('HTTP_MAX_IDLE_SECONDS', 4))
+
+USER_AGENT = 'public-reader'
+
+# errors after which a request is worth sending again on a new connection
+_TRANSIENT_ERRORS = (http.client.HTTPException, ConnectionError, socket.timeout, OSError)
+
+# errors of a pooled connection the server closed while it was idle
+_STALE_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError, ConnectionAbortedError)
+
+
+class HttpError(Exception):
+    """ Raised for responses that aren't successful after retries """
+
+    def __init__(self, status, url):
+        super().__init__('HTTP {} for {}'.format(status, url))
+
+        self.status = status
+        self.url = url
+
+
+class DownloadError(Exception):
+    """ Raised when a download can't be completed or verified """
+
+
+class Response:
+    """ Fully read response """
+
+    def __init__(self, url, status, headers, body):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def text(self, encoding='utf-8'):
+        """ Decoded body
+
+        :param encoding: string of text encoding
+        :return: string body
+        """
+
+        return self.body.decode(encoding)
+
+
+def _read_validator(path):
+    """ If-Range value kept for a partial download
+
+    :param path: string path of the validator file
+    :return: string or None when there's none
+    """
+
+    try:
+        with open(path, 'r') as validator_file:
+            return validator_file.read().strip() or None
+    except OSError:
+        return None
+
+def _write_validator(path, response):
+    """ Keeps the strong ETag, or else the Last-Modified, of a response
+
+    :param path: string path of the validator file
+    :param response: http.client.HTTPResponse of the whole file
+    """
+
+    etag = response.getheader('ETag')
+
+    # If-Range only takes strong validators
+    if etag is not None and etag.startswith('W/'):
+        etag = None
+
+    validator = etag or response.getheader('Last-Modified')
+
+    if validator is None:
+        _remove_validator(path)
+        return
+
+    with atomic_file.write(path) as validator_file:
+        validator_file.write(validator)
+
+def _remove_validator(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class HttpClient:
+    """ Keep-alive http client reusing connections per host
+
+    A module level client lives as long as the lambda container, so warm
+    invocations skip the tcp and tls handshakes.
+    """
+
+    __MAX_REDIRECTS = 5
+    __RETRY_STATUSES = (429, 500, 502, 503, 504)
+    __REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+
+    def __init__(self, timeout=HTTP_TIMEOUT, retries=HTTP_RETRIES, backoff=HTTP_BACKOFF, max_idle=4, max_idle_seconds=HTTP_MAX_IDLE_SECONDS):
+        """
+        :param timeout: seconds to wait on connect and on each read
+        :param retries: attempts after the first one
+        :param backoff: seconds to wait before the first retry
+        :param max_idle: idle connections kept per host
+        :param max_idle_seconds: seconds an idle connection is kept
+        """
+
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_idle = max_idle
+        self.max_idle_seconds = max_idle_seconds
+
+        self.__idle = {}
+        self.__lock = threading.Lock()
+
+        self.connections_opened = 0
+        self.connections_reused = 0
+        self.connections_stale = 0
+
+    def get(self, url, headers=None):
+        """ Sends a get request and reads the whole response
+
+        :param url: string url
+        :param headers: dictionary of extra request headers
+        :return: Response
+        """
+
+        request_headers = {'Accept-Encoding': 'gzip'}
+        request_headers.update(headers or {})
+
+        with self.stream(url, headers=request_headers) as response:
+            body = response.read()
+
+        if response.getheader('Content-Encoding', '').lower() == 'gzip':
+            body = gzip.decompress(body)
+
+        return Response(response.url, response.status, response.headers, body)
+
+    @contextlib.contextmanager
+    def stream(self, url, headers=None, ok=(200, 206)):
+        """ Sends a get request and yields the response unread
+
+        The connection goes back to the pool once the body has been read to
+        the end, otherwise it is closed.
+
+        :param url: string url
+        :param headers: dictionary of extra request headers
+        :param ok: tuple of statuses returned to the caller
+        :return: context manager of http.client.HTTPResponse with a url attribute
+        """
+
+        connection, response = self.__request(url, headers or {}, ok)
+
+        try:
+            yield response
+        except BaseException:
+            connection.close()
+            raise
+        else:
+            self.__release(connection, response)
+
+    def download(self, url, path, chunk_size=64 * 1024):
+        """ Streams a url into a file, resuming where an earlier try stopped
+
+        Bytes already in path are kept and the rest is asked for with a
+        range request. Interrupted transfers are resumed the same way, up to
+        the client's retries. The file is complete when this returns.
+
+        The ETag or Last-Modified of the response is kept next to the file
+        until it is complete and sent as If-Range, so a file changed on the
+        server is downloaded again rather than stitched to the old bytes.
+        Without a validator the download starts over.
+
+        :param url: string url
+        :param path: string path of the partial file
+        :param chunk_size: integer of bytes read at a time
+        :return: dictionary with bytes, seconds, bytes_per_second and resumed
+        """
+
+        start_time = time.monotonic()
+
+        validator_path = path + '.validator'
+
+        received = 0
+        resumed = 0
+        attempt = 0
+
+        while True:
+
+            offset = os.path.getsize(path) if os.path.exists(path) else 0
+            validator = _read_validator(validator_path) if offset > 0 else None
+
+            headers = {'Accept-Encoding': 'identity'}
+
+            if validator is not None:
+                headers['Range'] = 'bytes={}-'.format(offset)
+                headers['If-Range'] = validator
+            else:
+                offset = 0
+
+            try:
+                with self.stream(url, headers=headers) as response:
+
+                    total = self.__expected_size(response, offset)
+
+                    # servers without range support send everything again
+                    mode = 'ab' if response.status == 206 else 'wb'
+
+                    if mode == 'ab':
+                        resumed += 1
+                    else:
+                        offset = 0
+                        _write_validator(validator_path, response)
+
+                    with open(path, mode) as out_file:
+                        while True:
+                            chunk = response.read(chunk_size)
+
+                            if not chunk:
+                                break
+
+                            out_file.write(chunk)
+                            received += len(chunk)
+
+                size = os.path.getsize(path)
+
+                if total is not None and size != total:
+                    raise http.client.IncompleteRead(b'', total - size)
+
+                _remove_validator(validator_path)
+
+                break
+
+            except _TRANSIENT_ERRORS as e:
+
+                if attempt >= self.retries:
+                    raise DownloadError('download of {} failed: {}'.format(url, e)) from e
+
+                logging.warning('download resume %s at %s bytes: %s', url, os.path.getsize(path) if os.path.exists(path) else 0, e)
+
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+        seconds = time.monotonic() - start_time
+
+        stats = {
+            'bytes': received,
+            'seconds': seconds,
+            'bytes_per_second': received / seconds if seconds > 0 else None,
+            'resumed': resumed
+        }
+
+        logging.info('download %s: %s', url, stats)
+
+        return stats
+
+    def __expected_size(self, response, offset):
+        """ Size the whole file will have once the response is written
+
+        :param response: http.client.HTTPResponse
+        :param offset: integer of bytes asked to skip
+        :return: integer of bytes or None when the server doesn't say
+        """
+
+        if response.status == 206:
+            content_range = response.getheader('Content-Range', '')
+
+            # bytes <start>-<end>/<total>
+            match = content_range.replace('bytes ', '').split('/')
+
+            if len(match) != 2 or int(match[0].split('-')[0]) != offset:
+                raise DownloadError('unexpected Content-Range {}'.format(content_range))
+
+            if match[1] != '*':
+                return int(match[1])
+
+            length = response.getheader('Content-Length')
+
+            return offset + int(length) if length is not None else None
+
+        length = response.getheader('Content-Length')
+
+        return int(length) if length is not None else None
+
+    def close(self):
+        """ Closes every idle connection """
+
+        with self.__lock:
+            idle = self.__idle
+            self.__idle = {}
+
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def stats(self):
+        """ Connection counters
+
+        :return: dictionary of counters
+        """
+
+        return {
+            'opened': self.connections_opened,
+            'reused': self.connections_reused,
+            'stale': self.connections_stale
+        }
+
+    def __request(self, url, headers, ok):
+        """ Sends a request, following redirects and retrying failures
+
+        :return: tuple of connection and response with status in ok
+        """
+
+        request_headers = {'User-Agent': USER_AGENT}
+        request_headers.update(headers)
+
+        for _ in range(self.__MAX_REDIRECTS + 1):
+
+            connection, response = self.__send(url, request_headers)
+
+            if response.status in self.__REDIRECT_STATUSES:
+                location = response.getheader('Location')
+
+                response.read()
+                self.__release(connection, response)
+
+                url = urllib.parse.urljoin(url, location)
+                continue
+
+            if response.status not in ok:
+                response.read()
+                self.__release(connection, response)
+
+                raise HttpError(response.status, url)
+
+            response.url = url
+
+            return connection, response
+
+        raise HttpError(response.status, url)
+
+    def __send(self, url, headers):
+        """ Sends one request with retries on transient errors
+
+        :return: tuple of connection and response
+        """
+
+        parts = urllib.parse.urlsplit(url)
+
+        path = parts.path or '/'
+
+        if parts.query:
+            path += '?' + parts.query
+
+        attempt = 0
+        fresh = False
+
+        while True:
+
+            connection, reused = self.__acquire(parts.scheme, parts.netloc, fresh)
+
+            try:
+                connection.request('GET', path, headers=headers)
+                response = connection.getresponse()
+            except _TRANSIENT_ERRORS as e:
+                connection.close()
+
+                # the server closed the pooled connection before answering,
+                # a new one goes out at once without using up a retry
+                if reused and isinstance(e, _STALE_ERRORS):
+                    with self.__lock:
+                        self.connections_stale += 1
+
+                    fresh = True
+                    continue
+
+                if attempt >= self.retries:
+                    raise
+
+                logging.warning('http retry %s: %s', url, e)
+            else:
+                if response.status not in self.__RETRY_STATUSES or attempt >= self.retries:
+                    return connection, response
+
+                response.read()
+                self.__release(connection, response)
+
+                logging.warning('http retry %s: status %s', url, response.status)
+
+            time.sleep(self.backoff * 2 ** attempt)
+            attempt += 1
+
+    def __acquire(self, scheme, netloc, fresh=False):
+        """ Takes an idle connection to the host or opens a new one
+
+        :param fresh: boolean true to open a new connection
+        :return: tuple of http.client.HTTPConnection and boolean true when reused
+        """
+
+        expired = []
+
+        with self.__lock:
+            idle = self.__idle.get((scheme, netloc), [])
+
+            # idle longer than the server likely keeps them open
+            deadline = time.monotonic() - self.max_idle_seconds
+
+            while idle and idle[0].idle_since < deadline:
+                expired.append(idle.pop(0))
+
+            connection = None
+
+            if idle and not fresh:
+                self.connections_reused += 1
+                connection = idle.pop()
+            else:
+                self.connections_opened += 1
+
+        for expired_connection in expired:
+            expired_connection.close()
+
+        if connection is not None:
+            return connection, True
+
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        else:
+            connection = http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+        connection.pool_key = (scheme, netloc)
+
+        return connection, False
+
+    def __release(self, connection, response):
+        """ Returns a connection whose response was read to the end """
+
+        if response.will_close or not response.isclosed():
+            connection.close()
+            return
+
+        with self.__lock:
+            idle = self.__idle.setdefault(connection.pool_key, [])
+
+            if len(idle) < self.max_idle:
+                connection.idle_since = time.monotonic()
+                idle.append(connection)
+                return
+
+        connection.close()
+
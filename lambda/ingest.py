@@ -0,0 +1,193 @@
+""" Pre-processes books into ready to serve section artifacts
+
+Each book gets a directory in the output directory holding:
+
+    index.json      the book index Epub builds
+    toc.json        chapter files, titles and section counts
+    sections.json   every section in reading order, already rendered to ssml
+    metadata.json   source, sizes and timing
+    book.prb        the book in the binary book format, see book_file
+
+Books are standardebooks.org title links or local epub files:
+
+    python ingest.py --out artifacts /ebooks/jane-austen/pride-and-prejudice books/war-and-peace.epub
+
+The books listeners ask for most come from the popularity hot set:
+
+    python ingest.py --hot /tmp/popularity/hot.json --out artifacts
+
+With ARTIFACTS_DIR pointing at the output directory, the lambda serves the
+book.prb of a title link without downloading or converting the book.
+"""
+
+import argparse
+import os
+import sys
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import atomic_file
+import book_cache
+import book_file
+import popularity
+import utils
+from epub_parser import Epub, PARSE_WORKERS
+
+
+def is_title_link(source):
+    """ Determines whether a source is a standardebooks.org title link
+
+    :param source: string title link or file path
+    :return: boolean true for title links
+    """
+
+    return source.startswith('/ebooks/')
+
+def artifact_key(source):
+    """ Directory name of a book's artifacts
+
+    Title links use the book cache key, which utils.open_artifact looks up.
+
+    :param source: string title link or file path
+    :return: string key
+    """
+
+    if is_title_link(source):
+        return book_cache.book_key(source)
+
+    return os.path.splitext(os.path.basename(source))[0]
+
+def open_source(source, index_path, parse_workers=PARSE_WORKERS):
+    """ Opens a book, downloading title links into the book cache
+
+    :param source: string title link or file path
+    :param index_path: string path to keep the book index at
+    :param parse_workers: integer of chapters parsed at once
+    :return: epub object
+    """
+
+    if is_title_link(source):
+        key = book_cache.book_key(source)
+
+        if not book_cache.is_cached(key):
+            utils.download_book(key, utils.get_epub_url(source))
+
+        return Epub(zipfile.ZipFile(book_cache.book_path(key)), index_path=index_path, workers=parse_workers)
+
+    return Epub(zipfile.ZipFile(source), index_path=index_path, workers=parse_workers)
+
+def ingest(source, out_dir, parse_workers=PARSE_WORKERS, parse_processes=False):
+    """ Writes the artifacts of one book
+
+    :param source: string title link or file path
+    :param out_dir: string output directory
+    :param parse_workers: integer of chapters parsed at once
+    :param parse_processes: boolean true to parse chapters in worker processes
+    :return: metadata dictionary
+    """
+
+    start = time.perf_counter()
+
+    key = artifact_key(source)
+    book_dir = os.path.join(out_dir, key)
+
+    os.makedirs(book_dir, exist_ok=True)
+
+    epub = open_source(source, os.path.join(book_dir, 'index.json'), parse_workers)
+
+    toc = epub.get_toc()
+
+    # every section in the order listeners hear them
+    sections = [
+        {
+            'file': chapter['file'],
+            'section': chapter['section'],
+            'ssml': utils.render_chapter(chapter)
+        }
+        for chapter in epub.read_sections(processes=parse_processes)
+    ]
+
+    for entry in toc:
+        entry['sections'] = epub.section_count(entry['file'])
+
+    metadata = {
+        'key': key,
+        'source': source,
+        'chapters': len(toc),
+        'sections': len(sections),
+        'characters': sum(len(section['ssml']) for section in sections),
+        'seconds': time.perf_counter() - start
+    }
+
+    atomic_file.write_json(os.path.join(book_dir, 'toc.json'), toc)
+    atomic_file.write_json(os.path.join(book_dir, 'sections.json'), sections)
+    atomic_file.write_json(os.path.join(book_dir, 'metadata.json'), metadata)
+
+    book_file.convert(epub, os.path.join(book_dir, 'book.prb'))
+
+    epub.close()
+
+    return metadata
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Pre-processes books into ready to serve section artifacts.')
+    parser.add_argument('sources', nargs='*', help='standardebooks.org title links or epub files')
+    parser.add_argument('--from-file', help='file with one source per line')
+    parser.add_argument('--hot', help='hot set file from popularity.py')
+    parser.add_argument('--top', type=int, help='books taken from the hot set')
+    parser.add_argument('--out', default='artifacts', help='output directory')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='worker processes')
+    parser.add_argument('--parse-workers', type=int, default=PARSE_WORKERS, help='chapters of a book parsed at once')
+    parser.add_argument('--parse-processes', action='store_true', help='parse chapters in processes rather than threads')
+    args = parser.parse_args(argv)
+
+    sources = list(args.sources)
+
+    if args.from_file:
+        with open(args.from_file) as source_file:
+            sources += [ line.strip() for line in source_file if line.strip() ]
+
+    if args.hot:
+        sources += [ titleLink for titleLink in popularity.hot_titles(args.hot, args.top) if titleLink not in sources ]
+
+    if not sources:
+        parser.error('no books to ingest')
+
+    os.makedirs(args.out, exist_ok=True)
+
+    start = time.perf_counter()
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+
+        futures = {
+            executor.submit(ingest, source, args.out, args.parse_workers, args.parse_processes): source
+            for source in sources
+        }
+
+        for done, future in enumerate(as_completed(futures), 1):
+            source = futures[future]
+
+            try:
+                metadata = future.result()
+            except Exception as e:
+                failed += 1
+                print('[{}/{}] {} failed: {}'.format(done, len(sources), source, e), file=sys.stderr)
+                continue
+
+            print('[{}/{}] {} {} chapters, {} sections in {:.2f}s'.format(
+                done,
+                len(sources),
+                source,
+                metadata['chapters'],
+                metadata['sections'],
+                metadata['seconds']
+            ))
+
+    print('ingested {} of {} books in {:.2f}s'.format(len(sources) - failed, len(sources), time.perf_counter() - start))
+
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
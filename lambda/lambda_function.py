@@ -4,12 +4,24 @@ import ask_sdk_core.utils as ask_utils
 from ask_sdk_core.skill_builder import SkillBuilder
 from ask_sdk_core.dispatch_components import AbstractRequestHandler
 from ask_sdk_core.dispatch_components import AbstractExceptionHandler
+from ask_sdk_core.dispatch_components import AbstractRequestInterceptor
+from ask_sdk_core.dispatch_components import AbstractResponseInterceptor
 from ask_sdk_core.handler_input import HandlerInput
 
 from ask_sdk_model import Response
 import utils
-
-import difflib
+import book_cache
+import bookmarks
+import popularity
+import session
+import tracing
+import warmup
+from matcher import TitleMatcher
+
+# boto3, lxml and asyncio take longer to import than the rest of the skill
+# and most requests never need them, so boto3, epub_parser and book_pipeline
+# are imported inside the functions using them. benchmarks/import_time.py
+# fails when one of them is imported on a cold start.
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
@@ -46,7 +58,7 @@ class OpenBookIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
         
         not_started = False
-        if session_attr["state"] == 'NOT_STARTED':
+        if session_attr.get("state", "NOT_STARTED") == 'NOT_STARTED':
             not_started = True
         
         return correct_intent_name and not_started
@@ -56,7 +68,11 @@ class OpenBookIntentHandler(AbstractRequestHandler):
         
         book_title = handler_input.request_envelope.request.intent.slots["title"].value
         
-        results = utils.query(book_title)
+        with tracing.span('search'):
+            results = utils.query(book_title)
+        
+        for result in results:
+            popularity.record('searches', result['titleLink'])
         
         result_length = len(results)
         
@@ -72,7 +88,7 @@ class OpenBookIntentHandler(AbstractRequestHandler):
             session_attr["book"] = results[0]
         else:
             session_attr["state"] = "SEARCH_RESULTS"
-            session_attr["search_results"] = results
+            session_attr["query"] = book_title
             books = [ book['title'] + ' by ' + book['author'] for book in results ]
             books_string = ' <break time="0.5s"/> , '.join(books)
             speak_output = 'I have found {} results, which would you like? {}'.format(result_length, books_string)
@@ -94,7 +110,7 @@ class ChooseBookIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
         
         search_results = False
-        if session_attr["state"] == 'SEARCH_RESULTS':
+        if session_attr.get("state", "NOT_STARTED") == 'SEARCH_RESULTS':
             search_results = True
             
         book_in_session = False
@@ -108,18 +124,25 @@ class ChooseBookIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
         
         book_title = handler_input.request_envelope.request.intent.slots["title"].value
-        results =session_attr['search_results']
+        # the session keeps the search, the results come from the search caches
+        results = session_attr.get('search_results') or utils.query(session_attr['query'])
         titles = [ result['title'] for result in results ]
 
-        match = difflib.get_close_matches(book_title, titles)[0]
-        
-        matched_book = results[0]
+        match = TitleMatcher(titles).match(book_title)
         
+        if match is None:
+            books = [ book['title'] + ' by ' + book['author'] for book in results ]
+            books_string = ' <break time="0.5s"/> , '.join(books)
+            speak_output = 'Sorry, I didn\'t catch which one. {}'.format(books_string)
+            
+            return (
+                handler_input.response_builder
+                    .speak(speak_output)
+                    .ask(speak_output)
+                    .response
+            )
         
-        for result in results:
-            if result['title'] == match:
-                matched_book = result
-                break
+        matched_book = results[match.index]
         
         session_attr["book"] = matched_book
         
@@ -141,7 +164,7 @@ class ChooseChapterIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
         
         book_has_started = False
-        if session_attr["state"] == 'STARTED':
+        if session_attr.get("state", "NOT_STARTED") == 'STARTED':
             book_has_started = True
         
         return correct_intent_name and book_has_started
@@ -152,11 +175,11 @@ class ChooseChapterIntentHandler(AbstractRequestHandler):
         
         title = handler_input.request_envelope.request.intent.slots["title"].value
         
-        epub = utils.open_zipped_epub()
+        epub = utils.open_session_epub(handler_input)
         
         chapter = epub.read_by_chapter_title(title)
         
-        response = utils.read_chapter(handler_input, chapter)
+        response = utils.read_chapter(handler_input, chapter, epub)
         
         return response
 
@@ -169,7 +192,7 @@ class StartBookIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
             
         book_has_started = False
-        if session_attr["state"] == 'STARTED':
+        if session_attr.get("state", "NOT_STARTED") == 'STARTED':
             book_has_started = True
             
         
@@ -177,11 +200,11 @@ class StartBookIntentHandler(AbstractRequestHandler):
         
     def handle(self, handler_input):
         
-        epub = utils.open_zipped_epub()
+        epub = utils.open_session_epub(handler_input)
         
         chapter = epub.begin()
         
-        response = utils.read_chapter(handler_input, chapter)
+        response = utils.read_chapter(handler_input, chapter, epub)
         
         return response
 
@@ -200,7 +223,7 @@ class ConfirmBookIntentHandler(AbstractRequestHandler):
             search_has_results = True
             
         book_has_started = True
-        if session_attr["state"] != "STARTED":
+        if session_attr.get("state", "NOT_STARTED") != "STARTED":
             book_has_started = False
             
         
@@ -212,11 +235,21 @@ class ConfirmBookIntentHandler(AbstractRequestHandler):
         
         session_attr["state"] = "STARTED"
         
-        session_attr = handler_input.attributes_manager.session_attributes
+        # the book is chosen, its search isn't needed anymore
+        session_attr.pop("query", None)
+        session_attr.pop("search_results", None)
+        
         book = session_attr["book"]
         link = book["titleLink"]
         
-        epub = utils.open_book(link)
+        epub = utils.open_artifact(book_cache.book_key(link))
+        
+        if epub is None:
+            import book_pipeline
+            
+            epub = book_pipeline.open_book(link)
+        
+        popularity.record('opens', link)
         
         toc = epub.get_chapter_titles()
         toc_string = ', <break time="0.5s"/>'.join(toc)
@@ -244,7 +277,7 @@ class NextPageIntentHandler(AbstractRequestHandler):
         
         session_attr = handler_input.attributes_manager.session_attributes
         
-        if session_attr["state"] == "STARTED":
+        if session_attr.get("state", "NOT_STARTED") == "STARTED":
             started = True
             
         return correct_intent_name and started
@@ -254,12 +287,13 @@ class NextPageIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
         
         bookmark = session_attr['bookmark']
-        file = bookmark['file']
         section = bookmark['section']
         
-        epub = utils.open_zipped_epub()
+        epub = utils.open_session_epub(handler_input)
+        file = session.bookmark_file(bookmark, epub)
+        
         chapter = epub.next(file, section)
-        response = utils.read_chapter(handler_input, chapter)
+        response = utils.read_chapter(handler_input, chapter, epub)
         
         return response
 
@@ -273,7 +307,7 @@ class PreviousPageIntentHandler(AbstractRequestHandler):
         
         session_attr = handler_input.attributes_manager.session_attributes
         
-        if session_attr["state"] == "STARTED":
+        if session_attr.get("state", "NOT_STARTED") == "STARTED":
             started = True
             
         return correct_intent_name and started
@@ -283,13 +317,14 @@ class PreviousPageIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
         
         bookmark = session_attr['bookmark']
-        file = bookmark['file']
         section = bookmark['section']
         
-        epub = utils.open_zipped_epub()
+        epub = utils.open_session_epub(handler_input)
+        file = session.bookmark_file(bookmark, epub)
+        
         chapter = epub.previous(file, section)
         
-        response = utils.read_chapter(handler_input, chapter)
+        response = utils.read_chapter(handler_input, chapter, epub)
         
         return response
     
@@ -302,14 +337,14 @@ class ReadChapterIntentHandler(AbstractRequestHandler):
         session_attr = handler_input.attributes_manager.session_attributes
         
         started = False
-        if session_attr["state"] == "STARTED":
+        if session_attr.get("state", "NOT_STARTED") == "STARTED":
             started = True
             
         return correct_intent_name and started
         
     def handle(self, handler_input):
         
-        epub = utils.open_zipped_epub()
+        epub = utils.open_session_epub(handler_input)
         
         slots = handler_input.request_envelope.request.intent.slots
         chapter_slot = slots["chapter"].value
@@ -317,7 +352,50 @@ class ReadChapterIntentHandler(AbstractRequestHandler):
         
         chapter = epub.read(chapter=chapter_slot, part=part_slot)
         
-        response = utils.read_chapter(handler_input, chapter)
+        response = utils.read_chapter(handler_input, chapter, epub)
+        
+        return response
+
+
+class ResumeBookIntentHandler(AbstractRequestHandler):
+    """ Handler for resuming the book read in an earlier session """
+    def can_handle(self, handler_input):
+        
+        return ask_utils.is_intent_name("ResumeBookIntent")(handler_input)
+        
+    def handle(self, handler_input):
+        
+        session_attr = handler_input.attributes_manager.session_attributes
+        
+        record = bookmarks.get_store().get(user_id(handler_input))
+        
+        if record is None:
+            session_attr["state"] = "NOT_STARTED"
+            
+            speak_output = "I don't have a bookmark for you yet. What book would you like me to read?"
+            
+            return (
+                handler_input.response_builder
+                    .speak(speak_output)
+                    .ask(speak_output)
+                    .response
+            )
+        
+        session_attr["state"] = "STARTED"
+        session_attr["book"] = { 'titleLink': record['titleLink'] }
+        
+        # a book still in /tmp opens from its index without going online
+        epub = utils.open_session_epub(handler_input)
+        
+        bookmark = record['bookmark']
+        file = session.bookmark_file(bookmark, epub)
+        
+        if file is None:
+            chapter = epub.begin()
+        else:
+            chapter = epub.read_section(file, bookmark['section'])
+        
+        response = utils.read_chapter(handler_input, chapter, epub)
         
         return response
 
@@ -332,12 +410,12 @@ class HelpIntentHandler(AbstractRequestHandler):
         
         session_attr = handler_input.attributes_manager.session_attributes
         
-        state = session_attr["state"]
+        state = session_attr.get("state", "NOT_STARTED")
         
         if state == "NOT_STARTED" or state == "SEARCH_RESULTS":
             speak_output = "Tell me what to read."
         elif state == "STARTED":
-            epub = utils.open_zipped_epub()
+            epub = utils.open_session_epub(handler_input)
             
             toc = epub.get_chapter_titles()
             toc_string = ', <break time="0.5s"/>'.join(toc)
@@ -365,7 +443,7 @@ class CancelOrStopIntentHandler(AbstractRequestHandler):
         # type: (HandlerInput) -> Response
         session_attr = handler_input.attributes_manager.session_attributes
         
-        state = session_attr["state"]
+        state = session_attr.get("state", "NOT_STARTED")
         
         speak_output = 'Goodbye!'
         reprompt = ''
@@ -378,6 +456,7 @@ class CancelOrStopIntentHandler(AbstractRequestHandler):
             
             session_attr['state'] = 'NOT_STARTED'
             session_attr.pop('search_results', None)
+            session_attr.pop('query', None)
             session_attr.pop('book', None)
             
         elif state == 'STARTED':
@@ -402,8 +481,13 @@ class SessionEndedRequestHandler(AbstractRequestHandler):
 
     def handle(self, handler_input):
         # type: (HandlerInput) -> Response
-
-        # Any cleanup logic goes here.
+        
+        if handler_input.request_envelope.session is not None:
+            session_attr = handler_input.attributes_manager.session_attributes
+            
+            # listeners who leave mid book, counted per chapter
+            if session_attr.get('state') == 'STARTED' and 'book' in session_attr and 'bookmark' in session_attr:
+                popularity.abandoned(session_attr['book']['titleLink'], session_attr['bookmark'])
 
         return handler_input.response_builder.response
 
@@ -443,6 +527,13 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
     def handle(self, handler_input, exception):
         # type: (HandlerInput, Exception) -> Response
         logger.error(exception, exc_info=True)
+        
+        # response interceptors don't run after an exception
+        tracing.finish(error=True)
+        
+        if handler_input.request_envelope.session is not None:
+            session_attr = handler_input.attributes_manager.session_attributes
+            session.replace(session_attr, session.encode(session_attr))
 
         speak_output = "Sorry, I had trouble doing what you asked. Please try again."
 
@@ -454,6 +545,91 @@ class CatchAllExceptionHandler(AbstractExceptionHandler):
                 .response
         )
 
+def user_id(handler_input):
+    """ Alexa user id of a request
+
+    :param handler_input: alexa input
+    :return: string user id
+    """
+    
+    return handler_input.request_envelope.context.system.user.user_id
+
+class BookmarkRequestInterceptor(AbstractRequestInterceptor):
+    """ Reads bookmarks afresh, the user may have read on another container since """
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        bookmarks.begin()
+        
+        if handler_input.request_envelope.session is None:
+            return
+        
+        session_attr = handler_input.attributes_manager.session_attributes
+        
+        # the last response of the session saved it
+        if session_attr.get('state') == 'STARTED' and 'book' in session_attr and 'bookmark' in session_attr:
+            bookmarks.get_store().saved(user_id(handler_input), session_attr['book']['titleLink'], session_attr['bookmark'])
+
+class BookmarkResponseInterceptor(AbstractResponseInterceptor):
+    """ Saves where the user is in their book, once per invocation """
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        if handler_input.request_envelope.session is None:
+            return
+        
+        session_attr = handler_input.attributes_manager.session_attributes
+        
+        if session_attr.get('state') == 'STARTED' and 'book' in session_attr and 'bookmark' in session_attr:
+            bookmarks.get_store().put(user_id(handler_input), session_attr['book']['titleLink'], session_attr['bookmark'])
+        
+        bookmarks.flush()
+
+class PopularityResponseInterceptor(AbstractResponseInterceptor):
+    """ Writes the popularity counts when they are due """
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        popularity.flush()
+
+class SessionRequestInterceptor(AbstractRequestInterceptor):
+    """ Decodes the compact session attributes for the handlers """
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        if handler_input.request_envelope.session is None:
+            return
+        
+        session_attr = handler_input.attributes_manager.session_attributes
+        session.replace(session_attr, session.decode(session_attr))
+
+class SessionResponseInterceptor(AbstractResponseInterceptor):
+    """ Encodes the session attributes sent back with the response """
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        if handler_input.request_envelope.session is None:
+            return
+        
+        session_attr = handler_input.attributes_manager.session_attributes
+        session.replace(session_attr, session.encode(session_attr))
+
+class TracingRequestInterceptor(AbstractRequestInterceptor):
+    """ Starts timing a request, named after its intent or request type """
+    def process(self, handler_input):
+        # type: (HandlerInput) -> None
+        if not tracing.TRACING:
+            return
+        
+        request = handler_input.request_envelope.request
+        name = request.object_type
+        
+        if ask_utils.is_request_type("IntentRequest")(handler_input):
+            name = ask_utils.get_intent_name(handler_input)
+        
+        tracing.start(name)
+
+class TracingResponseInterceptor(AbstractResponseInterceptor):
+    """ Logs the timing of a request once its response is built """
+    def process(self, handler_input, response):
+        # type: (HandlerInput, Response) -> None
+        tracing.finish()
+
 ### routing
 
 sb = SkillBuilder()
@@ -461,7 +637,8 @@ sb = SkillBuilder()
 # launch
 sb.add_request_handler(LaunchRequestHandler())
 
-# custom 
+# custom, resume first, one shot requests come without a session state
+sb.add_request_handler(ResumeBookIntentHandler())
 sb.add_request_handler(StartBookIntentHandler())
 sb.add_request_handler(OpenBookIntentHandler())
 sb.add_request_handler(ChooseBookIntentHandler())
@@ -480,4 +657,34 @@ sb.add_request_handler(SessionEndedRequestHandler())
 # error handling
 sb.add_exception_handler(CatchAllExceptionHandler())
 
-lambda_handler = sb.lambda_handler()
\ No newline at end of file
+# session decoding, before anything reads the session
+sb.add_global_request_interceptor(SessionRequestInterceptor())
+
+# bookmarks read the decoded session, so they are saved before encoding
+sb.add_global_request_interceptor(BookmarkRequestInterceptor())
+sb.add_global_response_interceptor(BookmarkResponseInterceptor())
+
+# popularity counts
+sb.add_global_response_interceptor(PopularityResponseInterceptor())
+
+# session encoding
+sb.add_global_response_interceptor(SessionResponseInterceptor())
+
+# tracing
+sb.add_global_request_interceptor(TracingRequestInterceptor())
+sb.add_global_response_interceptor(TracingResponseInterceptor())
+
+_skill_handler = sb.lambda_handler()
+
+def lambda_handler(event, context):
+    """ Entry point, scheduled warm up pings skip the skill
+
+    :param event: alexa request envelope or warm up event
+    :param context: lambda context
+    :return: alexa response envelope or warm up report
+    """
+
+    if warmup.is_warmup_event(event):
+        return warmup.warm(event, context)
+
+    return _skill_handler(event, context)
@@ -0,0 +1,252 @@
+import collections
+import re
+
+# words that don't tell titles apart
+STOPWORDS = frozenset(['the', 'a', 'an'])
+
+# chapter titles all say chapter, the number is what matters
+CHAPTER_STOPWORDS = STOPWORDS | frozenset(['chapter'])
+
+_UNITS = [
+    'zero', 'one', 'two', 'three', 'four', 'five', 'six', 'seven', 'eight', 'nine',
+    'ten', 'eleven', 'twelve', 'thirteen', 'fourteen', 'fifteen', 'sixteen',
+    'seventeen', 'eighteen', 'nineteen'
+]
+
+_TENS = ['twenty', 'thirty', 'forty', 'fifty', 'sixty', 'seventy', 'eighty', 'ninety']
+
+_ORDINALS = [
+    'zeroth', 'first', 'second', 'third', 'fourth', 'fifth', 'sixth', 'seventh', 'eighth',
+    'ninth', 'tenth', 'eleventh', 'twelfth', 'thirteenth', 'fourteenth', 'fifteenth',
+    'sixteenth', 'seventeenth', 'eighteenth', 'nineteenth'
+]
+
+_NUMBER_WORDS = {}
+_NUMBER_WORDS.update((word, value) for value, word in enumerate(_UNITS))
+_NUMBER_WORDS.update((word, value) for value, word in enumerate(_ORDINALS))
+_NUMBER_WORDS.update((word, (value + 2) * 10) for value, word in enumerate(_TENS))
+_NUMBER_WORDS.update((word[:-1] + 'ieth', (value + 2) * 10) for value, word in enumerate(_TENS))
+
+_ROMAN = re.compile(r'^m{0,3}(cm|cd|d?c{0,3})(xc|xl|l?x{0,3})(ix|iv|v?i{0,3})$')
+_ROMAN_VALUES = {'i': 1, 'v': 5, 'x': 10, 'l': 50, 'c': 100, 'd': 500, 'm': 1000}
+
+# larger numerals are more likely words, like mix
+_ROMAN_MAX = 399
+
+Match = collections.namedtuple('Match', ['index', 'title', 'score'])
+
+
+def roman_to_int(word):
+    """ Value of a roman numeral
+
+    :param word: lowercase string
+    :return: integer or None when word isn't a roman numeral
+    """
+
+    if not word or not _ROMAN.match(word):
+        return None
+
+    total = 0
+
+    for letter, next_letter in zip(word, word[1:] + ' '):
+        value = _ROMAN_VALUES[letter]
+
+        if next_letter != ' ' and _ROMAN_VALUES[next_letter] > value:
+            total -= value
+        else:
+            total += value
+
+    return total
+
+def _fold_numbers(words):
+    """ Replaces spelled out and roman numbers with digits
+
+    'twenty one' and 'xxi' both become '21'.
+
+    :param words: list of lowercase words
+    :return: list of words
+    """
+
+    folded = []
+    number = None
+
+    for word in words:
+
+        value = _NUMBER_WORDS.get(word)
+
+        if value is not None:
+            # twenty one and hundred and twelve, but not one two
+            hundreds = number is not None and number >= 100 and number % 100 == 0 and value < 100
+            tens = number is not None and number >= 20 and number % 10 == 0 and value < 10
+
+            if hundreds or tens:
+                number += value
+            else:
+                if number is not None:
+                    folded.append(str(number))
+                number = value
+            continue
+
+        if word == 'hundred' and number is not None:
+            number *= 100
+            continue
+
+        if word == 'and' and number is not None and number >= 100:
+            continue
+
+        if number is not None:
+            folded.append(str(number))
+            number = None
+
+        roman = roman_to_int(word)
+
+        if roman is not None and roman <= _ROMAN_MAX:
+            folded.append(str(roman))
+        else:
+            folded.append(word)
+
+    if number is not None:
+        folded.append(str(number))
+
+    return folded
+
+def normalize(text, stopwords=STOPWORDS):
+    """ Tokens of a title, lowercase with numbers folded to digits
+
+    :param text: string
+    :param stopwords: words to leave out
+    :return: list of tokens
+    """
+
+    words = re.findall(r'[a-z0-9]+', text.lower())
+
+    return [ word for word in _fold_numbers(words) if word not in stopwords ]
+
+def _numbers(tokens):
+    """ Number tokens of a title, counted
+
+    :param tokens: list of tokens
+    :return: Counter of strings
+    """
+
+    return collections.Counter(token for token in tokens if token.isdigit())
+
+def _words(tokens):
+    """ Tokens of a title that aren't numbers
+
+    :param tokens: list of tokens
+    :return: list of strings
+    """
+
+    return [ token for token in tokens if not token.isdigit() ]
+
+def _trigrams(tokens):
+    """ Character trigrams of the joined tokens
+
+    :param tokens: list of tokens
+    :return: set of strings
+    """
+
+    text = ' {} '.format(' '.join(tokens))
+
+    return { text[i:i + 3] for i in range(len(text) - 2) }
+
+
+class TitleMatcher:
+    """ Fuzzy title lookup, indexed once per book or list of results
+
+    Titles are normalized to tokens and indexed by their character
+    trigrams, so a lookup only scores titles sharing a trigram with it.
+    """
+
+    def __init__(self, titles, stopwords=STOPWORDS, cutoff=0.5):
+        """
+        :param titles: list of strings
+        :param stopwords: words left out of titles and queries
+        :param cutoff: lowest score returned as a match
+        """
+
+        self.__titles = list(titles)
+        self.__stopwords = stopwords
+        self.__cutoff = cutoff
+
+        self.__numbers = []
+        self.__trigrams = []
+        self.__word_trigrams = []
+        self.__index = collections.defaultdict(list)
+
+        for position, title in enumerate(self.__titles):
+            tokens = normalize(title, stopwords)
+            trigrams = _trigrams(tokens)
+
+            self.__numbers.append(_numbers(tokens))
+            self.__trigrams.append(trigrams)
+            self.__word_trigrams.append(_trigrams(_words(tokens)))
+
+            for trigram in trigrams:
+                self.__index[trigram].append(position)
+
+    def match(self, query):
+        """ Best matching title
+
+        :param query: string
+        :return: Match of index, title and score, or None
+        """
+
+        matches = self.matches(query, limit=1)
+
+        return matches[0] if matches else None
+
+    def matches(self, query, limit=3):
+        """ Matching titles, best first
+
+        :param query: string
+        :param limit: integer of matches returned
+        :return: list of Match
+        """
+
+        tokens = normalize(query or '', self.__stopwords)
+
+        if not tokens:
+            return []
+
+        query_numbers = _numbers(tokens)
+        query_trigrams = _trigrams(tokens)
+        query_words = _words(tokens)
+        query_word_trigrams = _trigrams(query_words)
+
+        shared = collections.Counter()
+
+        for trigram in query_trigrams:
+            shared.update(self.__index.get(trigram, ()))
+
+        matches = []
+
+        for position, common in shared.items():
+
+            # trigrams forgive misheard words
+            score = 2 * common / (len(query_trigrams) + len(self.__trigrams[position]))
+
+            # numbers have to be right, chapter 12 isn't chapter 2. They are
+            # counted, so Part 2 Chapter 2 isn't closer to chapter two than
+            # Part 1 Chapter 2, and the words are scored apart from them
+            if query_numbers:
+                title_numbers = self.__numbers[position]
+
+                found = sum((query_numbers & title_numbers).values())
+                number_score = (found / sum(query_numbers.values()) + found / sum((query_numbers | title_numbers).values())) / 2
+
+                if query_words:
+                    word_trigrams = self.__word_trigrams[position]
+                    word_score = 2 * len(query_word_trigrams & word_trigrams) / (len(query_word_trigrams) + len(word_trigrams))
+
+                    score = (word_score + number_score) / 2
+                else:
+                    score = number_score
+
+            if score >= self.__cutoff:
+                matches.append(Match(position, self.__titles[position], score))
+
+        matches.sort(key=lambda match: (-match.score, match.index))
+
+        return matches[:limit]
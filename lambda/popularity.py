@@ -0,0 +1,329 @@
+""" Counts of what listeners search for, open and read, ranked into a hot set
+
+Handlers count per book:
+
+    searches    times the book came up in search results
+    opens       times a listener chose the book
+    sections    sections read
+    abandoned   sessions ended while in a chapter, per toc index
+
+Counting is a dictionary update. The counts are appended to a file of
+this container in POPULARITY_DIR at most every POPULARITY_FLUSH_SECONDS,
+as one json line:
+
+    {"t": 1700000000, "c": {"/ebooks/...": {"opens": 1, "sections": 12, "abandoned/3": 1}}}
+
+The aggregation job folds those lines into totals.json, with older counts
+decayed by POPULARITY_HALF_LIFE_DAYS, and writes the books ranked by score
+to hot.json. The hot set feeds the warm up invocation and pre-ingestion.
+
+/tmp belongs to one container and goes with it, so counts only add up
+when POPULARITY_DIR is on a file system every container mounts, such as
+EFS, and POPULARITY_SHARED is set. The hot set is then written next to the
+counts. Either way a hot set is packaged with the deployment, for warm ups
+of containers without shared counts:
+
+    python popularity.py --dir /mnt/efs/popularity --top 20 --out hot.json
+    python ingest.py --hot hot.json --out artifacts
+"""
+
+import argparse
+import fcntl
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+
+import atomic_file
+
+POPULARITY_DIR = os.environ.get('POPULARITY_DIR', '/tmp/popularity')
+
+# set when POPULARITY_DIR is shared by every container
+POPULARITY_SHARED = os.environ.get('POPULARITY_SHARED', '').lower() in ('1', 'true', 'yes')
+
+POPULARITY_FLUSH_SECONDS = float(os.environ.get('POPULARITY_FLUSH_SECONDS', 30))
+
+POPULARITY_HALF_LIFE_DAYS = float(os.environ.get('POPULARITY_HALF_LIFE_DAYS', 7))
+
+HOT_SET_PATH = os.environ.get('HOT_SET_PATH', os.path.join(POPULARITY_DIR, 'hot.json'))
+
+# hot set shipped with the lambda
+PACKAGED_HOT_SET_PATH = os.environ.get('PACKAGED_HOT_SET_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'hot.json'))
+
+HOT_SET_SIZE = int(os.environ.get('HOT_SET_SIZE', 20))
+
+# score of each counter, a chosen book says more than one in a result list
+SCORE_WEIGHTS = { 'searches': 1.0, 'opens': 5.0, 'sections': 0.5 }
+
+_ABANDONED = 'abandoned/'
+
+_COUNTS_SUFFIX = '.jsonl'
+_TOTALS_NAME = 'totals.json'
+_JOB_LOCK_NAME = 'aggregate.lock'
+
+# one counts file per container, so appends never interleave
+_counts_name = '{}-{}{}'.format(os.getpid(), uuid.uuid4().hex[:8], _COUNTS_SUFFIX)
+
+_lock = threading.Lock()
+
+# title link -> counter name -> count
+_counts = {}
+
+_last_flush = time.monotonic()
+
+
+def record(counter, titleLink, amount=1):
+    """ Counts an event of a book
+
+    :param counter: string searches, opens or sections
+    :param titleLink: string title link of the book
+    :param amount: integer to add
+    """
+
+    with _lock:
+        book = _counts.get(titleLink)
+
+        if book is None:
+            book = _counts[titleLink] = {}
+
+        book[counter] = book.get(counter, 0) + amount
+
+def abandoned(titleLink, bookmark):
+    """ Counts a session that ended while reading a chapter
+
+    :param titleLink: string title link of the book
+    :param bookmark: dictionary from session.bookmark
+    """
+
+    position = bookmark['index'] if 'index' in bookmark else bookmark['file']
+
+    record(_ABANDONED + str(position), titleLink)
+
+def _append(path, line):
+    """ Appends a line, locked against the aggregation job reading the file
+
+    :param path: string path of the counts file
+    :param line: string json line
+    """
+
+    while True:
+        with open(path, 'a') as counts_file:
+            fcntl.flock(counts_file, fcntl.LOCK_EX)
+
+            # the job consumed and removed the file while we waited
+            if os.fstat(counts_file.fileno()).st_nlink == 0:
+                continue
+
+            counts_file.write(line)
+            return
+
+def flush(force=False):
+    """ Appends the counts to this container's file when they are due
+
+    Called once per invocation, only writes every POPULARITY_FLUSH_SECONDS.
+
+    :param force: boolean true to write now
+    :return: integer of books written
+    """
+
+    global _counts, _last_flush
+
+    now = time.monotonic()
+
+    with _lock:
+        if not _counts or (not force and now - _last_flush < POPULARITY_FLUSH_SECONDS):
+            return 0
+
+        counts = _counts
+        _counts = {}
+        _last_flush = now
+
+    line = json.dumps({ 't': int(time.time()), 'c': counts }) + '\n'
+
+    try:
+        os.makedirs(POPULARITY_DIR, exist_ok=True)
+        _append(os.path.join(POPULARITY_DIR, _counts_name), line)
+    except OSError as e:
+        logging.error('popularity: flush failed: %s', e)
+        return 0
+
+    return len(counts)
+
+def _decay(age):
+    """ Weight of counts of a given age
+
+    :param age: number of seconds
+    :return: float between 0 and 1
+    """
+
+    return 0.5 ** (max(age, 0) / (POPULARITY_HALF_LIFE_DAYS * 24 * 60 * 60))
+
+def _add(totals, counts, weight):
+    for titleLink, book_counts in counts.items():
+        book = totals.setdefault(titleLink, {})
+
+        for counter, count in book_counts.items():
+            book[counter] = book.get(counter, 0) + count * weight
+
+def _read_json(path, default):
+    try:
+        with open(path, 'r') as json_file:
+            return json.load(json_file)
+    except (OSError, ValueError):
+        return default
+
+def aggregate(directory=POPULARITY_DIR, now=None):
+    """ Folds the counts files into the decayed totals
+
+    The counts files are removed once their counts are in totals.json.
+
+    :param directory: string directory of the counts files
+    :param now: integer unix time the totals are decayed to
+    :return: dictionary of title link to counter name to decayed count
+    """
+
+    now = int(time.time()) if now is None else now
+
+    os.makedirs(directory, exist_ok=True)
+
+    # one job at a time, each reads the totals the last one wrote
+    with open(os.path.join(directory, _JOB_LOCK_NAME), 'a') as job_lock:
+        fcntl.flock(job_lock, fcntl.LOCK_EX)
+
+        return _aggregate(directory, now)
+
+def _aggregate(directory, now):
+    totals_path = os.path.join(directory, _TOTALS_NAME)
+    previous = _read_json(totals_path, { 't': now, 'c': {} })
+
+    totals = {}
+    _add(totals, previous['c'], _decay(now - previous['t']))
+
+    names = sorted(os.listdir(directory))
+
+    # counts files stay locked until removed, so no append is lost between
+    consumed = []
+
+    try:
+        for name in names:
+            if not name.endswith(_COUNTS_SUFFIX):
+                continue
+
+            path = os.path.join(directory, name)
+
+            try:
+                counts_file = open(path, 'r')
+            except FileNotFoundError:
+                continue
+
+            consumed.append((path, counts_file))
+            fcntl.flock(counts_file, fcntl.LOCK_EX)
+
+            for line in counts_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logging.warning('popularity: skipped a bad line in %s', name)
+                    continue
+
+                _add(totals, entry['c'], _decay(now - entry['t']))
+
+        # totals are written before the counts are removed, a failed job
+        # counts them again rather than losing them
+        atomic_file.write_json(totals_path, { 't': now, 'c': totals })
+
+        for path, _ in consumed:
+            os.remove(path)
+
+    finally:
+        for _, counts_file in consumed:
+            counts_file.close()
+
+    return totals
+
+def score(counts):
+    """ Popularity of a book
+
+    :param counts: dictionary of counter name to count
+    :return: float score
+    """
+
+    return sum(counts.get(counter, 0) * weight for counter, weight in SCORE_WEIGHTS.items())
+
+def hot_set(totals, size=HOT_SET_SIZE):
+    """ Books ranked by score
+
+    :param totals: dictionary from aggregate
+    :param size: integer of books kept
+    :return: list of dictionaries with titleLink, score, counts and abandoned chapters
+    """
+
+    ranked = []
+
+    for titleLink, counts in totals.items():
+        book_score = score(counts)
+
+        if book_score <= 0:
+            continue
+
+        ranked.append({
+            'titleLink': titleLink,
+            'score': round(book_score, 3),
+            'counts': { counter: round(counts.get(counter, 0), 3) for counter in SCORE_WEIGHTS },
+            'abandoned': {
+                counter[len(_ABANDONED):]: round(count, 3)
+                for counter, count in counts.items() if counter.startswith(_ABANDONED)
+            }
+        })
+
+    ranked.sort(key=lambda book: (-book['score'], book['titleLink']))
+
+    return ranked[:size]
+
+def update_hot_set(directory=POPULARITY_DIR, path=HOT_SET_PATH, size=HOT_SET_SIZE):
+    """ Aggregation job, folds the counts and writes the hot set
+
+    :param directory: string directory of the counts files
+    :param path: string path of the hot set
+    :param size: integer of books kept
+    :return: list from hot_set
+    """
+
+    ranked = hot_set(aggregate(directory), size)
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    atomic_file.write_json(path, { 'updated': int(time.time()), 'books': ranked })
+
+    return ranked
+
+def hot_titles(path=HOT_SET_PATH, limit=None):
+    """ Title links of the hot set, most popular first
+
+    :param path: string path of the hot set
+    :param limit: integer of titles, all when None
+    :return: list of title links
+    """
+
+    books = _read_json(path, {}).get('books', [])
+
+    return [ book['titleLink'] for book in books[:limit] ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Folds popularity counts into a ranked hot set.')
+    parser.add_argument('--dir', default=POPULARITY_DIR, help='directory of the counts files')
+    parser.add_argument('--out', default=HOT_SET_PATH, help='hot set file')
+    parser.add_argument('--top', type=int, default=HOT_SET_SIZE, help='books kept')
+    args = parser.parse_args(argv)
+
+    ranked = update_hot_set(args.dir, args.out, args.top)
+
+    for rank, book in enumerate(ranked, 1):
+        print('{:>3}. {:>8.1f}  {}'.format(rank, book['score'], book['titleLink']))
+
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
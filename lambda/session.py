@@ -0,0 +1,168 @@
+""" Compact encoding of the session attributes
+
+Alexa sends the session attributes with every request and the skill sends
+them back with every response, so they are kept small between requests:
+
+    v   version of the encoding
+    s   state, as an index into STATES
+    b   book id, the title link without its /ebooks/ prefix
+    q   search keywords, results are looked up again from the search caches
+    m   bookmark, [toc index, section]
+
+Handlers work on the decoded attributes, which have the long names:
+
+    state       string from STATES
+    book        dictionary with at least titleLink
+    query       string of search keywords
+    bookmark    dictionary with section and index, or file in old sessions
+
+Sessions written before the encoding existed have no version and are
+already decoded. They keep working until they end.
+"""
+
+SESSION_VERSION = 2
+
+STATES = ['NOT_STARTED', 'SEARCH_RESULTS', 'STARTED']
+
+_BOOK_PREFIX = '/ebooks/'
+
+
+def book_id(titleLink):
+    """ Short id of a standardebooks.org book
+
+    :param titleLink: string such as /ebooks/jane-austen/pride-and-prejudice
+    :return: string such as jane-austen/pride-and-prejudice
+    """
+
+    if titleLink.startswith(_BOOK_PREFIX):
+        return titleLink[len(_BOOK_PREFIX):]
+
+    return titleLink
+
+def title_link(book_id):
+    """ Title link of a book id
+
+    :param book_id: string from book_id
+    :return: string title link
+    """
+
+    if book_id.startswith('/'):
+        return book_id
+
+    return _BOOK_PREFIX + book_id
+
+def encode(attributes):
+    """ Compact form of decoded session attributes
+
+    :param attributes: dictionary of decoded attributes
+    :return: dictionary to send in the response
+    """
+
+    # already encoded, such as after a failure before decoding
+    if attributes.get('v') is not None:
+        return dict(attributes)
+
+    compact = {'v': SESSION_VERSION}
+
+    state = attributes.get('state')
+
+    if state in STATES:
+        compact['s'] = STATES.index(state)
+
+    book = attributes.get('book')
+
+    if book:
+        compact['b'] = book_id(book['titleLink'])
+
+    if attributes.get('query'):
+        compact['q'] = attributes['query']
+
+    # results of old sessions still choosing a book
+    if attributes.get('search_results'):
+        compact['r'] = attributes['search_results']
+
+    bookmark = attributes.get('bookmark')
+
+    if bookmark:
+        compact['m'] = [ bookmark['index'] if 'index' in bookmark else bookmark['file'], bookmark['section'] ]
+
+    return compact
+
+def decode(compact):
+    """ Decoded session attributes
+
+    :param compact: dictionary from the request, encoded or from an old session
+    :return: dictionary of decoded attributes
+    """
+
+    if compact.get('v') is None:
+        return dict(compact)
+
+    if compact['v'] != SESSION_VERSION:
+        raise ValueError('unknown session version {}'.format(compact['v']))
+
+    attributes = {}
+
+    if 's' in compact:
+        attributes['state'] = STATES[compact['s']]
+
+    if 'b' in compact:
+        attributes['book'] = { 'titleLink': title_link(compact['b']) }
+
+    if 'q' in compact:
+        attributes['query'] = compact['q']
+
+    if 'r' in compact:
+        attributes['search_results'] = compact['r']
+
+    if 'm' in compact:
+        position, section = compact['m']
+
+        # old sessions bookmarked files, new ones toc indexes
+        key = 'file' if isinstance(position, str) else 'index'
+
+        attributes['bookmark'] = { key: position, 'section': section }
+
+    return attributes
+
+def bookmark(file, section, epub=None):
+    """ Bookmark of a section
+
+    :param file: string of chapter file
+    :param section: integer of section
+    :param epub: book the file is in, bookmarks its toc index when given
+    :return: dictionary for the bookmark attribute
+    """
+
+    index = epub.get_file_index(file) if epub is not None else -1
+
+    if index < 0:
+        return { 'file': file, 'section': section }
+
+    return { 'index': index, 'section': section }
+
+def bookmark_file(bookmark, epub):
+    """ Chapter file of a bookmark
+
+    :param bookmark: dictionary from the bookmark attribute
+    :param epub: book the bookmark is in
+    :return: string of chapter file
+    """
+
+    if 'index' in bookmark:
+        return epub.get_file(bookmark['index'])
+
+    return bookmark['file']
+
+def replace(attributes, values):
+    """ Swaps the contents of the session attributes in place
+
+    The attributes manager hands out the dictionary sent with the response,
+    so it is updated rather than reassigned.
+
+    :param attributes: dictionary of session attributes
+    :param values: dictionary of new contents
+    """
+
+    attributes.clear()
+    attributes.update(values)
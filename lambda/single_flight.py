@@ -0,0 +1,191 @@
+""" Single flight, concurrent callers of the same work wait for one of them
+
+When a book is promoted, many invocations open it at once. Work done under
+a single flight key runs once:
+
+    epub = single_flight.do(key + '.download', lambda: download_and_open(key))
+
+Threads of a process share the first caller's result, or its error. Other
+processes wait on a lock file in SINGLE_FLIGHT_DIR and then run the work
+themselves, which finds the book the first process left in /tmp and only
+opens it. The kernel drops the lock of a process that dies partway, so the
+next waiter takes over and resumes the partial download.
+
+Waiting longer than the timeout raises SingleFlightTimeout.
+"""
+
+import contextlib
+import fcntl
+import os
+import threading
+import time
+
+import tracing
+
+SINGLE_FLIGHT_DIR = os.environ.get('SINGLE_FLIGHT_DIR', '/tmp/locks')
+
+# seconds a caller waits for another to finish
+SINGLE_FLIGHT_TIMEOUT = float(os.environ.get('SINGLE_FLIGHT_TIMEOUT', 20))
+
+# seconds between tries of a lock file held by another process
+_POLL_SECONDS = 0.02
+
+
+class SingleFlightTimeout(TimeoutError):
+    """ Raised when the caller doing the work takes longer than the timeout """
+
+
+class _Call:
+    """ Work in flight and its outcome """
+
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """ Coalesces work by key, across threads and across processes """
+
+    def __init__(self, lock_dir=SINGLE_FLIGHT_DIR):
+        """
+        :param lock_dir: string directory of the lock files, None for threads only
+        """
+
+        self.__lock_dir = lock_dir
+        self.__lock = threading.Lock()
+
+        # key -> _Call of the thread doing the work
+        self.__calls = {}
+
+        self.leaders = 0
+        self.shared = 0
+        self.waited = 0
+
+    def do(self, key, function, timeout=SINGLE_FLIGHT_TIMEOUT):
+        """ Runs the work of a key unless it is already running
+
+        :param key: string, safe to use as a file name
+        :param function: function without arguments doing the work
+        :param timeout: number of seconds to wait for another caller
+        :return: result of function, possibly from another thread
+        """
+
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+
+            if leader:
+                call = self.__calls[key] = _Call()
+                self.leaders += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            with tracing.span('flight_wait'):
+                finished = call.done.wait(timeout)
+
+            if not finished:
+                raise SingleFlightTimeout('{} still running after {}s'.format(key, timeout))
+
+            if call.error is not None:
+                raise call.error
+
+            return call.result
+
+        try:
+            with self.__file_lock(key, timeout):
+                call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            # later callers start over rather than reusing an error
+            with self.__lock:
+                del self.__calls[key]
+
+            call.done.set()
+
+        return call.result
+
+    def stats(self):
+        """ Counters of the work run and shared
+
+        :return: dictionary of counters
+        """
+
+        with self.__lock:
+            return {
+                'leaders': self.leaders,
+                'shared': self.shared,
+                'waited': self.waited,
+                'in_flight': len(self.__calls)
+            }
+
+    @contextlib.contextmanager
+    def __file_lock(self, key, timeout):
+        """ Holds the lock file of a key, waiting for another process
+
+        :param key: string key
+        :param timeout: number of seconds to wait
+        """
+
+        if self.__lock_dir is None:
+            yield
+            return
+
+        os.makedirs(self.__lock_dir, exist_ok=True)
+
+        # lock files are kept, removing one could split waiters between two
+        with open(os.path.join(self.__lock_dir, key + '.lock'), 'a') as lock_file:
+
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                with self.__lock:
+                    self.waited += 1
+
+                with tracing.span('flight_wait'):
+                    self.__wait_for(lock_file, key, timeout)
+
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __wait_for(self, lock_file, key, timeout):
+        deadline = time.monotonic() + timeout
+
+        while True:
+            time.sleep(_POLL_SECONDS)
+
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    raise SingleFlightTimeout('{} locked by another process after {}s'.format(key, timeout))
+
+
+_flights = SingleFlight()
+
+def do(key, function, timeout=SINGLE_FLIGHT_TIMEOUT):
+    """ Runs work once for concurrent callers of this container
+
+    :param key: string, safe to use as a file name
+    :param function: function without arguments doing the work
+    :param timeout: number of seconds to wait for another caller
+    :return: result of function
+    """
+
+    return _flights.do(key, function, timeout)
+
+def stats():
+    """ Counters of the shared single flight
+
+    :return: dictionary of counters
+    """
+
+    return _flights.stats()
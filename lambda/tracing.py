@@ -0,0 +1,231 @@
+""" Timing spans of a request, logged as CloudWatch embedded metrics
+
+A trace is started for each request and every span inside it adds its
+time to the trace. When the request is done the trace is written as one
+json line in the embedded metric format, which CloudWatch turns into
+metrics per handler:
+
+    with tracing.span('search'):
+        results = query(keywords)
+
+Tracing is off unless the TRACING environment variable is set. Spans are
+then a shared object doing nothing. Spans on threads other than the
+request's, such as read ahead, are only recorded for functions passed
+through wrap.
+"""
+
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+TRACING = os.environ.get('TRACING', '').lower() in ('1', 'true', 'yes')
+
+TRACING_NAMESPACE = os.environ.get('TRACING_NAMESPACE', 'PublicReader')
+
+# metric lines go to stdout unformatted, cloudwatch only reads bare json
+logger = logging.getLogger('tracing')
+logger.propagate = False
+
+_handler = logging.StreamHandler(sys.stdout)
+_handler.setFormatter(logging.Formatter('%(message)s'))
+logger.addHandler(_handler)
+logger.setLevel(logging.INFO)
+
+_local = threading.local()
+
+
+class Trace:
+    """ Spans and metrics of one request """
+
+    def __init__(self, name):
+        """
+        :param name: string name of the request, such as the intent name
+        """
+
+        self.name = name
+        self.start = time.perf_counter()
+
+        # span name -> [total milliseconds, count]
+        self.spans = OrderedDict()
+
+        # metric name -> (value, unit)
+        self.metrics = OrderedDict()
+
+        # spans may end on threads working for the request
+        self.__lock = threading.Lock()
+
+    def add_span(self, name, milliseconds):
+        with self.__lock:
+            span = self.spans.setdefault(name, [0.0, 0])
+            span[0] += milliseconds
+            span[1] += 1
+
+    def add_metric(self, name, value, unit):
+        with self.__lock:
+            self.metrics[name] = (value, unit)
+
+    def to_emf(self, error=False):
+        """ Embedded metric format record of the trace
+
+        :param error: boolean true when the request failed
+        :return: dictionary
+        """
+
+        self.add_span('total', (time.perf_counter() - self.start) * 1000)
+
+        record = OrderedDict()
+        record['_aws'] = {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': TRACING_NAMESPACE,
+                'Dimensions': [['handler']],
+                'Metrics': (
+                    [ { 'Name': name, 'Unit': 'Milliseconds' } for name in self.spans ] +
+                    [ { 'Name': name, 'Unit': unit } for name, (_, unit) in self.metrics.items() ]
+                )
+            }]
+        }
+        record['handler'] = self.name
+        record['error'] = error
+
+        for name, (milliseconds, _) in self.spans.items():
+            record[name] = round(milliseconds, 3)
+
+        for name, (value, _) in self.metrics.items():
+            record[name] = value
+
+        # spans entered more than once, such as a chapter extracted twice
+        record['span_counts'] = { name: count for name, (_, count) in self.spans.items() if count > 1 }
+
+        return record
+
+
+class _Span:
+    """ Adds the time spent inside it to a trace """
+
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.trace.add_span(self.name, (time.perf_counter() - self.start) * 1000)
+        return False
+
+
+class _NoSpan:
+    """ Span used without a trace, does nothing """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def current():
+    """ Trace of the request on this thread
+
+    :return: Trace or None
+    """
+
+    return getattr(_local, 'trace', None)
+
+def span(name):
+    """ Times a block of the current request
+
+    :param name: string span name, used as the metric name
+    :return: context manager
+    """
+
+    trace = getattr(_local, 'trace', None)
+
+    if trace is None:
+        return _NO_SPAN
+
+    return _Span(trace, name)
+
+def metric(name, value, unit='None'):
+    """ Records a value of the current request, such as download speed
+
+    :param name: string metric name
+    :param value: number
+    :param unit: string cloudwatch unit, such as Bytes/Second
+    """
+
+    trace = getattr(_local, 'trace', None)
+
+    if trace is not None and value is not None:
+        trace.add_metric(name, value, unit)
+
+def wrap(function):
+    """ Lets a function record into the current trace from another thread
+
+    :param function: function run by an executor for this request
+    :return: function
+    """
+
+    trace = current()
+
+    if trace is None:
+        return function
+
+    def traced(*args, **kwargs):
+        previous = current()
+        _local.trace = trace
+
+        try:
+            return function(*args, **kwargs)
+        finally:
+            _local.trace = previous
+
+    return traced
+
+def start(name):
+    """ Starts the trace of a request on this thread
+
+    :param name: string name of the request
+    """
+
+    if not TRACING:
+        return
+
+    # a request that failed before finishing is still worth a record
+    if current() is not None:
+        finish(error=True)
+
+    _local.trace = Trace(name)
+
+def finish(error=False):
+    """ Ends the current trace and logs it
+
+    :param error: boolean true when the request failed
+    :return: dictionary logged, or None without a trace
+    """
+
+    trace = current()
+
+    if trace is None:
+        return None
+
+    _local.trace = None
+
+    record = trace.to_emf(error=error)
+
+    logger.info(json.dumps(record))
+
+    return record
@@ -1,16 +1,113 @@
 import logging
 import os
-import boto3
-from botocore.exceptions import ClientError
-import urllib.request
-from lxml import etree
-from epub_parser import Epub
-import shutil
+import urllib.parse
+from book_file import BookFile
+import book_file
+from cache import LRUCache, DiskCache
+from http_client import HttpClient
+import book_cache
+import catalog
+import popularity
+import session
+import single_flight
+import tracing
 import zipfile
 import re
-import math
+import collections
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# point at a local stand-in to run without standardebooks.org
+BASE_URL = os.environ.get('STANDARD_EBOOKS_URL', 'https://standardebooks.org')
+
+# 'binary' serves handlers from book files converted once per book
+BOOK_FORMAT = os.environ.get('BOOK_FORMAT', 'epub')
+
+# books pre-processed by ingest.py, served from <key>/book.prb before
+# anything is downloaded or converted, empty for none
+ARTIFACTS_DIR = os.environ.get('ARTIFACTS_DIR', '')
+
+# keep-alive connections shared by warm invocations
+_http = HttpClient()
+
+# open books kept across warm invocations, sized by their extracted text
+EPUB_CACHE_MAX_BYTES = int(os.environ.get('EPUB_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+def _close_epub(key, epub):
+    epub.close()
+
+_epub_cache = LRUCache(max_bytes=EPUB_CACHE_MAX_BYTES, sizeof=lambda epub: epub.memory_usage(), on_evict=_close_epub)
+
+# search results, empty results are kept for less time in case the catalog grows
+SEARCH_CACHE_TTL = int(os.environ.get('SEARCH_CACHE_TTL', 6 * 60 * 60))
+SEARCH_CACHE_NEGATIVE_TTL = int(os.environ.get('SEARCH_CACHE_NEGATIVE_TTL', 5 * 60))
+SEARCH_CACHE_MAX_ENTRIES = int(os.environ.get('SEARCH_CACHE_MAX_ENTRIES', 1024))
+
+# empty to keep search results in memory only
+SEARCH_CACHE_DIR = os.environ.get('SEARCH_CACHE_DIR', '/tmp/search')
+SEARCH_DISK_CACHE_MAX_ENTRIES = int(os.environ.get('SEARCH_DISK_CACHE_MAX_ENTRIES', 4096))
+
+_search_cache = LRUCache(max_entries=SEARCH_CACHE_MAX_ENTRIES)
+_search_disk_cache = DiskCache(SEARCH_CACHE_DIR, max_entries=SEARCH_DISK_CACHE_MAX_ENTRIES) if SEARCH_CACHE_DIR else None
+
+def _search_key(keywords):
+    """ Normalizes a search so different phrasings share a cache entry
+
+    :param keywords: string
+    :return: string of lowercase words
+    """
+    
+    words = re.findall(r'\w+', keywords.lower())
+    
+    return ' '.join(words)
 
 def query(keywords):
+    """ Searches the local catalog, or standardebooks.org until there is one
+
+    Scraped searches are answered from cache when repeated.
+
+    :param keywords: string
+    :return: search results
+    """
+    
+    search_result = catalog.search(keywords)
+    
+    if search_result is not None:
+        return search_result
+    
+    key = _search_key(keywords)
+    
+    search_result = _search_cache.get(key)
+    
+    if search_result is None and _search_disk_cache is not None:
+        entry = _search_disk_cache.get(key)
+        
+        if entry is not None:
+            search_result, ttl = entry
+            _search_cache.put(key, search_result, ttl=ttl)
+    
+    if search_result is None:
+        search_result = _query(keywords)
+        
+        ttl = SEARCH_CACHE_TTL if search_result else SEARCH_CACHE_NEGATIVE_TTL
+        
+        _search_cache.put(key, search_result, ttl=ttl)
+        
+        if _search_disk_cache is not None:
+            _search_disk_cache.put(key, search_result, ttl)
+    
+    # callers keep results in the session, never hand out the cached list
+    return [ dict(item) for item in search_result ]
+
+def search_cache_stats():
+    """ Hit / miss counters of the search cache
+    
+    :return: dictionary of cache counters
+    """
+    
+    return _search_cache.stats()
+
+def _query(keywords):
     """ Uses standardebooks.org query function
 
     :param keywords: string
@@ -18,13 +115,25 @@ def query(keywords):
     """
     
     # url
-    base_url = 'https://standardebooks.org/ebooks/?query='
-    query = re.sub(' ', '+', keywords)
+    base_url = BASE_URL + '/ebooks/?query='
+    query = urllib.parse.quote_plus(keywords)
     url = base_url + query
     
     # html 
-    http = urllib.request.urlopen(url)
-    html = http.read().decode('utf-8')
+    with tracing.span('search_page'):
+        html = _http.get(url).text()
+    
+    return parse_search_page(html)
+
+def parse_search_page(html):
+    """ Reads the books listed on a standardebooks.org search page
+
+    :param html: string of the page
+    :return: search results
+    """
+    
+    from lxml import etree
+    
     parser = etree.HTMLParser()
     tree = etree.fromstring(html, parser=parser)
     
@@ -59,18 +168,49 @@ def query(keywords):
     return search_result
 
 def open_book(titleLink):
-    """ Downloads standardebooks.org epub file
+    """ Downloads standardebooks.org epub file, unless it's already in /tmp
     
     :param titleLink: string
     :return: epub object
     """
     
-    base_url = 'https://standardebooks.org'
+    key = book_cache.book_key(titleLink)
+    
+    if book_cache.is_cached(key):
+        return open_zipped_epub(key)
+    
+    # invocations opening the book at once download it once
+    return single_flight.do(key + '.download', lambda: _download_and_open(titleLink, key))
+
+def _download_and_open(titleLink, key):
+    """ Downloads a book unless another process just did, then opens it
+    
+    :param titleLink: string
+    :param key: string from book_cache.book_key
+    :return: epub object
+    """
+    
+    if not book_cache.is_cached(key):
+        epub_url = get_epub_url(titleLink)
+        
+        download_book(key, epub_url)
+    
+    return open_zipped_epub(key)
+
+def get_epub_url(titleLink):
+    """ Finds the epub download link on a standardebooks.org book page
+    
+    :param titleLink: string
+    :return: string url of the epub
+    """
+    
+    base_url = BASE_URL
     
     url = base_url + titleLink
     
-    http = urllib.request.urlopen(url)
-    html = http.read().decode('utf-8')
+    html = _http.get(url).text()
+    
+    from lxml import etree
     
     parser = etree.HTMLParser()
     
@@ -79,39 +219,275 @@ def open_book(titleLink):
     epub_link = tree.xpath('//section[@id = "download"]/ul/li/p/span/a/@href')[0]
     epub_url = base_url + epub_link
     
-    path = '/tmp/out.zip'
+    return epub_url
+
+def download_book(key, epub_url):
+    """ Downloads an epub into the book cache
+    
+    :param key: string from book_cache.book_key
+    :param epub_url: string url of the epub
+    :return: dictionary of download stats
+    """
+    
+    # a partial file left by an interrupted invocation is resumed
+    path = book_cache.download_path(key)
+    
+    with tracing.span('download'):
+        stats = _http.download(epub_url, path)
+    
+    tracing.metric('download_bytes', stats['bytes'], 'Bytes')
+    tracing.metric('download_bytes_per_second', stats['bytes_per_second'], 'Bytes/Second')
+    
+    with tracing.span('publish'):
+        book_cache.publish(key, path)
+    
+    return stats
+
+def open_zipped_epub(key, toc=None):
+    """ Opens a cached epub, reusing the epub of a warm container
+    
+    :param key: string from book_cache.book_key
+    :param toc: toc already read from the book, saves building it again
+    :return: epub object
+    """
+    
+    path = book_cache.book_path(key)
+    
+    # a rewritten zip has a new size / mtime, so it never hits a stale epub
+    stat = os.stat(path)
+    cache_key = (key, 'epub', stat.st_size, stat.st_mtime_ns)
+    
+    epub = _epub_cache.get(cache_key)
+    
+    if epub is None:
+        # the index is built once, other processes wait and then read it
+        epub = single_flight.do(key + '.epub', lambda: _build_epub(key, cache_key, toc))
+    
+    book_cache.touch(key)
+    
+    logging.info('epub cache: %s', epub_cache_stats())
+    
+    return epub
+
+def _build_epub(key, cache_key, toc):
+    """ Opens a cached epub and puts it in the open epub cache
+    
+    :param key: string from book_cache.book_key
+    :param cache_key: tuple key of this version of the zip
+    :param toc: toc already read from the book, or None
+    :return: epub object
+    """
+    
+    # a caller whose flight just ended has opened it already
+    epub = _epub_cache.get(cache_key) if cache_key in _epub_cache else None
+    
+    if epub is not None:
+        return epub
     
-    # download and copy file to tmp/out.zip
+    # older versions of the same zip can't be read anymore
+    for cached_key in _epub_cache.keys():
+        if cached_key[:2] == (key, 'epub'):
+            _close_epub(cached_key, _epub_cache.pop(cached_key))
     
-    with open(path, 'wb') as out_file:
+    from epub_parser import Epub
+    
+    with tracing.span('zip_open'):
+        epub_zip = zipfile.ZipFile(book_cache.book_path(key))
         
-        response = urllib.request.urlopen(epub_url)
+        epub = Epub(epub_zip, toc=toc)
+    
+    _epub_cache.put(cache_key, epub)
+    
+    return epub
+
+def _convert_book_file(key):
+    """ Converts a cached epub to the binary book format unless it's current
+    
+    :param key: string from book_cache.book_key
+    """
+    
+    path = book_cache.book_file_path(key)
+    zip_stat = os.stat(book_cache.book_path(key))
+    
+    if not os.path.exists(path) or os.stat(path).st_mtime_ns < zip_stat.st_mtime_ns:
+        book_file.convert(open_zipped_epub(key), path)
+
+def open_book_file(key):
+    """ Opens a cached book in the binary book format, converting it once
+    
+    :param key: string from book_cache.book_key
+    :return: BookFile with the same interface as Epub
+    """
+    
+    single_flight.do(key + '.book_file', lambda: _convert_book_file(key))
+    
+    book = _open_cached_book_file(key, 'book_file', book_cache.book_file_path(key))
+    
+    book_cache.touch(key)
+    
+    return book
+
+def artifact_path(key):
+    """ Path of the book file ingest.py wrote for a key
+    
+    :param key: string from book_cache.book_key
+    :return: string path or None when there's no artifact
+    """
+    
+    if not ARTIFACTS_DIR:
+        return None
+    
+    path = os.path.join(ARTIFACTS_DIR, key, 'book.prb')
+    
+    return path if os.path.exists(path) else None
+
+def open_artifact(key):
+    """ Opens the pre-processed book of a key, without downloading it
+    
+    :param key: string from book_cache.book_key
+    :return: BookFile or None when there's no artifact
+    """
+    
+    path = artifact_path(key)
+    
+    if path is None:
+        return None
+    
+    return _open_cached_book_file(key, 'artifact', path)
+
+def _open_cached_book_file(key, kind, path):
+    """ Opens a book file, reusing the one of a warm container
+    
+    :param key: string from book_cache.book_key
+    :param kind: string telling book files of the same key apart
+    :param path: string path of the book file
+    :return: BookFile
+    """
+    
+    stat = os.stat(path)
+    cache_key = (key, kind, stat.st_size, stat.st_mtime_ns)
+    
+    book = _epub_cache.get(cache_key)
+    
+    if book is None:
         
-        shutil.copyfileobj(response, out_file)
+        for cached_key in _epub_cache.keys():
+            if cached_key[:2] == (key, kind):
+                _close_epub(cached_key, _epub_cache.pop(cached_key))
         
-    return open_zipped_epub()
+        book = BookFile(path)
+        
+        _epub_cache.put(cache_key, book)
+    
+    return book
 
+def open_session_epub(handler_input):
+    """ Opens the epub of the book chosen in this session
 
-def open_zipped_epub():
-    """ Opens epub in tmp/out.zip 
+    A pre-processed artifact of the book is served as is. Otherwise the
+    book is downloaded again when this container doesn't have it, so every
+    handler reads the book in the session's bookmark.
     
+    :param handler_input: alexa input
     :return: epub object
     """
     
-    path = '/tmp/out.zip'
+    session_attr = handler_input.attributes_manager.session_attributes
+    
+    book = session_attr.get('book') or {}
+    titleLink = book.get('titleLink')
+    
+    key = book_cache.book_key(titleLink) if titleLink is not None else None
+    
+    artifact = open_artifact(key) if key is not None else None
+    
+    if artifact is not None:
+        return artifact
+    
+    if titleLink is not None and not book_cache.is_cached(key):
+        open_book(titleLink)
+    
+    if BOOK_FORMAT == 'binary':
+        return open_book_file(key)
+    
+    return open_zipped_epub(key)
 
-    epub_zip = zipfile.ZipFile(path)
+def epub_cache_stats():
+    """ Hit / miss counters of the open epub cache
     
-    epub = Epub(epub_zip)
+    :return: dictionary of cache counters
+    """
     
-    return epub
+    return _epub_cache.stats()
+
+def trim_epub_cache():
+    """ Evicts open epubs that grew past the memory budget while reading """
+    
+    _epub_cache.trim()
+
+# background preparation of the section a listener is likely to ask for next
+READ_AHEAD = os.environ.get('READ_AHEAD', '1') == '1'
+READ_AHEAD_MAX_PENDING = int(os.environ.get('READ_AHEAD_MAX_PENDING', 2))
+
+_read_ahead_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='read-ahead')
+_read_ahead_pending = collections.deque()
+_read_ahead_lock = threading.Lock()
+
+def _read_ahead(epub, file, section):
+    try:
+        epub.prefetch(file, section)
+    except Exception as e:
+        logging.warning('read ahead of %s failed: %s', file, e)
+
+def schedule_read_ahead(epub, file, section):
+    """ Prepares the section after this one on a background thread
+
+    Jobs the listener has already moved past are cancelled before they
+    start, and at most READ_AHEAD_MAX_PENDING are queued, so read ahead
+    never holds up the invocation that scheduled it.
+
+    :param epub: epub object
+    :param file: string of file just read
+    :param section: integer of section just read
+    """
+    
+    if not READ_AHEAD:
+        return
+    
+    with _read_ahead_lock:
+        
+        # a newer position makes queued jobs pointless
+        for future in list(_read_ahead_pending):
+            future.cancel()
+            
+            if future.done():
+                _read_ahead_pending.remove(future)
+        
+        if len(_read_ahead_pending) >= READ_AHEAD_MAX_PENDING:
+            return
+        
+        future = _read_ahead_executor.submit(_read_ahead, epub, file, section)
+        _read_ahead_pending.append(future)
 
-def read_chapter(handler_input, chapter):
+def render_chapter(chapter):
+    """ Ssml alexa speaks for a section
+
+    :param chapter: chapter dictionary object
+    :return: string of ssml
+    """
+    
+    if 'title' in chapter:
+        return 'Reading: ' + chapter['title'] + '<break time="1s"/> ' + chapter['text']
+    
+    return chapter['text']
+
+def read_chapter(handler_input, chapter, epub=None):
     
     """ Generates an alexa response based on chapter text
 
     :param handler_input: alexa input
     :param chapter: chapter dictionary object
+    :param epub: epub the chapter was read from, to read ahead in
     :return: alexa response
     """
     
@@ -133,27 +509,36 @@ def read_chapter(handler_input, chapter):
     file = chapter['file']
     section = chapter['section']
     
-    session_attr["bookmark"] = {
-        'file': file,
-        'section': section
-    }
+    session_attr["bookmark"] = session.bookmark(file, section, epub)
     
-    # speaker output text
-    if 'title' in chapter:
-        speak_output = 'Reading: ' + chapter['title'] + '<break time="1s"/> ' + chapter['text']
-    else:
-        speak_output = chapter['text']
-       
-    # reprompt 
-    reprompt = "Say 'next' and I will continue reading."
-    
-    return (
-        handler_input.response_builder
-            .speak(speak_output)
-            .ask(reprompt)
-            .set_should_end_session(False)
-            .response
-    )
+    book = session_attr.get('book')
+    
+    if book is not None:
+        popularity.record('sections', book['titleLink'])
+    
+    # extracted chapters grow cached epubs, keep them within budget
+    trim_epub_cache()
+    
+    with tracing.span('response_build'):
+        
+        # speaker output text
+        speak_output = render_chapter(chapter)
+           
+        # reprompt 
+        reprompt = "Say 'next' and I will continue reading."
+        
+        response = (
+            handler_input.response_builder
+                .speak(speak_output)
+                .ask(reprompt)
+                .set_should_end_session(False)
+                .response
+        )
+    
+    if epub is not None:
+        schedule_read_ahead(epub, file, section)
+    
+    return response
 
 
 def create_presigned_url(object_name):
@@ -162,6 +547,9 @@ def create_presigned_url(object_name):
     :param object_name: string
     :return: Presigned URL as string. If error, returns None.
     """
+    import boto3
+    from botocore.exceptions import ClientError
+    
     s3_client = boto3.client('s3', config=boto3.session.Config(signature_version='s3v4',s3={'addressing_style': 'path'}))
     try:
         bucket_name = os.environ.get('S3_PERSISTENCE_BUCKET')
@@ -0,0 +1,192 @@
+""" Warm up invocations, filling a container's caches before listeners come
+
+A scheduled rule invokes the function with an event outside the Alexa
+request envelope:
+
+    {"warmup": true}
+    {"warmup": true, "books": ["/ebooks/jane-austen/pride-and-prejudice"], "concurrency": 4}
+
+Scheduled events from EventBridge, with source aws.events, count as warm up
+events too. The books, WARMUP_BOOKS by default or else the first
+WARMUP_HOT_BOOKS of the popularity hot set, are downloaded into /tmp,
+their index built and their first section extracted, while the invocation
+has time left. The hot set is the shared one when POPULARITY_SHARED is set,
+or else the one packaged with the deployment, see popularity. With a concurrency above one, the function invokes itself
+that many times more. The invocations overlap, so Lambda runs them on
+separate containers and each of those warms up as well.
+"""
+
+import json
+import logging
+import os
+import time
+
+import book_cache
+import catalog
+import popularity
+import utils
+
+# comma separated title links
+WARMUP_BOOKS = [ link.strip() for link in os.environ.get('WARMUP_BOOKS', '').split(',') if link.strip() ]
+
+# books taken from the hot set when none are configured
+WARMUP_HOT_BOOKS = int(os.environ.get('WARMUP_HOT_BOOKS', 5))
+
+# milliseconds left untouched for the invocation to return in
+WARMUP_MARGIN_MS = int(os.environ.get('WARMUP_MARGIN_MS', 3000))
+
+# upper bound on self invocations of one warm up
+WARMUP_MAX_CONCURRENCY = int(os.environ.get('WARMUP_MAX_CONCURRENCY', 10))
+
+
+def is_warmup_event(event):
+    """ Determines whether an invocation is a warm up rather than a request
+
+    :param event: lambda event
+    :return: boolean true for warm up events
+    """
+
+    if not isinstance(event, dict) or 'request' in event:
+        return False
+
+    return bool(event.get('warmup')) or event.get('source') == 'aws.events'
+
+def _time_left_ms(context):
+    """ Milliseconds the invocation can still spend
+
+    :param context: lambda context or None when run locally
+    :return: number of milliseconds
+    """
+
+    if context is None:
+        return float('inf')
+
+    return context.get_remaining_time_in_millis() - WARMUP_MARGIN_MS
+
+def warm_book(titleLink):
+    """ Downloads a book, opens it and extracts its first section
+
+    :param titleLink: string
+    :return: dictionary describing what was loaded
+    """
+
+    start = time.perf_counter()
+
+    key = book_cache.book_key(titleLink)
+    book = utils.open_artifact(key)
+    downloaded = book is None and not book_cache.is_cached(key)
+
+    if downloaded:
+        import book_pipeline
+
+        book_pipeline.open_book(titleLink)
+
+    if book is None and utils.BOOK_FORMAT == 'binary':
+        book = utils.open_book_file(key)
+    elif book is None:
+        book = utils.open_zipped_epub(key)
+
+    book.begin()
+
+    return {
+        'titleLink': titleLink,
+        'downloaded': downloaded,
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+def _hot_books():
+    """ Most popular books
+
+    With shared counts the hot set is brought up to date, this container's
+    counts folded in. Otherwise a fresh container has no counts, and the
+    hot set packaged with the deployment ranks the books.
+
+    :return: list of title links
+    """
+
+    if popularity.POPULARITY_SHARED:
+        popularity.flush(force=True)
+
+        try:
+            popularity.update_hot_set(popularity.POPULARITY_DIR, popularity.HOT_SET_PATH)
+        except OSError as e:
+            logging.warning('warmup: hot set not updated: %s', e)
+
+        books = popularity.hot_titles(popularity.HOT_SET_PATH, limit=WARMUP_HOT_BOOKS)
+
+        if books:
+            return books
+
+    return popularity.hot_titles(popularity.PACKAGED_HOT_SET_PATH, limit=WARMUP_HOT_BOOKS)
+
+def _fan_out(context, concurrency, books):
+    """ Invokes the function again so more containers warm up
+
+    :param context: lambda context
+    :param concurrency: integer of containers to warm up, this one included
+    :param books: list of title links
+    :return: integer of invocations started
+    """
+
+    import boto3
+
+    client = boto3.client('lambda')
+    payload = json.dumps({ 'warmup': True, 'books': books, 'fanned_out': True }).encode('utf-8')
+
+    started = 0
+
+    for _ in range(concurrency - 1):
+        try:
+            client.invoke(FunctionName=context.invoked_function_arn, InvocationType='Event', Payload=payload)
+            started += 1
+        except Exception as e:
+            logging.warning('warmup: invoke failed: %s', e)
+
+    return started
+
+def warm(event, context):
+    """ Fills the caches with books while the invocation has time
+
+    :param event: warm up event
+    :param context: lambda context or None when run locally
+    :return: dictionary report of the books loaded, skipped and failed
+    """
+
+    start = time.perf_counter()
+
+    books = event.get('books') or WARMUP_BOOKS or _hot_books()
+    concurrency = min(int(event.get('concurrency', 1)), WARMUP_MAX_CONCURRENCY)
+
+    report = {
+        'warmup': True,
+        'invoked': 0,
+        'catalog': None,
+        'loaded': [],
+        'skipped': [],
+        'failed': []
+    }
+
+    if concurrency > 1 and not event.get('fanned_out') and context is not None:
+        report['invoked'] = _fan_out(context, concurrency, books)
+
+    search_catalog = catalog.get_catalog()
+    report['catalog'] = len(search_catalog) if search_catalog is not None else None
+
+    for titleLink in books:
+
+        if _time_left_ms(context) <= 0:
+            report['skipped'].append(titleLink)
+            continue
+
+        try:
+            report['loaded'].append(warm_book(titleLink))
+        except Exception as e:
+            logging.warning('warmup: %s failed: %s', titleLink, e)
+            report['failed'].append({ 'titleLink': titleLink, 'error': str(e) })
+
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    report['epub_cache'] = utils.epub_cache_stats()
+
+    logging.info('warmup: %s', json.dumps(report))
+
+    return report
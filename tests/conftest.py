@@ -0,0 +1,41 @@
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'lambda'))
+sys.path.insert(0, os.path.join(TESTS_DIR, '..', 'benchmarks'))
+sys.path.insert(0, TESTS_DIR)
+
+from stand_in import StandIn
+
+
+@pytest.fixture
+def stand_in():
+    server = StandIn()
+
+    yield server
+
+    server.close()
+
+@pytest.fixture
+def container(stand_in, monkeypatch, tmp_path):
+    """ A fresh container talking to the stand-in, its /tmp in tmp_path
+
+    :return: string path of the container's /tmp
+    """
+
+    import book_cache
+    import single_flight
+    import utils
+    from cache import DiskCache
+
+    monkeypatch.setattr(utils, 'BASE_URL', stand_in.url)
+    monkeypatch.setattr(utils, 'ARTIFACTS_DIR', '')
+    monkeypatch.setattr(utils, '_search_disk_cache', DiskCache(str(tmp_path / 'search')))
+    monkeypatch.setattr(book_cache, 'BOOK_CACHE_DIR', str(tmp_path / 'books'))
+    monkeypatch.setattr(single_flight, '_flights', single_flight.SingleFlight(str(tmp_path / 'locks')))
+
+    return str(tmp_path)
@@ -0,0 +1,159 @@
+""" Stand-in for the parts of the Alexa skills kit the skill uses
+
+The deployment installs ask-sdk-core, tests run without it. install puts
+modules with the names lambda_function imports into sys.modules:
+
+    fake_ask_sdk.install()
+    import lambda_function
+
+Handler inputs are built with handler_input, and the response builder
+keeps what the skill said.
+"""
+
+import sys
+import types
+
+
+class AbstractRequestHandler:
+    pass
+
+
+class AbstractExceptionHandler:
+    pass
+
+
+class AbstractRequestInterceptor:
+    pass
+
+
+class AbstractResponseInterceptor:
+    pass
+
+
+class SkillBuilder:
+    """ Keeps the handlers and interceptors in the order they're added """
+
+    def __init__(self):
+        self.request_handlers = []
+        self.exception_handlers = []
+        self.request_interceptors = []
+        self.response_interceptors = []
+
+    def add_request_handler(self, handler):
+        self.request_handlers.append(handler)
+
+    def add_exception_handler(self, handler):
+        self.exception_handlers.append(handler)
+
+    def add_global_request_interceptor(self, interceptor):
+        self.request_interceptors.append(interceptor)
+
+    def add_global_response_interceptor(self, interceptor):
+        self.response_interceptors.append(interceptor)
+
+    def lambda_handler(self):
+        return self.dispatch
+
+    def dispatch(self, handler_input, context=None):
+        """ Runs a handler input through the skill like the sdk does
+
+        :param handler_input: from handler_input
+        :param context: ignored
+        :return: dictionary response
+        """
+
+        for interceptor in self.request_interceptors:
+            interceptor.process(handler_input)
+
+        handler = next(handler for handler in self.request_handlers if handler.can_handle(handler_input))
+        response = handler.handle(handler_input)
+
+        for interceptor in self.response_interceptors:
+            interceptor.process(handler_input, response)
+
+        return response
+
+
+class ResponseBuilder:
+    """ Keeps what the skill says """
+
+    def __init__(self):
+        self.response = {}
+
+    def speak(self, speech, *args, **kwargs):
+        self.response['speak'] = speech
+        return self
+
+    def ask(self, reprompt, *args, **kwargs):
+        self.response['ask'] = reprompt
+        return self
+
+    def set_should_end_session(self, end):
+        self.response['end'] = end
+        return self
+
+    def add_directive(self, directive):
+        self.response.setdefault('directives', []).append(directive)
+        return self
+
+
+def is_request_type(request_type):
+    return lambda handler_input: handler_input.request_envelope.request.object_type == request_type
+
+def is_intent_name(name):
+    return lambda handler_input: is_request_type('IntentRequest')(handler_input) and handler_input.request_envelope.request.intent.name == name
+
+def get_intent_name(handler_input):
+    return handler_input.request_envelope.request.intent.name
+
+def handler_input(intent=None, slots=None, attributes=None, user_id='user', request_type='IntentRequest', session=True):
+    """ Handler input of one request
+
+    :param intent: string intent name
+    :param slots: dictionary of slot name to value
+    :param attributes: dictionary of session attributes, kept by reference
+    :param user_id: string alexa user id
+    :param request_type: string such as IntentRequest or LaunchRequest
+    :param session: false for requests without a session
+    :return: object shaped like ask_sdk_core.handler_input.HandlerInput
+    """
+
+    intent_slots = { name: types.SimpleNamespace(value=value) for name, value in (slots or {}).items() }
+
+    request = types.SimpleNamespace(
+        object_type=request_type,
+        intent=types.SimpleNamespace(name=intent, slots=intent_slots)
+    )
+
+    envelope = types.SimpleNamespace(
+        request=request,
+        session=types.SimpleNamespace() if session else None,
+        context=types.SimpleNamespace(system=types.SimpleNamespace(user=types.SimpleNamespace(user_id=user_id)))
+    )
+
+    return types.SimpleNamespace(
+        request_envelope=envelope,
+        attributes_manager=types.SimpleNamespace(session_attributes=attributes if attributes is not None else {}),
+        response_builder=ResponseBuilder()
+    )
+
+def install():
+    """ Puts the stand-in modules in place of ask_sdk_core and ask_sdk_model """
+
+    def module(name, **attributes):
+        value = types.ModuleType(name)
+        value.__dict__.update(attributes)
+        sys.modules[name] = value
+
+    module('ask_sdk_core')
+    module('ask_sdk_core.utils', is_request_type=is_request_type, is_intent_name=is_intent_name, get_intent_name=get_intent_name)
+    module('ask_sdk_core.skill_builder', SkillBuilder=SkillBuilder)
+    module(
+        'ask_sdk_core.dispatch_components',
+        AbstractRequestHandler=AbstractRequestHandler,
+        AbstractExceptionHandler=AbstractExceptionHandler,
+        AbstractRequestInterceptor=AbstractRequestInterceptor,
+        AbstractResponseInterceptor=AbstractResponseInterceptor
+    )
+    module('ask_sdk_core.handler_input', HandlerInput=object)
+    module('ask_sdk_model', Response=dict)
@@ -0,0 +1,176 @@
+""" Local stand-in for standardebooks.org, serving the fixtures
+
+    /ebooks/?query=...      search page, gzipped when asked for
+    /ebooks/<author>/<book> book page linking to the epub
+    /downloads/book.epub    the fixture epub, with range requests and an etag
+    /redirect               302 to the epub
+    /feeds/opds/all         the catalog feed
+
+Tests change how it answers through the stand-in's settings:
+
+    truncate    bytes of the epub sent before the connection is dropped, once
+    slow        seconds slept between 16KB chunks of the epub
+    fail        statuses answered, one per request, before answering normally
+    ranges      false to ignore range requests
+    epub        bytes served as the epub, a new etag comes with new bytes
+"""
+
+import gzip
+import hashlib
+import http.server
+import os
+import socketserver
+import threading
+import time
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def fixture(name):
+    """ Bytes of a fixture file
+
+    :param name: string file name in fixtures
+    :return: bytes
+    """
+
+    with open(os.path.join(FIXTURES, name), 'rb') as fixture_file:
+        return fixture_file.read()
+
+
+class _Server(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        stand_in = self.server.stand_in
+        stand_in.requests.append((self.path, dict(self.headers)))
+
+        if stand_in.fail:
+            status = stand_in.fail.pop(0)
+            return self.send_body(status, b'')
+
+        if self.path.startswith('/ebooks/?query='):
+            return self.send_body(200, fixture('search.html'), compress=True)
+
+        if self.path == '/redirect':
+            self.send_response(302)
+            self.send_header('Location', '/downloads/book.epub')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        if self.path == '/feeds/opds/all':
+            return self.send_body(200, fixture('feed.xml'), compress=True)
+
+        if self.path == '/downloads/book.epub':
+            return self.send_epub(stand_in)
+
+        if self.path.startswith('/ebooks/'):
+            return self.send_body(200, fixture('book.html'), compress=True)
+
+        self.send_body(404, b'')
+
+    def send_body(self, status, body, compress=False):
+        self.send_response(status)
+
+        if compress and 'gzip' in self.headers.get('Accept-Encoding', ''):
+            body = gzip.compress(body)
+            self.send_header('Content-Encoding', 'gzip')
+
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_epub(self, stand_in):
+        data = stand_in.epub
+        etag = '"{}"'.format(hashlib.sha1(data).hexdigest()[:16])
+
+        start = 0
+        end = len(data)
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+
+        # a stale validator gets the whole new file
+        if range_header and stand_in.ranges and (if_range is None or if_range == etag):
+            first, last = range_header.split('=')[1].split('-')
+
+            if not first:
+                start = max(len(data) - int(last), 0)
+            else:
+                start = int(first)
+                end = min(int(last) + 1, len(data)) if last else len(data)
+
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, end - 1, len(data)))
+        else:
+            self.send_response(200)
+
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', etag)
+        self.end_headers()
+
+        payload = data[start:end]
+
+        if stand_in.truncate is not None:
+            cut = stand_in.truncate
+            stand_in.truncate = None
+
+            self.wfile.write(payload[:cut])
+            self.wfile.flush()
+            self.close_connection = True
+            return
+
+        for offset in range(0, len(payload), 16 * 1024):
+            self.wfile.write(payload[offset:offset + 16 * 1024])
+
+            if stand_in.slow:
+                self.wfile.flush()
+                time.sleep(stand_in.slow)
+
+
+class StandIn:
+    """ Stand-in server on a free local port """
+
+    def __init__(self, keep_alive_timeout=None):
+        """
+        :param keep_alive_timeout: seconds an idle connection is kept open, None for ever
+        """
+
+        self.requests = []
+
+        self.truncate = None
+        self.slow = 0
+        self.fail = []
+        self.ranges = True
+        self.epub = fixture('book.epub')
+
+        handler = type('Handler', (_Handler,), { 'timeout': keep_alive_timeout })
+
+        self.__server = _Server(('127.0.0.1', 0), handler)
+        self.__server.stand_in = self
+
+        self.url = 'http://127.0.0.1:{}'.format(self.__server.server_address[1])
+
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+        self.__thread.start()
+
+    def paths(self, prefix=''):
+        """ Paths requested so far
+
+        :param prefix: string paths start with
+        :return: list of strings
+        """
+
+        return [ path for path, _ in self.requests if path.startswith(prefix) ]
+
+    def close(self):
+        self.__server.shutdown()
+        self.__server.server_close()
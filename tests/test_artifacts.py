@@ -0,0 +1,49 @@
+import types
+
+import pytest
+
+import book_cache
+import ingest
+import utils
+
+TITLE_LINK = '/ebooks/jane-austen/emma'
+
+
+@pytest.fixture
+def artifacts(container, monkeypatch, tmp_path):
+    """ Artifacts of the fixture book ingested from the stand-in """
+
+    out_dir = str(tmp_path / 'artifacts')
+    ingest.ingest(TITLE_LINK, out_dir)
+
+    monkeypatch.setattr(utils, 'ARTIFACTS_DIR', out_dir)
+
+    return out_dir
+
+def handler_input(book):
+    attributes_manager = types.SimpleNamespace(session_attributes={'book': book})
+
+    return types.SimpleNamespace(attributes_manager=attributes_manager)
+
+def test_artifact_is_found_by_title_link(artifacts):
+    key = book_cache.book_key(TITLE_LINK)
+
+    assert ingest.artifact_key(TITLE_LINK) == key
+    assert utils.artifact_path(key).startswith(artifacts)
+    assert utils.artifact_path(book_cache.book_key('/ebooks/jane-austen/persuasion')) is None
+
+def test_session_book_is_served_from_its_artifact(artifacts, stand_in, monkeypatch, tmp_path):
+    # a new container, nothing downloaded yet
+    monkeypatch.setattr(book_cache, 'BOOK_CACHE_DIR', str(tmp_path / 'empty'))
+    requests = len(stand_in.requests)
+
+    book = utils.open_session_epub(handler_input({'titleLink': TITLE_LINK}))
+
+    assert len(stand_in.requests) == requests
+    assert book is utils.open_artifact(book_cache.book_key(TITLE_LINK))
+    assert book.begin()['text']
+
+def test_without_artifacts_the_book_is_downloaded(stand_in, container):
+    utils.open_session_epub(handler_input({'titleLink': TITLE_LINK}))
+
+    assert stand_in.paths('/downloads/') == ['/downloads/book.epub']
@@ -0,0 +1,30 @@
+import json
+import os
+
+import pytest
+
+import atomic_file
+
+
+def test_write_json_replaces_the_file(tmp_path):
+    path = str(tmp_path / 'value.json')
+
+    atomic_file.write_json(path, {'old': True})
+    atomic_file.write_json(path, {'new': True})
+
+    assert json.load(open(path)) == {'new': True}
+    assert os.listdir(str(tmp_path)) == ['value.json']
+
+def test_failed_write_keeps_the_old_file(tmp_path):
+    path = str(tmp_path / 'book.prb')
+
+    with atomic_file.write(path, 'wb') as book_file:
+        book_file.write(b'old')
+
+    with pytest.raises(ValueError):
+        with atomic_file.write(path, 'wb') as book_file:
+            book_file.write(b'half')
+            raise ValueError('conversion failed')
+
+    assert open(path, 'rb').read() == b'old'
+    assert os.listdir(str(tmp_path)) == ['book.prb']
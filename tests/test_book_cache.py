@@ -0,0 +1,74 @@
+import io
+import os
+import struct
+import time
+import zipfile
+
+import pytest
+
+import book_cache
+from stand_in import fixture
+
+
+def test_verify_accepts_the_fixture(tmp_path):
+    path = tmp_path / 'book.epub'
+    path.write_bytes(fixture('book.epub'))
+
+    book_cache.verify(str(path))
+
+def test_verify_rejects_a_truncated_zip(tmp_path):
+    path = tmp_path / 'book.epub'
+    path.write_bytes(fixture('book.epub')[:10000])
+
+    with pytest.raises(book_cache.InvalidBookError):
+        book_cache.verify(str(path))
+
+def test_verify_rejects_corrupt_file_data(tmp_path):
+    data = bytearray(fixture('book.epub'))
+
+    with zipfile.ZipFile(io.BytesIO(data)) as epub_zip:
+        info = max(epub_zip.infolist(), key=lambda info: info.compress_size)
+
+    # past the local header, whose name and extra lengths end its 30 bytes
+    name_length, extra_length = struct.unpack('<HH', data[info.header_offset + 26:info.header_offset + 30])
+    data_start = info.header_offset + 30 + name_length + extra_length
+
+    # the central directory stays intact, only the bytes of one file change
+    data[data_start + info.compress_size // 2] ^= 0xff
+
+    path = tmp_path / 'book.epub'
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(book_cache.InvalidBookError):
+        book_cache.verify(str(path))
+
+def cache_file(directory, name, size, age=0):
+    path = directory / name
+    path.write_bytes(b'\0' * size)
+
+    used = time.time() - age
+    os.utime(str(path), (used, used))
+
+def test_evict_removes_the_least_recently_used(monkeypatch, tmp_path):
+    monkeypatch.setattr(book_cache, 'BOOK_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(book_cache, 'BOOK_CACHE_MAX_BYTES', 2000)
+
+    cache_file(tmp_path, 'old.epub', 1000, age=300)
+    cache_file(tmp_path, 'old.epub.index', 500, age=300)
+    cache_file(tmp_path, 'new.epub', 1000)
+
+    book_cache.evict()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['new.epub']
+
+def test_evict_skips_downloads_in_progress(monkeypatch, tmp_path):
+    monkeypatch.setattr(book_cache, 'BOOK_CACHE_DIR', str(tmp_path))
+    monkeypatch.setattr(book_cache, 'BOOK_CACHE_MAX_BYTES', 1500)
+
+    cache_file(tmp_path, 'old.epub', 1000, age=300)
+    cache_file(tmp_path, 'downloading.epub.part', 1000)
+    cache_file(tmp_path, 'abandoned.epub.part', 1000, age=300)
+
+    book_cache.evict()
+
+    assert sorted(os.listdir(str(tmp_path))) == ['downloading.epub.part']
@@ -0,0 +1,28 @@
+import logging
+
+import book_pipeline
+import utils
+
+TITLE_LINK = '/ebooks/jane-austen/emma'
+
+
+def test_open_book_falls_back_to_the_book_page(stand_in, container):
+    # the stand-in only serves the epub at the link of its book page
+    epub = book_pipeline.open_book(TITLE_LINK)
+
+    assert epub.get_toc()
+    assert stand_in.paths('/ebooks/jane-austen/emma/downloads/')
+    assert '/downloads/book.epub' in stand_in.paths()
+
+def test_failed_book_page_is_logged(stand_in, container, monkeypatch, caplog):
+    def failing_page(titleLink):
+        raise OSError('book page unreachable')
+
+    monkeypatch.setattr(book_pipeline, 'guess_epub_url', lambda titleLink: stand_in.url + '/downloads/book.epub')
+    monkeypatch.setattr(utils, 'get_epub_url', failing_page)
+
+    with caplog.at_level(logging.INFO):
+        epub = book_pipeline.open_book(TITLE_LINK)
+
+    assert epub.get_toc()
+    assert 'book page unreachable' in caplog.text
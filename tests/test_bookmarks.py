@@ -0,0 +1,179 @@
+import pytest
+
+import bookmarks
+import fake_ask_sdk
+import popularity
+import session
+import utils
+
+TITLE_LINK = '/ebooks/jane-austen/emma'
+
+
+class FakeDynamoDB:
+    """ Client keeping items in memory, throttling the first batch writes
+
+    :param throttled: list of how many requests each batch write leaves unprocessed
+    """
+
+    def __init__(self, throttled=()):
+        self.items = {}
+        self.batches = []
+        self.throttled = list(throttled)
+
+    def get_item(self, TableName, Key, ConsistentRead=False):
+        item = self.items.get((TableName, Key['id']['S']))
+
+        return {} if item is None else {'Item': item}
+
+    def batch_write_item(self, RequestItems):
+        self.batches.append(RequestItems)
+
+        unprocessed = {}
+
+        for table, requests in RequestItems.items():
+            left = self.throttled.pop(0) if self.throttled else 0
+            written = requests[:len(requests) - left]
+
+            for request in written:
+                item = request['PutRequest']['Item']
+                self.items[(table, item['id']['S'])] = item
+
+            if left:
+                unprocessed[table] = requests[len(written):]
+
+        return {'UnprocessedItems': unprocessed}
+
+
+class FailingBackend(bookmarks.MemoryBackend):
+
+    def __init__(self):
+        super().__init__()
+        self.failing = True
+
+    def put_many(self, records):
+        if self.failing:
+            raise OSError('table unreachable')
+
+        super().put_many(records)
+
+
+@pytest.fixture(params=['memory', 'file', 'dynamodb'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        return bookmarks.MemoryBackend()
+
+    if request.param == 'file':
+        return bookmarks.FileBackend(str(tmp_path / 'bookmarks'))
+
+    return bookmarks.DynamoDBBackend('bookmarks', client=FakeDynamoDB())
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(bookmarks.time, 'sleep', lambda seconds: None)
+
+def record(index, section=0, titleLink=TITLE_LINK):
+    return {'titleLink': titleLink, 'bookmark': {'index': index, 'section': section}, 'updated': 1700000000}
+
+def test_backend_round_trip(backend):
+    assert backend.get('user') is None
+
+    backend.put_many({'user': record(3), 'other user': record(1, titleLink='/ebooks/jane-austen/persuasion')})
+    backend.put_many({'user': record(4, 2)})
+
+    assert backend.get('user') == record(4, 2)
+    assert backend.get('other user') == record(1, titleLink='/ebooks/jane-austen/persuasion')
+
+def test_unprocessed_items_are_retried(no_backoff):
+    client = FakeDynamoDB(throttled=[20, 5])
+    backend = bookmarks.DynamoDBBackend('bookmarks', client=client)
+
+    records = { 'user {}'.format(number): record(number) for number in range(30) }
+    backend.put_many(records)
+
+    # 25 items a batch, the throttled ones sent again until none are left
+    assert [ len(batch['bookmarks']) for batch in client.batches ] == [25, 20, 5, 5]
+    assert all( backend.get(user_id) == value for user_id, value in records.items() )
+
+def test_records_are_written_on_flush():
+    backend = bookmarks.MemoryBackend()
+    store = bookmarks.BookmarkStore(backend)
+
+    store.put('user', TITLE_LINK, {'index': 3, 'section': 1})
+
+    assert backend.get('user') is None
+    assert store.get('user')['bookmark'] == {'index': 3, 'section': 1}
+    assert store.flush() == 1
+    assert backend.get('user')['bookmark'] == {'index': 3, 'section': 1}
+    assert store.flush() == 0
+
+def test_failed_flush_keeps_records_pending():
+    backend = FailingBackend()
+    store = bookmarks.BookmarkStore(backend)
+
+    store.put('user', TITLE_LINK, {'index': 3, 'section': 1})
+
+    with pytest.raises(OSError):
+        store.flush()
+
+    # the next invocation brings the same bookmark back with its session
+    store.begin()
+    store.saved('user', TITLE_LINK, {'index': 3, 'section': 1})
+    store.put('user', TITLE_LINK, {'index': 3, 'section': 1})
+
+    assert store.get('user')['bookmark'] == {'index': 3, 'section': 1}
+
+    backend.failing = False
+
+    assert store.flush() == 1
+    assert backend.get('user')['bookmark'] == {'index': 3, 'section': 1}
+
+def test_unchanged_session_bookmark_is_not_written():
+    backend = bookmarks.MemoryBackend()
+    store = bookmarks.BookmarkStore(backend)
+
+    store.begin()
+    store.saved('user', TITLE_LINK, {'index': 3, 'section': 1})
+    store.put('user', TITLE_LINK, {'index': 3, 'section': 1})
+
+    assert store.flush() == 0
+
+    store.put('user', TITLE_LINK, {'index': 3, 'section': 2})
+
+    assert store.flush() == 1
+
+@pytest.fixture
+def skill(container, monkeypatch, tmp_path):
+    """ lambda_function with a store of its own, its book in the container's cache """
+
+    fake_ask_sdk.install()
+
+    import lambda_function
+
+    monkeypatch.setattr(popularity, 'POPULARITY_DIR', str(tmp_path / 'popularity'))
+    monkeypatch.setattr(bookmarks, '_store', bookmarks.BookmarkStore(bookmarks.MemoryBackend()))
+
+    utils.open_session_epub(fake_ask_sdk.handler_input(attributes={'book': {'titleLink': TITLE_LINK}}))
+
+    return lambda_function
+
+def test_resume_reads_the_cached_book_offline(skill, stand_in):
+    store = bookmarks.get_store()
+    store.put('user', TITLE_LINK, {'index': 2, 'section': 0})
+    store.flush()
+
+    requests = len(stand_in.requests)
+    attributes = {}
+
+    response = skill._skill_handler(fake_ask_sdk.handler_input('ResumeBookIntent', attributes=attributes))
+
+    assert len(stand_in.requests) == requests
+    assert response['speak']
+    assert session.decode(attributes)['bookmark'] == {'index': 2, 'section': 0}
+    assert store.writes == 1
+
+def test_request_leaving_the_bookmark_writes_nothing(skill):
+    attributes = session.encode({'state': 'STARTED', 'book': {'titleLink': TITLE_LINK}, 'bookmark': {'index': 2, 'section': 0}})
+
+    skill._skill_handler(fake_ask_sdk.handler_input('AMAZON.HelpIntent', attributes=attributes))
+
+    assert bookmarks.get_store().writes == 0
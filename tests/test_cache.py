@@ -0,0 +1,60 @@
+import os
+
+from cache import DiskCache, LRUCache
+
+
+def test_lru_cache_evicts_the_least_recently_used():
+    cache = LRUCache(max_entries=2)
+
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+
+    assert cache.keys() == ['a', 'c']
+    assert cache.stats()['evictions'] == 1
+
+def test_disk_cache_round_trip(tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    cache.put('pride and prejudice', [{'title': 'Pride and Prejudice'}], 60)
+
+    value, ttl = cache.get('pride and prejudice')
+
+    assert value == [{'title': 'Pride and Prejudice'}]
+    assert 0 < ttl <= 60
+    assert cache.get('emma') is None
+
+def test_disk_cache_removes_expired_entries_on_read(tmp_path):
+    cache = DiskCache(str(tmp_path))
+
+    cache.put('emma', [], -1)
+
+    assert cache.get('emma') is None
+    assert os.listdir(str(tmp_path)) == []
+    assert cache.expirations == 1
+
+def test_disk_cache_keeps_at_most_max_entries(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=3)
+
+    for number in range(5):
+        cache.put('search {}'.format(number), number, 60 + number)
+
+    assert len(os.listdir(str(tmp_path))) == 3
+    assert cache.get('search 0') is None
+    assert cache.get('search 4')[0] == 4
+    assert cache.evictions == 2
+
+def test_disk_cache_removes_expired_entries_first(tmp_path):
+    cache = DiskCache(str(tmp_path), max_entries=3)
+
+    cache.put('expired', None, -1)
+    cache.put('long lived', 1, 600)
+
+    for number in range(2):
+        cache.put('search {}'.format(number), number, 60)
+
+    assert cache.get('expired') is None
+    assert cache.get('long lived') is not None
+    assert cache.expirations == 1
+    assert cache.evictions == 0
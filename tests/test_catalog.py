@@ -0,0 +1,74 @@
+import os
+
+import pytest
+
+import catalog
+from stand_in import FIXTURES, fixture
+
+
+@pytest.fixture
+def no_catalog(monkeypatch, tmp_path):
+    """ Module state of a container without any catalog yet """
+
+    monkeypatch.setattr(catalog, 'CATALOG_PATH', str(tmp_path / 'packaged.json'))
+    monkeypatch.setattr(catalog, 'CATALOG_CACHE_PATH', str(tmp_path / 'refreshed.json'))
+    monkeypatch.setattr(catalog, '_catalog', None)
+    monkeypatch.setattr(catalog, '_refresh_thread', None)
+    monkeypatch.setattr(catalog, '_refresh_failed_at', None)
+
+def test_parse_feed_skips_navigation_entries():
+    books = catalog.parse_feed(fixture('feed.xml'))
+
+    assert [ book['title'] for book in books ] == ['Pride and Prejudice', 'Emma', 'Crime and Punishment']
+    assert books[1] == {
+        'title': 'Emma',
+        'titleLink': '/ebooks/jane-austen/emma',
+        'author': 'Jane Austen',
+        'authorLink': '/ebooks/jane-austen'
+    }
+
+def test_build_step_writes_a_searchable_catalog(tmp_path):
+    out = str(tmp_path / 'catalog.json')
+
+    assert catalog.main(['--feed', os.path.join(FIXTURES, 'feed.xml'), '--out', out]) == 0
+
+    books = catalog.load(out).search('read crime and punishment')
+
+    assert books[0]['titleLink'] == '/ebooks/fyodor-dostoevsky/crime-and-punishment/constance-garnett'
+
+def test_search_by_author(tmp_path):
+    search_catalog = catalog.read_feed(os.path.join(FIXTURES, 'feed.xml'))
+
+    assert [ book['title'] for book in search_catalog.search('jane austen emma') ] == ['Emma']
+    assert search_catalog.search('war and peace') == []
+
+def test_refresh_from_the_feed(stand_in, no_catalog):
+    refreshed = catalog.refresh(stand_in.url + '/feeds/opds/all')
+
+    assert len(refreshed) == 3
+    assert catalog.get_catalog() is refreshed
+    assert len(catalog.load(catalog.CATALOG_CACHE_PATH)) == 3
+
+def test_failed_refresh_waits_for_the_cooldown(monkeypatch, no_catalog):
+    calls = []
+
+    def failing_refresh():
+        calls.append(1)
+        raise OSError('feed unreachable')
+
+    monkeypatch.setattr(catalog, 'refresh', failing_refresh)
+
+    for _ in range(3):
+        assert catalog.search('emma') is None
+
+        if catalog._refresh_thread is not None:
+            catalog._refresh_thread.join()
+
+    assert len(calls) == 1
+
+    monkeypatch.setattr(catalog, 'CATALOG_REFRESH_COOLDOWN', 0)
+
+    assert catalog.refresh_in_background()
+    catalog._refresh_thread.join()
+
+    assert len(calls) == 2
@@ -0,0 +1,116 @@
+import os
+import zipfile
+
+import pytest
+
+import epub_parser
+from epub_parser import Epub, chunk_offsets, iter_chapter_text
+from stand_in import fixture
+from synthetic_epub import make_epub
+
+CHUNK_SIZE = 7500
+
+
+def open_epub(path):
+    return Epub(zipfile.ZipFile(str(path)))
+
+@pytest.fixture
+def book(tmp_path):
+    path = tmp_path / 'book.epub'
+    path.write_bytes(fixture('book.epub'))
+
+    return path
+
+@pytest.fixture
+def builds(monkeypatch):
+    """ Counts the book indexes built rather than loaded """
+
+    build_index = Epub._Epub__build_index
+    counter = []
+
+    def counting(self, toc=None):
+        counter.append(1)
+        return build_index(self, toc)
+
+    monkeypatch.setattr(Epub, '_Epub__build_index', counting)
+
+    return counter
+
+def test_sections_cover_the_chapter_text(book):
+    with zipfile.ZipFile(str(book)) as epub_zip:
+        xmls = [ epub_zip.read(name) for name in epub_zip.namelist() if name.startswith('epub/text/') ]
+
+    for xml in xmls:
+        text = ''.join(iter_chapter_text(xml))
+        offsets = chunk_offsets(text, CHUNK_SIZE)
+        sections = [ text[start:end] for start, end in zip(offsets, offsets[1:]) ]
+
+        assert len(sections) > 1
+        assert ''.join(sections) == text
+        assert max(len(section) for section in sections) <= CHUNK_SIZE
+
+def test_long_sentence_is_split_by_letter_count():
+    text = 'One. ' + 'a' * 25 + '. End.'
+
+    offsets = chunk_offsets(text, 10)
+    sections = [ text[start:end] for start, end in zip(offsets, offsets[1:]) ]
+
+    assert sections == ['One. ', 'a' * 10, 'a' * 10, 'aaaaa. ', 'End.']
+
+def test_empty_chapter_has_no_sections():
+    assert chunk_offsets('', CHUNK_SIZE) == [0]
+
+def test_index_is_reused(book, builds):
+    epub = open_epub(book)
+    chapter = epub.begin()
+
+    assert os.path.exists(str(book) + '.index.json')
+
+    reopened = open_epub(book)
+
+    assert len(builds) == 1
+    assert reopened.get_toc() == epub.get_toc()
+    assert reopened.read_section(chapter['file'], 1) == epub.read_section(chapter['file'], 1)
+
+def test_index_is_rebuilt_when_the_zip_changes(book, tmp_path, builds):
+    open_epub(book).begin()
+
+    # same size, newer mtime
+    stat = os.stat(str(book))
+    os.utime(str(book), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    open_epub(book)
+
+    # another book under the same name
+    make_epub(str(book), chapters=2, chapter_kb=4)
+
+    epub = open_epub(book)
+
+    assert len(builds) == 3
+    assert len(epub.get_toc()) == 4
+
+def test_nav_toc_matches_the_scanned_toc(tmp_path):
+    make_epub(str(tmp_path / 'nav.epub'), chapters=12, chapter_kb=2)
+    make_epub(str(tmp_path / 'scanned.epub'), chapters=12, chapter_kb=2, nav=False)
+
+    toc = open_epub(tmp_path / 'nav.epub').get_toc()
+
+    assert toc == open_epub(tmp_path / 'scanned.epub').get_toc()
+    assert [ chapter['file'] for chapter in toc[1:4] ] == ['epub/text/chapter-1.xhtml', 'epub/text/chapter-2.xhtml', 'epub/text/chapter-3.xhtml']
+    assert toc[10]['title'] == 'Chapter 10'
+
+@pytest.mark.parametrize('nav', [True, False])
+def test_chapters_of_parts_are_prefixed(tmp_path, nav):
+    make_epub(str(tmp_path / 'parts.epub'), chapters=2, chapter_kb=2, parts=2, nav=nav)
+
+    epub = open_epub(tmp_path / 'parts.epub')
+
+    assert epub.has_parts()
+    assert epub.get_chapter_titles() == ['Preface', 'Part 1 Chapter 1', 'Part 1 Chapter 2', 'Part 2 Chapter 1', 'Part 2 Chapter 2', 'Epilogue']
+    assert epub.read(2, part=2)['title'] == 'Part 2 Chapter 2'
+
+def test_books_without_parts_are_not_prefixed(book):
+    epub = open_epub(book)
+
+    assert not epub.has_parts()
+    assert not any( title.startswith('Part') for title in epub.get_chapter_titles() )
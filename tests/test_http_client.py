@@ -0,0 +1,173 @@
+import os
+import time
+import zipfile
+
+import pytest
+
+from http_client import DownloadError, HttpClient, HttpError
+from stand_in import StandIn, fixture
+
+
+def test_get_reuses_the_connection(stand_in):
+    client = HttpClient()
+
+    client.get(stand_in.url + '/ebooks/jane-austen/emma')
+    client.get(stand_in.url + '/ebooks/jane-austen/emma')
+
+    assert client.stats()['opened'] == 1
+    assert client.stats()['reused'] == 1
+
+def test_get_decompresses_gzip(stand_in):
+    response = HttpClient().get(stand_in.url + '/ebooks/?query=pride')
+
+    assert response.body == fixture('search.html')
+    assert stand_in.requests[0][1]['Accept-Encoding'] == 'gzip'
+
+def test_get_follows_redirects(stand_in):
+    response = HttpClient().get(stand_in.url + '/redirect')
+
+    assert response.url == stand_in.url + '/downloads/book.epub'
+    assert response.body == fixture('book.epub')
+
+def test_get_retries_server_errors(stand_in):
+    stand_in.fail = [503, 502]
+
+    response = HttpClient(backoff=0).get(stand_in.url + '/ebooks/jane-austen/emma')
+
+    assert response.status == 200
+    assert len(stand_in.requests) == 3
+
+def test_get_gives_up_after_retries(stand_in):
+    stand_in.fail = [503, 503, 503]
+
+    with pytest.raises(HttpError) as error:
+        HttpClient(retries=1, backoff=0).get(stand_in.url + '/ebooks/jane-austen/emma')
+
+    assert error.value.status == 503
+    assert len(stand_in.requests) == 2
+
+def test_get_does_not_retry_client_errors(stand_in):
+    with pytest.raises(HttpError):
+        HttpClient(backoff=0).get(stand_in.url + '/missing')
+
+    assert len(stand_in.requests) == 1
+
+def test_stale_connection_is_replaced_without_backoff():
+    stand_in = StandIn(keep_alive_timeout=0.1)
+
+    try:
+        # no retries and a long backoff, neither may be used on a stale connection
+        client = HttpClient(retries=0, backoff=5)
+
+        client.get(stand_in.url + '/ebooks/jane-austen/emma')
+        time.sleep(0.3)
+
+        start = time.monotonic()
+        response = client.get(stand_in.url + '/ebooks/jane-austen/emma')
+
+        assert response.status == 200
+        assert time.monotonic() - start < 1
+        assert client.stats()['stale'] == 1
+    finally:
+        stand_in.close()
+
+def test_idle_connections_expire(stand_in):
+    client = HttpClient(max_idle_seconds=0.05)
+
+    client.get(stand_in.url + '/ebooks/jane-austen/emma')
+    time.sleep(0.1)
+    client.get(stand_in.url + '/ebooks/jane-austen/emma')
+
+    assert client.stats()['opened'] == 2
+    assert client.stats()['reused'] == 0
+
+def test_download(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+
+    stats = HttpClient().download(stand_in.url + '/downloads/book.epub', path)
+
+    assert open(path, 'rb').read() == fixture('book.epub')
+    assert stats['bytes'] == len(fixture('book.epub'))
+    assert stats['resumed'] == 0
+
+def test_download_resumes_a_truncated_response(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+    stand_in.truncate = 10000
+
+    stats = HttpClient(backoff=0).download(stand_in.url + '/downloads/book.epub', path)
+
+    assert open(path, 'rb').read() == fixture('book.epub')
+    assert stats['resumed'] == 1
+    assert stand_in.requests[-1][1]['Range'] == 'bytes=10000-'
+
+def test_download_resumes_a_partial_file(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+    stand_in.truncate = 5000
+
+    with pytest.raises(DownloadError):
+        HttpClient(retries=0).download(stand_in.url + '/downloads/book.epub', path)
+
+    etag = open(path + '.validator').read()
+
+    # a later invocation picks up the partial file and its validator
+    stats = HttpClient().download(stand_in.url + '/downloads/book.epub', path)
+
+    assert open(path, 'rb').read() == fixture('book.epub')
+    assert stats['resumed'] == 1
+    assert stand_in.requests[-1][1]['Range'] == 'bytes=5000-'
+    assert stand_in.requests[-1][1]['If-Range'] == etag
+    assert not os.path.exists(path + '.validator')
+
+def test_download_starts_over_when_the_file_changed(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+    stand_in.truncate = 5000
+
+    with pytest.raises(DownloadError):
+        HttpClient(retries=0).download(stand_in.url + '/downloads/book.epub', path)
+
+    stand_in.epub = fixture('book.epub')[:20000] + b'changed' + fixture('book.epub')[20000:]
+
+    stats = HttpClient().download(stand_in.url + '/downloads/book.epub', path)
+
+    assert open(path, 'rb').read() == stand_in.epub
+    assert stats['resumed'] == 0
+    assert 'If-Range' in stand_in.requests[-1][1]
+
+def test_download_starts_over_without_a_validator(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+
+    with open(path, 'wb') as part_file:
+        part_file.write(b'bytes of some other file')
+
+    HttpClient().download(stand_in.url + '/downloads/book.epub', path)
+
+    assert open(path, 'rb').read() == fixture('book.epub')
+    assert 'Range' not in stand_in.requests[-1][1]
+
+def test_download_starts_over_without_range_support(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+    stand_in.truncate = 10000
+    stand_in.ranges = False
+
+    stats = HttpClient(backoff=0).download(stand_in.url + '/downloads/book.epub', path)
+
+    assert open(path, 'rb').read() == fixture('book.epub')
+    assert stats['resumed'] == 0
+
+def test_download_of_a_slow_response(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+    stand_in.slow = 0.05
+
+    HttpClient(timeout=1).download(stand_in.url + '/downloads/book.epub', path)
+
+    assert zipfile.ZipFile(path).testzip() is None
+
+def test_download_times_out_on_a_stalled_response(stand_in, tmp_path):
+    path = str(tmp_path / 'book.epub.part')
+    stand_in.slow = 1
+
+    with pytest.raises(DownloadError):
+        HttpClient(timeout=0.2, retries=0).download(stand_in.url + '/downloads/book.epub', path, chunk_size=16 * 1024)
+
+    # what arrived is kept for the next try
+    assert 0 < os.path.getsize(path) < len(fixture('book.epub'))
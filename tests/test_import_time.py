@@ -0,0 +1,54 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+from import_time import COLD_START_BUDGET_MS, LAMBDA_DIR, LAZY_MODULES
+
+# the stand-in for ask_sdk is only installed where the sdk isn't
+IMPORT = '''
+import importlib.util, json, sys, time
+
+sys.path[:0] = [{lambda_dir!r}, {tests_dir!r}]
+
+if importlib.util.find_spec('ask_sdk_core') is None:
+    import fake_ask_sdk
+    fake_ask_sdk.install()
+
+start = time.perf_counter()
+import {module}
+ms = (time.perf_counter() - start) * 1000
+
+print(json.dumps({{'ms': ms, 'modules': sorted({{ name.split('.')[0] for name in sys.modules }})}}))
+'''
+
+
+def cold_import(module):
+    """ Imports a module in a new interpreter, the fastest of a few runs """
+
+    runs = []
+
+    for _ in range(3):
+        result = subprocess.run(
+            [sys.executable, '-c', IMPORT.format(lambda_dir=LAMBDA_DIR, tests_dir=TESTS_DIR, module=module)],
+            cwd=LAMBDA_DIR,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            universal_newlines=True,
+            check=True
+        )
+
+        runs.append(json.loads(result.stdout))
+
+    return min(runs, key=lambda run: run['ms'])
+
+@pytest.mark.parametrize('module', ['utils', 'lambda_function'])
+def test_cold_import_defers_lazy_modules(module):
+    run = cold_import(module)
+
+    assert [ name for name in LAZY_MODULES if name in run['modules'] ] == []
+    assert run['ms'] < COLD_START_BUDGET_MS
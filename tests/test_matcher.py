@@ -0,0 +1,44 @@
+from matcher import CHAPTER_STOPWORDS, TitleMatcher, normalize, roman_to_int
+
+PARTS = ['Part 1 Chapter I', 'Part 1 Chapter II', 'Part 2 Chapter I', 'Part 2 Chapter II']
+
+
+def test_number_words_fold_to_digits():
+    assert normalize('Chapter Twenty One') == ['chapter', '21']
+    assert normalize('the twelfth night') == ['12', 'night']
+    assert normalize('one hundred and twelve') == ['112']
+    assert normalize('one two') == ['1', '2']
+
+def test_roman_numerals_fold_to_digits():
+    assert roman_to_int('xiv') == 14
+    assert roman_to_int('book') is None
+    assert normalize('mix') == ['mix']
+    assert normalize('Chapter XXI', CHAPTER_STOPWORDS) == ['21']
+
+def test_spoken_and_written_numbers_match():
+    matcher = TitleMatcher(['Chapter I', 'Chapter II', 'Chapter XII', 'Chapter XXI'], CHAPTER_STOPWORDS)
+
+    assert matcher.match('chapter two').index == 1
+    assert matcher.match('chapter twelve').index == 2
+    assert matcher.match('chapter twenty one').index == 3
+    assert matcher.match('chapter three') is None
+
+def test_chapter_of_the_first_part_wins():
+    matcher = TitleMatcher(PARTS, CHAPTER_STOPWORDS)
+
+    assert matcher.match('chapter two').index == 1
+    assert matcher.match('part two chapter two').index == 3
+    assert matcher.match('part one chapter one').index == 0
+
+def test_misheard_titles_match():
+    matcher = TitleMatcher(['Pride and Prejudice', 'Emma', 'Persuasion'])
+
+    assert matcher.match('pried and prejudice').index == 0
+
+def test_nothing_matches():
+    matcher = TitleMatcher(['Pride and Prejudice', 'Emma', 'Persuasion'])
+
+    assert matcher.match('war and peace') is None
+    assert matcher.match('') is None
+    assert matcher.match(None) is None
+    assert TitleMatcher([]).match('emma') is None
@@ -0,0 +1,84 @@
+import json
+import os
+import time
+
+import pytest
+
+import popularity
+
+DAY = 24 * 60 * 60
+NOW = 1700000000
+
+
+@pytest.fixture
+def counts_dir(monkeypatch, tmp_path):
+    directory = tmp_path / 'popularity'
+    directory.mkdir()
+
+    monkeypatch.setattr(popularity, 'POPULARITY_DIR', str(directory))
+    monkeypatch.setattr(popularity, 'POPULARITY_HALF_LIFE_DAYS', 7)
+    monkeypatch.setattr(popularity, '_counts', {})
+
+    return directory
+
+def write_counts(directory, name, *entries):
+    with open(str(directory / name), 'w') as counts_file:
+        for t, counts in entries:
+            counts_file.write(json.dumps({ 't': t, 'c': counts }) + '\n')
+
+def test_flushed_counts_are_aggregated(counts_dir):
+    popularity.record('opens', '/ebooks/jane-austen/emma')
+    popularity.record('sections', '/ebooks/jane-austen/emma', 3)
+    popularity.abandoned('/ebooks/jane-austen/emma', {'index': 4, 'section': 1})
+
+    assert popularity.flush(force=True) == 1
+    assert popularity.flush(force=True) == 0
+
+    totals = popularity.aggregate(str(counts_dir))
+
+    assert totals == { '/ebooks/jane-austen/emma': { 'opens': 1, 'sections': 3, 'abandoned/4': 1 } }
+    assert sorted(os.listdir(str(counts_dir))) == ['aggregate.lock', 'totals.json']
+
+def test_counts_decay_by_half_life(counts_dir):
+    write_counts(counts_dir, 'a.jsonl',
+        (NOW, { '/ebooks/jane-austen/emma': { 'opens': 4 } }),
+        (NOW - 7 * DAY, { '/ebooks/jane-austen/emma': { 'opens': 4 } })
+    )
+    write_counts(counts_dir, 'b.jsonl', (NOW - 14 * DAY, { '/ebooks/jane-austen/persuasion': { 'searches': 8 } }))
+
+    totals = popularity.aggregate(str(counts_dir), now=NOW)
+
+    assert totals['/ebooks/jane-austen/emma']['opens'] == pytest.approx(6)
+    assert totals['/ebooks/jane-austen/persuasion']['searches'] == pytest.approx(2)
+
+    # the totals decay too when the next job runs
+    totals = popularity.aggregate(str(counts_dir), now=NOW + 7 * DAY)
+
+    assert totals['/ebooks/jane-austen/emma']['opens'] == pytest.approx(3)
+
+def test_hot_set_ranks_by_weighted_score():
+    totals = {
+        '/ebooks/a': { 'searches': 4 },
+        '/ebooks/b': { 'opens': 1, 'abandoned/2': 1.5 },
+        '/ebooks/c': { 'sections': 8 },
+        '/ebooks/d': { 'abandoned/0': 3 },
+        '/ebooks/e': { 'searches': 1 }
+    }
+
+    ranked = popularity.hot_set(totals, size=3)
+
+    # 5 for b, 4 for a and c, ties by title link, d has no score
+    assert [ book['titleLink'] for book in ranked ] == ['/ebooks/b', '/ebooks/a', '/ebooks/c']
+    assert ranked[0]['score'] == 5
+    assert ranked[0]['abandoned'] == { '2': 1.5 }
+    assert ranked[1]['counts'] == { 'searches': 4, 'opens': 0, 'sections': 0 }
+
+def test_hot_set_is_written_for_the_warm_up(counts_dir, tmp_path):
+    write_counts(counts_dir, 'a.jsonl', (int(time.time()), { '/ebooks/a': { 'searches': 1 }, '/ebooks/b': { 'opens': 1 } }))
+
+    path = str(tmp_path / 'hot.json')
+    popularity.update_hot_set(str(counts_dir), path)
+
+    assert popularity.hot_titles(path) == ['/ebooks/b', '/ebooks/a']
+    assert popularity.hot_titles(path, limit=1) == ['/ebooks/b']
+    assert popularity.hot_titles(str(tmp_path / 'missing.json')) == []
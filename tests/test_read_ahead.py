@@ -0,0 +1,124 @@
+import collections
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import pytest
+
+import utils
+from epub_parser import Epub
+from stand_in import fixture
+
+
+class SlowEpub:
+    """ Epub whose prefetch waits until released """
+
+    def __init__(self):
+        self.started = threading.Event()
+        self.released = threading.Event()
+        self.prefetched = []
+
+    def prefetch(self, file, section=0):
+        self.started.set()
+        self.released.wait(5)
+        self.prefetched.append((file, section))
+
+
+class CountingZip(zipfile.ZipFile):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.reads = []
+
+    def read(self, name, pwd=None):
+        self.reads.append(name)
+        return super().read(name, pwd)
+
+
+@pytest.fixture
+def read_ahead(monkeypatch):
+    """ A read ahead thread of its own, shut down after the test """
+
+    executor = ThreadPoolExecutor(max_workers=1)
+
+    monkeypatch.setattr(utils, 'READ_AHEAD', True)
+    monkeypatch.setattr(utils, '_read_ahead_executor', executor)
+    monkeypatch.setattr(utils, '_read_ahead_pending', collections.deque())
+
+    yield executor
+
+    executor.shutdown(wait=True)
+
+@pytest.fixture
+def slow_epub():
+    epub = SlowEpub()
+
+    yield epub
+
+    epub.released.set()
+
+def test_scheduling_never_waits_for_read_ahead(read_ahead, slow_epub):
+    start = time.perf_counter()
+
+    for section in range(20):
+        utils.schedule_read_ahead(slow_epub, 'chapter-1.xhtml', section)
+
+        assert len(utils._read_ahead_pending) <= utils.READ_AHEAD_MAX_PENDING
+
+    assert time.perf_counter() - start < 0.5
+    assert slow_epub.prefetched == []
+
+def test_queued_jobs_are_cancelled(read_ahead, slow_epub):
+    utils.schedule_read_ahead(slow_epub, 'chapter-1.xhtml', 0)
+    slow_epub.started.wait(5)
+
+    utils.schedule_read_ahead(slow_epub, 'chapter-1.xhtml', 1)
+    queued = utils._read_ahead_pending[-1]
+
+    utils.schedule_read_ahead(slow_epub, 'chapter-1.xhtml', 2)
+
+    assert queued.cancelled()
+
+    slow_epub.released.set()
+    wait(list(utils._read_ahead_pending), timeout=5)
+
+    # the running job finishes, the listener moved past the queued one
+    assert slow_epub.prefetched == [('chapter-1.xhtml', 0), ('chapter-1.xhtml', 2)]
+
+def test_at_most_max_pending_jobs(read_ahead, slow_epub, monkeypatch):
+    monkeypatch.setattr(utils, 'READ_AHEAD_MAX_PENDING', 1)
+
+    utils.schedule_read_ahead(slow_epub, 'chapter-1.xhtml', 0)
+    slow_epub.started.wait(5)
+
+    # the running job can't be cancelled, so there's no room for more
+    utils.schedule_read_ahead(slow_epub, 'chapter-1.xhtml', 1)
+
+    assert len(utils._read_ahead_pending) == 1
+
+    slow_epub.released.set()
+    wait(list(utils._read_ahead_pending), timeout=5)
+
+    assert slow_epub.prefetched == [('chapter-1.xhtml', 0)]
+
+def test_read_ahead_of_the_last_section_loads_the_next_chapter(read_ahead, tmp_path):
+    path = tmp_path / 'book.epub'
+    path.write_bytes(fixture('book.epub'))
+
+    epub_zip = CountingZip(str(path))
+    epub = Epub(epub_zip)
+
+    file = epub.get_file(1)
+    last = epub.section_count(file) - 1
+
+    utils.schedule_read_ahead(epub, file, last)
+    wait(list(utils._read_ahead_pending), timeout=5)
+
+    assert epub_zip.reads[-1] == epub.get_file(2)
+
+    reads = len(epub_zip.reads)
+    chapter = epub.next(file, last)
+
+    assert chapter['file'] == epub.get_file(2)
+    assert len(epub_zip.reads) == reads
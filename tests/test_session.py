@@ -0,0 +1,86 @@
+import pytest
+
+import session
+
+BOOK = {'title': 'Emma', 'titleLink': '/ebooks/jane-austen/emma', 'author': 'Jane Austen'}
+
+
+class FakeEpub:
+    """ Toc lookups of a book with two chapters """
+
+    FILES = ['chapter-1.xhtml', 'chapter-2.xhtml']
+
+    def get_file_index(self, file):
+        return self.FILES.index(file) if file in self.FILES else -1
+
+    def get_file(self, index):
+        return self.FILES[index]
+
+
+def round_trip(attributes):
+    return session.decode(session.encode(attributes))
+
+def test_not_started_round_trip():
+    assert round_trip({'state': 'NOT_STARTED'}) == {'state': 'NOT_STARTED'}
+
+def test_search_results_round_trip():
+    attributes = {'state': 'SEARCH_RESULTS', 'query': 'emma', 'book': {'titleLink': BOOK['titleLink']}}
+
+    compact = session.encode(attributes)
+
+    assert compact == {'v': session.SESSION_VERSION, 's': 1, 'q': 'emma', 'b': 'jane-austen/emma'}
+    assert session.decode(compact) == attributes
+
+def test_started_round_trip():
+    attributes = {
+        'state': 'STARTED',
+        'book': {'titleLink': BOOK['titleLink']},
+        'bookmark': session.bookmark('chapter-2.xhtml', 3, FakeEpub())
+    }
+
+    assert session.encode(attributes)['m'] == [1, 3]
+    assert round_trip(attributes) == attributes
+
+def test_only_the_title_link_of_a_book_is_kept():
+    decoded = round_trip({'state': 'STARTED', 'book': BOOK})
+
+    assert decoded['book'] == {'titleLink': BOOK['titleLink']}
+
+def test_legacy_session_decodes_as_is():
+    legacy = {
+        'state': 'STARTED',
+        'book': BOOK,
+        'search_results': [BOOK],
+        'bookmark': {'file': 'chapter-2.xhtml', 'section': 1}
+    }
+
+    assert session.decode(legacy) == legacy
+
+def test_legacy_file_bookmark_and_results_round_trip():
+    attributes = {
+        'state': 'SEARCH_RESULTS',
+        'search_results': [BOOK],
+        'bookmark': {'file': 'chapter-9.xhtml', 'section': 2}
+    }
+
+    decoded = round_trip(attributes)
+
+    assert decoded == attributes
+    assert session.bookmark_file(decoded['bookmark'], FakeEpub()) == 'chapter-9.xhtml'
+
+def test_encode_keeps_an_encoded_session():
+    compact = session.encode({'state': 'STARTED', 'book': BOOK})
+
+    assert session.encode(compact) == compact
+    assert session.encode(compact) is not compact
+
+def test_decode_rejects_unknown_versions():
+    with pytest.raises(ValueError):
+        session.decode({'v': session.SESSION_VERSION + 1, 's': 0})
+
+def test_replace_updates_the_dictionary_in_place():
+    attributes = {'v': 2, 's': 0}
+
+    session.replace(attributes, session.decode(attributes))
+
+    assert attributes == {'state': 'NOT_STARTED'}
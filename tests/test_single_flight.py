@@ -0,0 +1,116 @@
+import fcntl
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from single_flight import SingleFlight, SingleFlightTimeout
+
+
+def run_together(count, function):
+    """ Starts threads at the same time and waits for them
+
+    :return: list of results or exceptions, one per thread
+    """
+
+    barrier = threading.Barrier(count)
+    results = [None] * count
+
+    def run(position):
+        barrier.wait()
+
+        try:
+            results[position] = function()
+        except Exception as e:
+            results[position] = e
+
+    threads = [ threading.Thread(target=run, args=(position,)) for position in range(count) ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    return results
+
+def test_concurrent_callers_run_the_work_once(tmp_path):
+    flights = SingleFlight(str(tmp_path))
+    calls = []
+
+    def work():
+        calls.append(1)
+        time.sleep(0.2)
+        return 'epub'
+
+    results = run_together(8, lambda: flights.do('book.download', work))
+
+    assert results == ['epub'] * 8
+    assert len(calls) == 1
+    assert flights.stats()['leaders'] == 1
+    assert flights.stats()['shared'] == 7
+    assert flights.stats()['in_flight'] == 0
+
+def test_waiters_get_the_error_and_the_next_caller_starts_over(tmp_path):
+    flights = SingleFlight(str(tmp_path))
+    calls = []
+
+    def failing_work():
+        calls.append(1)
+        time.sleep(0.2)
+        raise OSError('download failed')
+
+    results = run_together(4, lambda: flights.do('book.download', failing_work))
+
+    assert all(isinstance(result, OSError) for result in results)
+    assert len(calls) == 1
+
+    assert flights.do('book.download', lambda: 'epub') == 'epub'
+
+def hold_lock(path, locked, seconds):
+    with open(path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        locked.set()
+        time.sleep(seconds)
+
+def test_timeout_while_another_process_holds_the_lock(tmp_path):
+    locked = multiprocessing.Event()
+    holder = multiprocessing.Process(target=hold_lock, args=(str(tmp_path / 'book.download.lock'), locked, 5))
+    holder.start()
+
+    try:
+        assert locked.wait(5)
+
+        with pytest.raises(SingleFlightTimeout):
+            SingleFlight(str(tmp_path)).do('book.download', lambda: 'epub', timeout=0.2)
+
+        assert holder.is_alive()
+    finally:
+        holder.kill()
+        holder.join()
+
+def test_next_process_takes_over_when_the_holder_dies(tmp_path):
+    locked = multiprocessing.Event()
+    holder = multiprocessing.Process(target=hold_lock, args=(str(tmp_path / 'book.download.lock'), locked, 30))
+    holder.start()
+
+    assert locked.wait(5)
+
+    flights = SingleFlight(str(tmp_path))
+    results = []
+
+    waiter = threading.Thread(target=lambda: results.append(flights.do('book.download', lambda: 'epub', timeout=10)))
+    waiter.start()
+
+    time.sleep(0.2)
+    assert results == []
+
+    # the leader dies partway, the kernel drops its lock
+    holder.kill()
+    holder.join()
+
+    waiter.join(5)
+
+    assert results == ['epub']
+    assert flights.stats()['waited'] == 1
@@ -0,0 +1,96 @@
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import tracing
+
+
+class Records(logging.Handler):
+    """ Json lines logged by the tracing logger """
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(json.loads(record.getMessage()))
+
+
+@pytest.fixture
+def records(monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACING', True)
+
+    handler = Records()
+    tracing.logger.addHandler(handler)
+
+    yield handler.records
+
+    tracing.logger.removeHandler(handler)
+    tracing._local.trace = None
+
+def test_trace_is_logged_as_embedded_metrics(records):
+    tracing.start('ReadIntent')
+
+    with tracing.span('download'):
+        pass
+
+    for _ in range(2):
+        with tracing.span('extract'):
+            pass
+
+    tracing.metric('download_bytes', 1024, 'Bytes')
+    tracing.finish()
+
+    record, = records
+    metrics = record['_aws']['CloudWatchMetrics'][0]
+
+    assert metrics['Namespace'] == tracing.TRACING_NAMESPACE
+    assert metrics['Dimensions'] == [['handler']]
+    assert [ metric['Name'] for metric in metrics['Metrics'] ] == ['download', 'extract', 'total', 'download_bytes']
+    assert record['handler'] == 'ReadIntent'
+    assert record['error'] is False
+    assert record['download_bytes'] == 1024
+    assert record['span_counts'] == {'extract': 2}
+    assert record['total'] >= record['extract']
+
+def test_failed_request_is_marked(records):
+    tracing.start('ReadIntent')
+    tracing.finish(error=True)
+
+    assert records[0]['error'] is True
+
+def test_unfinished_trace_is_logged_as_failed(records):
+    tracing.start('ReadIntent')
+    tracing.start('NextIntent')
+    tracing.finish()
+
+    assert [ (record['handler'], record['error']) for record in records ] == [('ReadIntent', True), ('NextIntent', False)]
+
+def test_spans_do_nothing_when_tracing_is_off(monkeypatch):
+    monkeypatch.setattr(tracing, 'TRACING', False)
+
+    tracing.start('ReadIntent')
+
+    assert tracing.current() is None
+    assert tracing.span('download') is tracing._NO_SPAN
+    assert tracing.finish() is None
+
+def test_wrap_carries_the_trace_to_an_executor_thread(records):
+    tracing.start('ReadIntent')
+
+    def read_ahead():
+        with tracing.span('read_ahead'):
+            return tracing.current()
+
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        traced = executor.submit(tracing.wrap(read_ahead)).result()
+        untraced = executor.submit(read_ahead).result()
+
+    assert traced is not None
+    assert untraced is None
+
+    tracing.finish()
+
+    assert 'read_ahead' in records[0]
@@ -0,0 +1,122 @@
+import pytest
+
+import catalog
+import popularity
+import warmup
+
+TITLE_LINK = '/ebooks/jane-austen/emma'
+
+
+class Context:
+    """ Lambda context whose time runs out after a number of checks """
+
+    def __init__(self, checks):
+        self.checks = checks
+
+    def get_remaining_time_in_millis(self):
+        self.checks -= 1
+
+        return warmup.WARMUP_MARGIN_MS + (1000 if self.checks >= 0 else 0)
+
+
+@pytest.fixture
+def no_catalog(monkeypatch):
+    monkeypatch.setattr(catalog, 'get_catalog', lambda: None)
+
+@pytest.mark.parametrize('event, expected', [
+    ({'warmup': True}, True),
+    ({'warmup': True, 'books': [TITLE_LINK], 'concurrency': 4}, True),
+    ({'source': 'aws.events', 'detail-type': 'Scheduled Event'}, True),
+    ({'warmup': False}, False),
+    ({'version': '1.0', 'session': {}, 'request': {'type': 'LaunchRequest'}}, False),
+    ({'warmup': True, 'request': {'type': 'IntentRequest'}}, False),
+    ([], False),
+    (None, False)
+])
+def test_is_warmup_event(event, expected):
+    assert warmup.is_warmup_event(event) is expected
+
+def test_warm_up_stops_when_the_time_is_spent(no_catalog, monkeypatch):
+    warmed = []
+
+    def warm_book(titleLink):
+        warmed.append(titleLink)
+        return { 'titleLink': titleLink }
+
+    monkeypatch.setattr(warmup, 'warm_book', warm_book)
+
+    books = [ '/ebooks/{}'.format(number) for number in range(5) ]
+    report = warmup.warm({ 'warmup': True, 'books': books }, Context(checks=2))
+
+    assert warmed == books[:2]
+    assert report['skipped'] == books[2:]
+    assert report['failed'] == []
+
+def test_failed_books_do_not_stop_the_warm_up(no_catalog, monkeypatch):
+    def warm_book(titleLink):
+        if titleLink == '/ebooks/missing':
+            raise OSError('not found')
+
+        return { 'titleLink': titleLink }
+
+    monkeypatch.setattr(warmup, 'warm_book', warm_book)
+
+    report = warmup.warm({ 'warmup': True, 'books': ['/ebooks/missing', TITLE_LINK] }, None)
+
+    assert report['loaded'] == [{ 'titleLink': TITLE_LINK }]
+    assert report['failed'] == [{ 'titleLink': '/ebooks/missing', 'error': 'not found' }]
+
+def test_warm_up_downloads_and_opens_the_book(container, no_catalog, stand_in):
+    report = warmup.warm({ 'warmup': True, 'books': [TITLE_LINK] }, None)
+
+    assert [ book['downloaded'] for book in report['loaded'] ] == [True]
+    assert '/downloads/book.epub' in stand_in.paths()
+
+    requests = len(stand_in.requests)
+
+    assert warmup.warm_book(TITLE_LINK)['downloaded'] is False
+    assert len(stand_in.requests) == requests
+
+@pytest.fixture
+def hot_sets(monkeypatch, tmp_path):
+    """ A packaged hot set and an empty shared directory of counts """
+
+    packaged = str(tmp_path / 'packaged.json')
+    popularity.update_hot_set(str(tmp_path / 'packaged'), packaged)
+
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+
+    monkeypatch.setattr(popularity, 'PACKAGED_HOT_SET_PATH', packaged)
+    monkeypatch.setattr(popularity, 'POPULARITY_DIR', str(shared))
+    monkeypatch.setattr(popularity, 'HOT_SET_PATH', str(shared / 'hot.json'))
+    monkeypatch.setattr(popularity, '_counts', {})
+    monkeypatch.setattr(warmup, 'WARMUP_BOOKS', [])
+
+    return packaged
+
+def write_hot_set(path, titles):
+    import atomic_file
+
+    atomic_file.write_json(path, { 'updated': 0, 'books': [ { 'titleLink': titleLink } for titleLink in titles ] })
+
+def test_fresh_container_warms_the_packaged_hot_set(hot_sets, monkeypatch):
+    write_hot_set(hot_sets, ['/ebooks/a', '/ebooks/b'])
+    monkeypatch.setattr(popularity, 'POPULARITY_SHARED', False)
+
+    # this container's own counts aren't ranked
+    popularity.record('opens', '/ebooks/local')
+
+    assert warmup._hot_books() == ['/ebooks/a', '/ebooks/b']
+    assert popularity.flush() == 0
+
+def test_shared_counts_rank_the_hot_set(hot_sets, monkeypatch):
+    write_hot_set(hot_sets, ['/ebooks/a'])
+    monkeypatch.setattr(popularity, 'POPULARITY_SHARED', True)
+
+    # without counts yet the packaged hot set is used
+    assert warmup._hot_books() == ['/ebooks/a']
+
+    popularity.record('opens', '/ebooks/shared')
+
+    assert warmup._hot_books() == ['/ebooks/shared']